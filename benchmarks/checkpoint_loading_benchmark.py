@@ -0,0 +1,114 @@
+import argparse
+import json
+import multiprocessing as mp
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+"""
+Cost of getting the network of a game process ready for a task, and the memory its weights take:
+
+    fresh: a new NNetWrapper and load_checkpoint, what every task of training/worker.py did before
+    unchanged: load_checkpoint of the checkpoint the network already holds (only the file is stat-ed)
+    swap: load_checkpoint of a changed checkpoint into the existing network (the weights are swapped in place)
+
+The anonymous (private) and file backed (shared with the other processes mapping the checkpoint, and the libraries
+first used by the forward pass) memory a network adds to a process is measured in separate processes, with the memory
+mapped load of load_checkpoint and with a plain torch.load copy:
+
+    python -m benchmarks.checkpoint_loading_benchmark --board-size 7 --repeats 20
+"""
+
+
+def smaps_mb(field):
+    # field of /proc/self/smaps_rollup in megabytes (Linux only)
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def loaded_memory(config, folder, filename, mmap):
+    """
+    Body of a measuring process, returns the anonymous and file backed memory the loaded network added.
+    """
+    game = GoGame(config["board_size"])
+    planes = np.asarray(game.getInitBoard().get_canonical_history())
+    anonymous, file_backed = smaps_mb("Anonymous"), smaps_mb("Rss") - smaps_mb("Anonymous")
+    network = NNetWrapper(game, config)
+    if mmap:
+        network.load_checkpoint(folder, filename)
+    else:
+        checkpoint = torch.load(f"{folder}/{filename}", map_location=network.device)
+        network.nnet.load_state_dict(checkpoint['state_dict'])
+        del checkpoint
+    # touches every weight, and builds the inference copy of the network (batch norms folded) every process has
+    network.predict(planes)
+    return {
+        "anonymous_mb": smaps_mb("Anonymous") - anonymous,
+        "file_backed_mb": smaps_mb("Rss") - smaps_mb("Anonymous") - file_backed,
+    }
+
+
+def seconds_per_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint loading and hot-swap of NNetWrapper")
+    parser.add_argument("--board-size", type=int, default=7)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=args.board_size)
+    game = GoGame(args.board_size)
+    folder = tempfile.mkdtemp()
+    torch.manual_seed(args.seed)
+    NNetWrapper(game, config).save_checkpoint(folder, 'first.pth.tar')
+    NNetWrapper(game, config).save_checkpoint(folder, 'second.pth.tar')
+
+    def fresh():
+        NNetWrapper(game, config).load_checkpoint(folder, 'first.pth.tar')
+
+    network = NNetWrapper(game, config)
+    network.load_checkpoint(folder, 'first.pth.tar')
+    filenames = iter(['second.pth.tar', 'first.pth.tar'] * args.repeats)
+    timings = {
+        "fresh_ms": seconds_per_call(fresh, args.repeats) * 1000,
+        "unchanged_ms": seconds_per_call(lambda: network.load_checkpoint(folder, 'first.pth.tar'), args.repeats) * 1000,
+        "swap_ms": seconds_per_call(lambda: network.load_checkpoint(folder, next(filenames)), args.repeats) * 1000,
+    }
+
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        mapped = pool.apply(loaded_memory, (config, folder, 'first.pth.tar', True))
+    with ctx.Pool(1) as pool:
+        copied = pool.apply(loaded_memory, (config, folder, 'first.pth.tar', False))
+    shutil.rmtree(folder)
+
+    print(json.dumps({
+        "commit": git_commit(),
+        "board_size": args.board_size,
+        "parameters_mb": sum(p.numel() * p.element_size() for p in network.nnet.parameters()) / 2 ** 20,
+        "timings": timings,
+        "memory": {"mmap": mapped, "copy": copied},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
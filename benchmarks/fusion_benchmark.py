@@ -0,0 +1,103 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+"""
+Checks that AlphaNet.fuse_for_inference (batch norms folded into the convolutions) gives the outputs of the network
+in eval mode, and compares their positions per second:
+
+    python -m benchmarks.fusion_benchmark --board-sizes 7 9 --batch-sizes 1 8 64
+
+The batch norms get random affine parameters and running statistics first, a freshly initialised network has
+identity batch norms and would hide mistakes in the folding. Exits with status 1 if an output differs by more than
+--tolerance.
+"""
+
+
+def randomise_batch_norms(module, rng):
+    for m in module.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.weight.data.copy_(torch.from_numpy(rng.uniform(0.5, 1.5, m.num_features)))
+            m.bias.data.copy_(torch.from_numpy(rng.uniform(-0.5, 0.5, m.num_features)))
+            m.running_mean.copy_(torch.from_numpy(rng.uniform(-0.5, 0.5, m.num_features)))
+            m.running_var.copy_(torch.from_numpy(rng.uniform(0.5, 2, m.num_features)))
+
+
+def positions_per_sec(module, boards, args):
+    with torch.inference_mode():
+        for _ in range(args.warmup):
+            module(boards)
+        repeats = max(args.min_repeats, args.positions // len(boards))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            module(boards)
+    return repeats * len(boards) / (time.perf_counter() - start)
+
+
+def benchmark_board_size(board_size, args):
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=board_size, network_type="RES")
+    torch.manual_seed(args.seed)
+    network = NNetWrapper(GoGame(board_size), config)
+    rng = np.random.RandomState(args.seed)
+    randomise_batch_norms(network.nnet, rng)
+
+    module = network.nnet.eval()
+    fused = network.inference_module()
+    result = {"board_size": board_size, "max_abs_diff_log_pi": 0.0, "max_abs_diff_v": 0.0, "positions_per_sec": {}}
+    for batch_size in args.batch_sizes:
+        boards = (rng.rand(batch_size, network.num_planes, board_size, board_size) > 0.5).astype(np.float32)
+        boards = torch.from_numpy(boards).to(network.device)
+        with torch.inference_mode():
+            log_pi, v = module(boards)
+            fused_log_pi, fused_v = fused(boards)
+        result["max_abs_diff_log_pi"] = max(result["max_abs_diff_log_pi"],
+                                            float((log_pi - fused_log_pi).abs().max()))
+        result["max_abs_diff_v"] = max(result["max_abs_diff_v"], float((v - fused_v).abs().max()))
+        result["positions_per_sec"][batch_size] = {
+            "batch_norm": positions_per_sec(module, boards, args),
+            "fused": positions_per_sec(fused, boards, args),
+        }
+    result["batch_norms_left"] = sum(isinstance(m, nn.BatchNorm2d) for m in fused.modules())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Equivalence and speed of the batch norm folded AlphaNet")
+    parser.add_argument("--board-sizes", type=int, nargs="+", default=[7])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--positions", type=int, default=1024, help="positions evaluated per batch size")
+    parser.add_argument("--min-repeats", type=int, default=10, help="minimum number of batches per batch size")
+    parser.add_argument("--warmup", type=int, default=3, help="batches run before timing")
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "torch_threads": torch.get_num_threads(),
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "tolerance": args.tolerance,
+        "results": [benchmark_board_size(board_size, args) for board_size in args.board_sizes],
+    }
+    print(json.dumps(results, indent=2))
+
+    if any(max(r["max_abs_diff_log_pi"], r["max_abs_diff_v"]) > args.tolerance or r["batch_norms_left"]
+           for r in results["results"]):
+        print("Fused network does not match the network in eval mode", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.go_alphanet import HEADS
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+"""
+Size and speed of the heads of AlphaNet (network_head in config.yaml):
+
+    fc: average pool and linear policy and value layers over the flattened board, sized for 7x7 (the network does not
+        run on other board sizes)
+    pool: fully convolutional policy and global pooling value heads (KataGo style), the same weights on every board size
+
+For every head and board size the network can be built for, reports the parameters of the whole network and of its
+heads, and the positions per second of predict_batch:
+
+    python -m benchmarks.head_benchmark --board-sizes 7 9 --batch-sizes 1 8 64
+
+The pool head weights of the first board size are then loaded into the networks of the other board sizes, which must
+evaluate positions with them.
+"""
+
+
+def head_parameters(nnet):
+    # everything after layer4
+    names = ("fc_p", "fc_v") if nnet.head == "fc" else ("policy_head", "value_head")
+    return sum(p.numel() for name in names for p in getattr(nnet, name).parameters())
+
+
+def positions_per_sec(network, boards, args):
+    result = {}
+    for batch_size in args.batch_sizes:
+        batch = boards[:batch_size]
+        for _ in range(args.warmup):
+            network.predict_batch(batch)
+        repeats = max(args.min_repeats, args.positions // len(batch))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            network.predict_batch(batch)
+        result[batch_size] = repeats * len(batch) / (time.perf_counter() - start)
+    return result
+
+
+def make_network(head, board_size, args):
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=board_size, network_type="RES", network_head=head, inference_backend="eager",
+                         inference_quantization="none")
+    torch.manual_seed(args.seed)
+    return NNetWrapper(GoGame(board_size), config)
+
+
+def benchmark(head, board_size, args):
+    network = make_network(head, board_size, args)
+    rng = np.random.RandomState(args.seed)
+    boards = (rng.rand(max(args.batch_sizes), network.num_planes, board_size, board_size) > 0.5).astype(np.float32)
+    result = {"head": head, "board_size": board_size}
+    try:
+        network.predict_batch(boards[:1])
+    except RuntimeError as e:
+        # the fc head only fits the board size its linear layers were sized for
+        result["error"] = str(e).splitlines()[0]
+        return result
+    result.update({
+        "parameters": sum(p.numel() for p in network.nnet.parameters()),
+        "head_parameters": head_parameters(network.nnet),
+        "positions_per_sec": positions_per_sec(network, boards, args),
+    })
+    return result
+
+
+def shared_weights(args):
+    """
+    Loads the pool head network of the first board size into those of the other board sizes, returns the shape of
+    their policies.
+    """
+    source = make_network("pool", args.board_sizes[0], args)
+    result = {}
+    for board_size in args.board_sizes[1:]:
+        network = make_network("pool", board_size, args)
+        network.nnet.load_state_dict(source.nnet.state_dict())
+        pis, vs = network.predict_batch(np.zeros((1, network.num_planes, board_size, board_size), dtype=np.float32))
+        result[board_size] = {"policy_size": pis.shape[1], "action_size": network.action_size}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameters and positions per second of the AlphaNet heads")
+    parser.add_argument("--heads", nargs="+", choices=HEADS, default=list(HEADS))
+    parser.add_argument("--board-sizes", type=int, nargs="+", default=[7, 9])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--positions", type=int, default=1024, help="positions evaluated per batch size")
+    parser.add_argument("--min-repeats", type=int, default=10, help="minimum number of batches per batch size")
+    parser.add_argument("--warmup", type=int, default=3, help="batches run before timing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "commit": git_commit(),
+        "torch_threads": torch.get_num_threads(),
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "results": [benchmark(head, board_size, args) for head in args.heads for board_size in args.board_sizes],
+        "pool_weights_of_board_size": args.board_sizes[0],
+        "pool_weights_on": shared_weights(args),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.inference_backends import BACKENDS
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+"""
+Positions per second of NNetWrapper.predict_batch with every inference backend (see
+neural_network/inference_backends.py), inference dtype and batch size, for a randomly initialised network:
+
+    python -m benchmarks.inference_backends_benchmark --dtypes float32 bfloat16 --batch-sizes 1 8 64 256
+
+Backends that cannot be built here (onnx without onnxruntime) are reported with the error instead, a dtype the CPU
+does not support is reported as falling back to float32.
+"""
+
+
+def benchmark_backend(backend, dtype, args):
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=args.board_size, network_type=args.network, inference_backend=backend,
+                         inference_dtype=dtype)
+    game = GoGame(args.board_size)
+    torch.manual_seed(args.seed)
+    try:
+        # a backend whose optional dependencies are missing is rejected when the network is created
+        network = NNetWrapper(game, config)
+        network.inference_backend()
+    except ImportError as e:
+        return {"backend": backend, "dtype": dtype, "error": str(e)}
+
+    rng = np.random.RandomState(args.seed)
+    result = {"backend": backend, "dtype": dtype, "autocast": str(network.backend_dtype),
+              "positions_per_sec": {}}
+    for batch_size in args.batch_sizes:
+        boards = (rng.rand(batch_size, network.num_planes, args.board_size, args.board_size) > 0.5).astype(np.float32)
+        for _ in range(args.warmup):
+            network.predict_batch(boards)
+        # repeat the batch until enough positions were evaluated for a stable measurement
+        repeats = max(args.min_repeats, args.positions // batch_size)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            network.predict_batch(boards)
+        result["positions_per_sec"][batch_size] = repeats * batch_size / (time.perf_counter() - start)
+
+    # largest difference to the eager float32 module on the same boards
+    network.backend = None
+    network.config.config.update(inference_backend="eager", inference_dtype="float32")
+    eager_pis, eager_vs = network.predict_batch(boards)
+    network.backend = None
+    network.config.config.update(inference_backend=backend, inference_dtype=dtype)
+    pis, vs = network.predict_batch(boards)
+    result["max_abs_diff_pi"] = float(np.max(np.abs(pis - eager_pis)))
+    result["max_abs_diff_v"] = float(np.max(np.abs(vs - eager_vs)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the inference backends of NNetWrapper")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--dtypes", nargs="+", choices=["float32", "bfloat16"], default=["float32"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 256])
+    parser.add_argument("--network", choices=["RES", "CNN"], default="RES")
+    parser.add_argument("--board-size", type=int, default=7)
+    parser.add_argument("--positions", type=int, default=2048, help="positions evaluated per batch size")
+    parser.add_argument("--min-repeats", type=int, default=10, help="minimum number of batches per batch size")
+    parser.add_argument("--warmup", type=int, default=3, help="batches run before timing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "network": args.network,
+        "board_size": args.board_size,
+        "torch_threads": torch.get_num_threads(),
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "results": [benchmark_backend(backend, dtype, args) for backend in args.backends for dtype in args.dtypes],
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.inference_server import InferenceServer, InferenceClient
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+"""
+Throughput and memory of the game processes of a worker pool evaluating positions with their own copy of the network
+("local", what training/worker.py does without use_inference_server) and through one InferenceServer ("server").
+
+Every game process evaluates --positions random positions one at a time, like MCTS does for its leaves:
+
+    python -m benchmarks.inference_server_benchmark --processes 12 --positions 200
+"""
+
+
+def evaluate_positions(mode, config, folder, filename, client_args, num_positions, seed):
+    """
+    Body of a game process, returns the monotonic times its evaluations started and ended and the resident memory
+    in megabytes that its evaluator added to the process (torch is imported by every process of the pool anyway).
+    """
+    resident_before = resident_mb()
+    game = GoGame(config["board_size"])
+    if mode == "server":
+        evaluator = InferenceClient(*client_args)
+    else:
+        # torch_threads of config.yaml, "auto" shares the cores between the processes of the pool
+        network = NNetWrapper(game, config)
+        network.load_checkpoint(folder, filename)
+        evaluator = network
+
+    rng = np.random.RandomState(seed)
+    num_planes = len(game.getInitBoard().get_canonical_history())
+    positions = (rng.rand(num_positions, num_planes, game.n, game.n) > 0.5).astype(np.float32)
+
+    start = time.monotonic()
+    for planes in positions:
+        if mode == "server":
+            evaluator.evaluate(planes)
+        else:
+            evaluator.predict(planes)
+    return start, time.monotonic(), resident_mb() - resident_before
+
+
+def resident_mb():
+    # second field of /proc/self/statm, in pages (Linux only)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def run(mode, config, folder, filename, args):
+    server = InferenceServer(config, folder, filename) if mode == "server" else None
+    client_args = server.client_args() if server is not None else None
+
+    with mp.Pool(args.processes) as pool:
+        results = pool.starmap(evaluate_positions, [(mode, config, folder, filename, client_args, args.positions, seed)
+                                                    for seed in range(args.processes)])
+    if server is not None:
+        server.close()
+
+    # from the first process starting its evaluations to the last one finishing them, process start up excluded
+    seconds = max(end for _, end, _ in results) - min(start for start, _, _ in results)
+    return {
+        "mode": mode,
+        "processes": args.processes,
+        "positions_per_sec": args.processes * args.positions / seconds,
+        # the server process is not included, it holds the one remaining copy of the network
+        "evaluator_memory_mb": float(np.sum([memory for _, _, memory in results])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per process networks against a shared inference server")
+    parser.add_argument("--processes", type=int, default=12, help="game processes of the pool")
+    parser.add_argument("--positions", type=int, default=200, help="positions evaluated by every game process")
+    parser.add_argument("--board-size", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = ConfigHandler(CONFIG_PATH)
+    # num_parallel_games decides the threads of torch_threads "auto"
+    config.config.update(board_size=args.board_size, num_parallel_games=args.processes)
+    folder = tempfile.mkdtemp()
+    torch.manual_seed(args.seed)
+    NNetWrapper(GoGame(args.board_size), config).save_checkpoint(folder, 'benchmark.pth.tar')
+
+    results = {
+        "commit": git_commit(),
+        "max_batch": config["inference_server_max_batch"],
+        "wait_ms": config["inference_server_wait_ms"],
+        "results": [run(mode, config, folder, 'benchmark.pth.tar', args) for mode in ("local", "server")],
+    }
+    shutil.rmtree(folder)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    # same start method as start_worker.py
+    mp.set_start_method('spawn')
+    main()
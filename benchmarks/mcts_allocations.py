@@ -0,0 +1,88 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.mcts_benchmark import POSITIONS_PATH, git_commit, replay
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from mcts import MCTS
+from search.evaluators import UniformEvaluator
+from utils.config_handler import ConfigHandler
+
+"""
+Memory allocated by single MCTS simulations, measured with tracemalloc.
+
+Every stored position of benchmarks/positions.json is searched one simulation at a time with the uniform stub
+evaluator, so only the allocations of the search itself are measured. For every simulation the peak of the memory
+traced by tracemalloc above what was allocated before it is recorded, and the number of memory blocks the search
+tree keeps alive afterwards:
+
+    python -m benchmarks.mcts_allocations --board-sizes 7 9 --sims 200
+"""
+
+
+def benchmark_board_size(board_size, positions, args):
+    config = ConfigHandler(CONFIG_PATH)
+    # measure the search alone: no evaluation cache, no early stopping, sequential search, PUCT root
+    config.config.update(board_size=board_size, use_evaluation_cache=False, early_stop_search=False,
+                         num_search_threads=1, root_search="puct", profile_search=False)
+
+    game = GoGame(board_size, is_arena_game=not args.self_play)
+    mcts = MCTS(game, UniformEvaluator(game.getActionSize()), is_self_play=args.self_play, config=config)
+
+    peaks = []
+    retained = []
+    seconds = 0
+    for actions in positions:
+        search_args = replay(game, actions)
+        np.random.seed(args.seed)
+        mcts.clear()
+        for _ in range(args.sims):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            mcts.run_simulations(*search_args, 1)
+            seconds += time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+
+    return {
+        "board_size": board_size,
+        "self_play": args.self_play,
+        "simulations": len(peaks),
+        # tracemalloc slows the search down, only compare these times with each other
+        "traced_sims_per_sec": len(peaks) / seconds,
+        "peak_kb_per_sim_mean": float(np.mean(peaks)) / 1024,
+        "peak_kb_per_sim_p99": float(np.percentile(peaks, 99)) / 1024,
+        "retained_kb_per_sim_mean": float(np.mean(retained)) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory allocated by single MCTS simulations")
+    parser.add_argument("--board-sizes", type=int, nargs="+", default=[7, 9])
+    parser.add_argument("--sims", type=int, default=200, help="simulations per stored position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--self-play", action="store_true", help="benchmark the self play search (history input, noise)")
+    args = parser.parse_args()
+
+    with open(POSITIONS_PATH) as f:
+        positions = json.load(f)
+
+    tracemalloc.start()
+    results = {
+        "commit": git_commit(),
+        "results": [benchmark_board_size(size, positions[str(size)], args) for size in args.board_sizes],
+    }
+    tracemalloc.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10000)
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from definitions import CONFIG_PATH, ROOT_DIR
+from go.go_game import GoGame
+from mcts import MCTS
+from search.evaluators import UniformEvaluator
+from utils.config_handler import ConfigHandler
+
+"""
+Reproducible throughput benchmark of MCTS.getActionProb.
+
+Every stored position of benchmarks/positions.json is searched from an empty tree with fixed seeds (numpy for the
+Dirichlet noise and the symmetry drawn by MCTS.predict, torch for the network weights), and the results are printed
+as JSON so that runs of different commits can be compared:
+
+    python -m benchmarks.mcts_benchmark --board-sizes 7 9 --sims 200 --output bench.json
+"""
+
+POSITIONS_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'positions.json')
+
+# number of moves played from the empty board to create the stored positions of each board size
+POSITION_LENGTHS = {7: [0, 6, 14, 24, 34], 9: [0, 10, 24, 40, 60]}
+
+
+def generate_positions(board_size, lengths, seed):
+    """
+    Returns, for every length, the actions of a random game of that many (non pass) moves.
+    """
+    rng = np.random.RandomState(seed)
+    game = GoGame(board_size)
+    positions = []
+    for length in lengths:
+        board = game.getInitBoard()
+        actions = []
+        while len(actions) < length:
+            valids = game.getValidMoves(board)[:-1]
+            if np.sum(valids) == 0:
+                break
+            action = int(rng.choice(np.flatnonzero(valids)))
+            board = game.getNextState(board, action)
+            actions.append(action)
+        positions.append(actions)
+    return positions
+
+
+def replay(game, actions):
+    """
+    Plays actions from the empty board and returns the arguments of MCTS.getActionProb for the final position.
+    """
+    board = game.getInitBoard()
+    for action in actions:
+        board = game.getNextState(board, action)
+    return board, game.getCanonicalForm(board, board.current_player)
+
+
+def create_network(game, config, network_type):
+    """
+    Returns the network to benchmark with and its name. "auto" uses a randomly initialised AlphaNet when it supports
+    the board size and falls back to the uniform stub otherwise.
+    """
+    if network_type in ("auto", "alphanet"):
+        from neural_network.neural_net_wrapper import NNetWrapper
+        try:
+            network = NNetWrapper(game, config)
+            network.predict(game.getInitBoard().get_canonical_history())
+            return network, "alphanet"
+        except RuntimeError:
+            if network_type == "alphanet":
+                raise
+    return UniformEvaluator(game.getActionSize()), "uniform"
+
+
+def benchmark_board_size(board_size, positions, args):
+    config = ConfigHandler(CONFIG_PATH)
+    # measure the search alone: no evaluation cache, no early stopping, sequential search, PUCT root
+    config.config.update(board_size=board_size, use_evaluation_cache=False, early_stop_search=False,
+                         num_search_threads=1, root_search="puct", profile_search=False)
+
+    torch.manual_seed(args.seed)
+    game = GoGame(board_size, is_arena_game=not args.self_play)
+    network, network_name = create_network(game, config, args.network)
+    mcts = MCTS(game, network, is_self_play=args.self_play, config=config)
+
+    latencies = []
+    nodes = 0
+    for actions in positions:
+        search_args = replay(game, actions)
+        for repeat in range(args.repeats):
+            np.random.seed(args.seed + repeat)
+            random.seed(args.seed + repeat)
+            mcts.clear()
+            start = time.perf_counter()
+            mcts.getActionProb(*search_args, args.sims, temp=1)
+            latencies.append(time.perf_counter() - start)
+            nodes += len(mcts.table)
+
+    total_time = sum(latencies)
+    searches = len(latencies)
+    return {
+        "board_size": board_size,
+        "network": network_name,
+        "self_play": args.self_play,
+        "positions": len(positions),
+        "searches": searches,
+        "sims_per_move": args.sims,
+        "sims_per_sec": searches * args.sims / total_time,
+        "nodes_per_sec": nodes / total_time,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        # maximum resident set size of the process so far, in megabytes (ru_maxrss is in kilobytes on Linux)
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible MCTS throughput benchmark")
+    parser.add_argument("--board-sizes", type=int, nargs="+", default=[7, 9])
+    parser.add_argument("--sims", type=int, default=200, help="simulations per search")
+    parser.add_argument("--repeats", type=int, default=3, help="searches per stored position")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--network", choices=["auto", "alphanet", "uniform"], default="auto")
+    parser.add_argument("--self-play", action="store_true", help="benchmark the self play search (history input, noise)")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--write-positions", action="store_true", help="regenerate benchmarks/positions.json and exit")
+    args = parser.parse_args()
+
+    if args.write_positions:
+        positions = {str(size): generate_positions(size, lengths, seed=size)
+                     for size, lengths in POSITION_LENGTHS.items()}
+        with open(POSITIONS_PATH, 'w') as f:
+            # one position per line
+            f.write("{\n" + ",\n".join(f'"{size}": [\n' + ",\n".join(json.dumps(actions) for actions in games) + "\n]"
+                                       for size, games in positions.items()) + "\n}\n")
+        return
+
+    with open(POSITIONS_PATH) as f:
+        positions = json.load(f)
+
+    results = {
+        "commit": git_commit(),
+        "torch_threads": torch.get_num_threads(),
+        "results": [benchmark_board_size(size, positions[str(size)], args) for size in args.board_sizes],
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10000)
+    main()
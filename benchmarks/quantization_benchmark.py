@@ -0,0 +1,142 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import git_commit
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.go_alphanet import HEADS
+from neural_network.neural_net_wrapper import NNetWrapper
+from neural_network.quantization import QUANTIZATION_MODES
+from utils.config_handler import ConfigHandler
+from utils.data_serializer import load_obj_from_disk
+
+"""
+Report of the int8 quantized inference of NNetWrapper (see neural_network/quantization.py): positions per second of
+predict_batch with every inference_quantization mode, and how well the quantized network agrees with the float32
+network on held-out positions (same best move, value and policy differences):
+
+    python -m benchmarks.quantization_benchmark --folder logs/checkpoints --filename best.pth.tar \
+        --examples logs/train_examples/checkpoint_1.pth.tar.examples
+
+The positions of the train examples file are split into the calibration set of static quantization and the held-out
+set. Without --examples both come from random games, without --folder the network is randomly initialised.
+"""
+
+
+def load_positions(args, game):
+    """
+    Returns the calibration and the held-out positions as float32 arrays of shape (positions, planes, n, n).
+    """
+    count = args.calibration_positions + args.held_out_positions
+    rng = np.random.RandomState(args.seed)
+    if args.examples is not None:
+        # train examples are (board history, pi, v), see TrainExampleManager
+        examples = list(load_obj_from_disk(args.examples))
+        positions = [np.stack(examples[i][0]) for i in rng.permutation(len(examples))[:count]]
+    else:
+        positions = []
+        while len(positions) < count:
+            board = game.getInitBoard()
+            # positions of random games, one every few moves so they do not share most of their stones
+            for move in range(2 * game.n * game.n):
+                valids = game.getValidMoves(board)[:-1]
+                if np.sum(valids) == 0:
+                    break
+                board = game.getNextState(board, int(rng.choice(np.flatnonzero(valids))))
+                if move % 3 == 0:
+                    positions.append(np.asarray(board.get_canonical_history()))
+        positions = positions[:count]
+    positions = np.asarray(positions, dtype=np.float32)
+    if len(positions) <= args.calibration_positions:
+        raise ValueError(f"{len(positions)} positions are not enough for {args.calibration_positions} calibration "
+                         f"positions and a held-out set")
+    return positions[:args.calibration_positions], positions[args.calibration_positions:]
+
+
+def positions_per_sec(network, boards, args):
+    result = {}
+    for batch_size in args.batch_sizes:
+        batch = boards[:batch_size]
+        for _ in range(args.warmup):
+            network.predict_batch(batch)
+        repeats = max(args.min_repeats, args.positions // len(batch))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            network.predict_batch(batch)
+        result[batch_size] = repeats * len(batch) / (time.perf_counter() - start)
+    return result
+
+
+def agreement(pis, vs, reference_pis, reference_vs):
+    # KL divergence of the quantized policies from the float32 ones, clipped against log(0)
+    kl = np.sum(reference_pis * (np.log(np.maximum(reference_pis, 1e-12)) - np.log(np.maximum(pis, 1e-12))), axis=1)
+    return {
+        "top1_agreement": float(np.mean(np.argmax(pis, axis=1) == np.argmax(reference_pis, axis=1))),
+        "policy_kl_mean": float(np.mean(kl)),
+        "policy_max_abs_diff": float(np.max(np.abs(pis - reference_pis))),
+        "value_mean_abs_diff": float(np.mean(np.abs(vs - reference_vs))),
+        "value_max_abs_diff": float(np.max(np.abs(vs - reference_vs))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and accuracy of the int8 quantized network")
+    parser.add_argument("--modes", nargs="+", choices=QUANTIZATION_MODES, default=list(QUANTIZATION_MODES))
+    parser.add_argument("--folder", help="folder of the checkpoint to quantize")
+    parser.add_argument("--filename", default="best.pth.tar")
+    parser.add_argument("--examples", help="train examples file to draw the positions from")
+    parser.add_argument("--board-size", type=int, default=7)
+    parser.add_argument("--head", choices=HEADS, default="fc", help="network_head of the network")
+    parser.add_argument("--calibration-positions", type=int, default=512)
+    parser.add_argument("--held-out-positions", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--positions", type=int, default=1024, help="positions evaluated per batch size")
+    parser.add_argument("--min-repeats", type=int, default=10, help="minimum number of batches per batch size")
+    parser.add_argument("--warmup", type=int, default=3, help="batches run before timing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=args.board_size, network_head=args.head, inference_backend="eager")
+    game = GoGame(args.board_size)
+    torch.manual_seed(args.seed)
+    network = NNetWrapper(game, config)
+    if args.folder is not None:
+        network.load_checkpoint(args.folder, args.filename)
+    network.calibration_boards, held_out = load_positions(args, game)
+
+    reports = []
+    reference = None
+    for mode in args.modes:
+        network.config.config.update(inference_quantization=mode)
+        network.backend = None
+        pis, vs = network.predict_batch(held_out)
+        if reference is None:
+            # the first mode is the reference, "none" unless --modes says otherwise
+            reference = (mode, pis, vs)
+        report = {"mode": mode, "positions_per_sec": positions_per_sec(network, held_out, args)}
+        report.update(agreement(pis, vs, reference[1], reference[2]))
+        reports.append(report)
+
+    results = {
+        "commit": git_commit(),
+        "board_size": args.board_size,
+        "network_head": args.head,
+        "checkpoint": None if args.folder is None else f"{args.folder}/{args.filename}",
+        "positions_from": args.examples or "random games",
+        "calibration_positions": len(network.calibration_boards),
+        "held_out_positions": len(held_out),
+        "reference_mode": reference[0],
+        "quantized_engine": torch.backends.quantized.engine,
+        "torch_threads": torch.get_num_threads(),
+        "results": reports,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.mcts_benchmark import POSITIONS_PATH, git_commit, replay
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from mcts import MCTS
+from neural_network.neural_net_wrapper import NNetWrapper
+from neural_network.torch_threads import auto_threads, available_cores
+from utils.config_handler import ConfigHandler
+
+"""
+Sweep of the split of the cores between game processes and torch threads (see neural_network/torch_threads.py).
+
+For every number of processes and torch_threads value, a pool of that many processes runs self play searches with
+their own network, like training/worker.py without use_inference_server, and the simulations per second of the whole
+pool are reported:
+
+    python -m benchmarks.threads_benchmark --processes 1 2 4 8 --threads 1 2 4 auto --sims 100
+
+The fastest split is printed last, set num_parallel_games and torch_threads in config.yaml accordingly.
+"""
+
+
+def search_positions(config, positions, sims, seed):
+    """
+    Body of a game process, returns the monotonic times its searches started and ended and its torch threads.
+    """
+    game = GoGame(config["board_size"])
+    # the network configures the threads of the process, as in a worker pool
+    network = NNetWrapper(game, config)
+    mcts = MCTS(game, network, is_self_play=True, config=config)
+    np.random.seed(seed)
+
+    start = time.monotonic()
+    for actions in positions:
+        mcts.clear()
+        mcts.getActionProb(*replay(game, actions), sims, temp=1)
+    return start, time.monotonic(), torch.get_num_threads()
+
+
+def run(processes, threads, positions, args):
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(board_size=args.board_size, num_parallel_games=processes, torch_threads=threads,
+                         use_evaluation_cache=False, early_stop_search=False, profile_search=False)
+
+    with mp.Pool(processes) as pool:
+        results = pool.starmap(search_positions, [(config, positions, args.sims, seed) for seed in range(processes)])
+
+    # from the first process starting its searches to the last one finishing them, process start up excluded
+    seconds = max(end for _, end, _ in results) - min(start for start, _, _ in results)
+    return {
+        "processes": processes,
+        "torch_threads": threads,
+        "threads_per_process": results[0][2],
+        "sims_per_sec": processes * len(positions) * args.sims / seconds,
+    }
+
+
+def main():
+    cores = available_cores()
+    parser = argparse.ArgumentParser(description="Sweep of game processes against torch threads per process")
+    parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, max(1, cores // 2), cores}))
+    parser.add_argument("--threads", nargs="+", default=["1", "2", "auto"], help="torch_threads values, or auto")
+    parser.add_argument("--board-size", type=int, default=7)
+    parser.add_argument("--sims", type=int, default=100, help="simulations per search")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(POSITIONS_PATH) as f:
+        positions = json.load(f)[str(args.board_size)]
+
+    results = []
+    for processes in args.processes:
+        for threads in args.threads:
+            if threads != "auto":
+                threads = int(threads)
+            results.append(run(processes, threads, positions, args))
+
+    config = ConfigHandler(CONFIG_PATH)
+    best = max(results, key=lambda result: result["sims_per_sec"])
+    print(json.dumps({
+        "commit": git_commit(),
+        "cores": cores,
+        "board_size": args.board_size,
+        "results": results,
+        "best": best,
+        "auto_threads_of_best": auto_threads(dict(config.config, num_parallel_games=best["processes"]), "game"),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    # same start method as start_worker.py
+    mp.set_start_method('spawn')
+    main()
@@ -1,3 +1,5 @@
+import os
+
 from fabric.connection import Connection
 
 from definitions import SENS_CONFIG_PATH, CHECKPOINT_PATH, DIS_STATUS_PATH
@@ -34,7 +36,7 @@ class SSHConnector:
     def download_best_model(self):
         with Connection(self.main_server_address, self.main_username) as c:
             try:
-                c.get(self.main_path + "logs/checkpoints/best.pth.tar", CHECKPOINT_PATH + "/")
+                self.download_checkpoint(c, "best.pth.tar")
                 return True
             except FileNotFoundError:
                 print(f"No best.pth.tar found at {self.main_path + 'logs/checkpoints/best.pth.tar'}")
@@ -44,13 +46,20 @@ class SSHConnector:
     def download_arena_models(self):
         with Connection(self.main_server_address, self.main_username) as c:
             try:
-                c.get(self.main_path + "logs/checkpoints/previous_net.pth.tar", CHECKPOINT_PATH + "/")
-                c.get(self.main_path + "logs/checkpoints/current_net.pth.tar", CHECKPOINT_PATH + "/")
+                self.download_checkpoint(c, "previous_net.pth.tar")
+                self.download_checkpoint(c, "current_net.pth.tar")
                 return True
             except FileNotFoundError:
                 print(f"No previous_net.pth.tar found at {self.main_path + 'logs/checkpoints/previous_net.pth.tar'}")
                 return False
 
+    def download_checkpoint(self, c, file_name):
+        # downloaded next to the checkpoint and renamed over it, the processes of the worker pool may have the previous
+        # file memory mapped (see NNetWrapper.load_checkpoint) and must not see it truncated
+        local_path = os.path.join(CHECKPOINT_PATH, file_name)
+        c.get(self.main_path + "logs/checkpoints/" + file_name, local_path + ".tmp")
+        os.replace(local_path + ".tmp", local_path)
+
     # needed for worker flow
     def download_status(self):
         with Connection(self.main_server_address, self.main_username) as c:
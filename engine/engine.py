@@ -1,17 +1,31 @@
 import os
 import sys
+import threading
+import time
 
 import numpy as np
 
 from definitions import ROOT_DIR
+from go.feature_encoder import FeatureEncoder
 from go.go_game import GoGame, display
-from mcts import MCTS
 from neural_network.neural_net_wrapper import NNetWrapper
+from search.parallel_mcts import create_mcts
+from search.time_manager import TimeManager
 from utils.config_handler import ConfigHandler
 
 MODEL = "Model Y"
 VERSION = "2.0"
 PROTOCOL_VERSION = "1.0"
+# simulations the ponder thread runs between two checks of its stop signal
+PONDER_BATCH_SIMS = 8
+# largest board the pool heads are played on: bigger boards get a deeper trunk (see AlphaNetMaker), which the
+# checkpoint does not fit
+MAX_BOARD_SIZE = 11
+# GTP column letters, I is skipped
+GTP_COLUMNS = 'ABCDEFGHJKLMNOPQRST'
+# GTP commands handled by run_command, GTP controllers only send clock information if time_settings is listed
+COMMANDS = ['protocol_version', 'name', 'version', 'list_commands', 'boardsize', 'clear_board', 'showboard', 'loadsgf',
+            'play', 'genmove', 'time_settings', 'time_left', 'getscore', 'quit']
 
 '''
 Based on ROOT_DIR pathing, the command: python run_engine.py
@@ -27,35 +41,19 @@ class Engine:
         else:
             self.config = ConfigHandler(f"{ROOT_DIR}/engine/engine_config.yaml")
 
-        self.board_size = self.config['board_size']
-        self.go_game = GoGame(self.board_size, is_arena_game=True)
-        self.board = self.go_game.getInitBoard()
-        self.x_boards, self.y_boards = self.go_game.init_x_y_boards()
-        self.c_boards = [np.ones((7, 7)), np.zeros((7, 7))]
-        self._set_player_board()
-        self.canonicalBoard = self.go_game.getCanonicalForm(self.board, self.board.current_player)
-        self.canonicalHistory = self.go_game.getCanonicalHistory(self.x_boards, self.y_boards, self.canonicalBoard,
-                                                                 self.player_board)
-        self.neural_net = NNetWrapper(self.go_game, self.config)
-
-        if is_frozen_state():
-            self.neural_net.load_checkpoint(f"{sys._MEIPASS}", 'best.pth.tar')
-        else:
-            self.neural_net.load_checkpoint(f"{ROOT_DIR}/engine/", 'best.pth.tar')
-
-        self.mcts = MCTS(game=self.go_game, nnet=self.neural_net, is_self_play=False, config=self.config)
-
-    # set the player_board tuple based on the current player
-    def _set_player_board(self, player=None):
-        if player is None:
-            current_player = self.board.current_player
-        else:
-            current_player = player
-        self.player_board = (self.c_boards[0], self.c_boards[1]) if current_player == 1 else (
-            self.c_boards[1], self.c_boards[0])
+        self.mcts = None
+        self._create_game(self.config['board_size'])
+        # clocks of both players, the search is only limited by time after a time_settings command
+        self.time_manager = TimeManager(self.board_size, self.config["time_safety_margin"])
+        # background search on the opponent's time, see start_pondering
+        self.ponder_thread = None
+        self.stop_ponder = threading.Event()
 
     # run the command passed to the engine
     def run_command(self, command):
+        # every command may change the board the ponder thread is searching
+        self.stop_pondering()
+
         if 'name' in command:
             print(f"= {self.name()}\n")
         elif 'protocol_version' in command:
@@ -63,10 +61,9 @@ class Engine:
         elif 'version' in command:
             print(f'= {VERSION}\n')
         elif 'list_commands' in command:
-            print('= protocol_version\n')
+            print('= ' + '\n'.join(COMMANDS) + '\n')
         elif 'boardsize' in command:
             self.set_board_size(command)
-            print('=\n')
         elif 'clear_board' in command:
             self.clear_board()
             print('=\n')
@@ -77,12 +74,19 @@ class Engine:
         elif 'play' in command:
             self.play(command)
             print('=\n')
+        elif 'time_settings' in command:
+            self.time_settings(command)
+            print('=\n')
+        elif 'time_left' in command:
+            self.time_left(command)
+            print('=\n')
         elif 'genmove' in command:
             # print('=', generate_move(BLACK if command.split()[-1] == 'B' else WHITE) + '\n')
             self.generate_move()
         elif 'getscore' in command:
             self.get_score()
         elif 'quit' in command:
+            self.mcts.close()
             sys.exit()
         else:
             print('=\n')  # skip unsupported commands
@@ -92,19 +96,51 @@ class Engine:
     def name(self):
         return f"TCU Go2AI {MODEL}"
 
-    # change the board size for the game
+    # change the board size for the game, the pool heads play any size with the same checkpoint, the fc head only
+    # the board size in engine_config.yaml
     def set_board_size(self, command):
         size = int(command.split()[-1])
-        if size in [7]:
-            self.go_game = GoGame(size, is_arena_game=True)
-            self.board_size = size
-            self.board = self.go_game.getInitBoard()
+        if size == self.board_size:
+            self.clear_board()
+        elif self.config["network_head"] == "pool" and 2 <= size <= MAX_BOARD_SIZE:
+            self._create_game(size)
+            self.time_manager.expected_game_length = 2 * size ** 2
         else:
             print('? current board size not supported\n')
+            return
+        print('=\n')
+
+    # create the game of a board size, with the network and the search whose action size follows it
+    def _create_game(self, size):
+        if self.mcts is not None:
+            self.mcts.close()
+        self.board_size = size
+        self.go_game = GoGame(size, is_arena_game=True, encoder=FeatureEncoder.from_config(self.config))
+        self.board = self.go_game.getInitBoard()
+        self.canonicalBoard = self.go_game.getCanonicalForm(self.board, self.board.current_player)
+        self.neural_net = NNetWrapper(self.go_game, self.config)
+
+        if is_frozen_state():
+            self.neural_net.load_checkpoint(f"{sys._MEIPASS}", 'best.pth.tar')
+        else:
+            self.neural_net.load_checkpoint(f"{ROOT_DIR}/engine/", 'best.pth.tar')
+
+        self.mcts = create_mcts(game=self.go_game, nnet=self.neural_net, is_self_play=False, config=self.config)
 
     # reset the board
     def clear_board(self):
         self.board = self.go_game.getInitBoard()
+        self.mcts.clear()
+
+    # set the time control of the game: time_settings main_time byo_yomi_time byo_yomi_stones
+    def time_settings(self, command):
+        main_time, byo_yomi_time, byo_yomi_stones = command.split()[1:4]
+        self.time_manager.set_time_settings(float(main_time), float(byo_yomi_time), int(byo_yomi_stones))
+
+    # update the clock of a player: time_left color time stones
+    def time_left(self, command):
+        color, time_left, stones = command.split()[1:4]
+        self.time_manager.set_time_left(self._gtp_color_to_player(color), float(time_left), int(stones))
 
     def get_score(self):
         score = self.go_game.getScore(self.board)
@@ -119,15 +155,10 @@ class Engine:
     def execute_move(self, action):
         # make move on board
         self.board = self.go_game.getNextState(self.board, action)
-        # Update histories to prepare for next move
+        # keep the searched subtree of the move, free the rest of the tree
+        self.mcts.prune(self.board)
+        # the search derives the network input planes from the board (and its history) itself
         self.canonicalBoard = self.go_game.getCanonicalForm(self.board, self.board.current_player)
-        self._set_player_board()
-        self.canonicalHistory, self.x_boards, self.y_boards = self.go_game.getCanonicalHistory(self.x_boards,
-                                                                                               self.y_boards,
-                                                                                               self.canonicalBoard,
-                                                                                               self.player_board)
-        # player will switch, so switch x and y boards (current/opposing player histories)
-        self.x_boards, self.y_boards = self.y_boards, self.x_boards
 
     # play a move given by a human
     def play(self, command):
@@ -143,40 +174,84 @@ class Engine:
     def generate_move(self):
         # prepare necessary data structures for the move
         self.canonicalBoard = self.go_game.getCanonicalForm(self.board, self.board.current_player)
-        self._set_player_board()
+        # under a time control the search runs until the deadline (or until the move is decided)
+        start_time = time.monotonic()
+        player = self.board.current_player
+        deadline = self.time_manager.get_deadline(player, len(self.board.history))
+        if deadline is None:
+            num_sims = self.config["num_full_search_sims"]
+        else:
+            num_sims = self.config["time_control_max_sims"]
         # generate a move based on most recent board state
         action = np.argmax(
-            self.mcts.getActionProb(self.board, self.canonicalBoard, self.canonicalHistory, self.x_boards,
-                                    self.y_boards, self.player_board, self.config["num_full_search_sims"], temp=0))
+            self.mcts.getActionProb(self.board, self.canonicalBoard, num_sims, temp=0, deadline=deadline))
         # perform the move
         self.execute_move(action)
+        self.time_manager.record_move(player, time.monotonic() - start_time)
         # print the GTP coordinate of the move
         coordinate = self._action_to_gtp_coordinate(action)
         print(f"= {coordinate}\n")
+        sys.stdout.flush()
+        self.start_pondering()
+
+    # keep searching the current position while the opponent thinks about its reply
+    def start_pondering(self):
+        if not self.config["ponder"]:
+            return
+        self.stop_ponder.clear()
+        self.ponder_thread = threading.Thread(target=self._ponder, daemon=True)
+        self.ponder_thread.start()
+
+    # stop the ponder thread, the visits it made stay in the tree and are reused through prune
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return
+        self.stop_ponder.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+
+    # search the position with the opponent to move: its likely replies get most of the visits, and the subtree
+    # of the reply that is actually played is kept by execute_move
+    def _ponder(self):
+        canonicalBoard = self.go_game.getCanonicalForm(self.board, self.board.current_player)
+        s = self.go_game.stringRepresentation(canonicalBoard, is_canonical=True)
+        visits = -1
+        while not self.stop_ponder.is_set():
+            root = self.mcts.table.peek(s)
+            root_visits = root.N if root is not None else 0
+            # stop once the tree is large enough or the search makes no progress (e.g. the game is over)
+            if root_visits >= self.config["ponder_max_sims"] or root_visits == visits:
+                return
+            visits = root_visits
+            self.mcts.run_simulations(self.board, canonicalBoard, PONDER_BATCH_SIMS)
 
     # translate an action (int) to the corresponding GTP coordinate (str)
     def _action_to_gtp_coordinate(self, action):
-        row = self.config["board_size"] - int(action / self.config["board_size"])
-        col_coords = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P']
-        col = col_coords[action % 7]
+        if action == self.board_size ** 2:
+            return "pass"
+        row = self.board_size - int(action / self.board_size)
+        col = GTP_COLUMNS[action % self.board_size]
         coordinate = col + str(row)
         return coordinate
 
-    # translate a GTP coordinate (str) to the corresponding action (int)
+    # translate a GTP color (b, black, w, white) to the corresponding player (int)
+    def _gtp_color_to_player(self, color):
+        return 1 if color.lower().startswith('b') else -1
+
+    # translate a GTP coordinate (str) to the corresponding action (int), SGF points (two letters) are accepted too
     def _gtp_coordinate_to_action(self, coord):
         letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's']
         if coord.lower() == "pass":
-            action = int(self.config["board_size"]) ** 2
+            action = self.board_size ** 2
         else:
-            try:
-                col = letters.index(coord[0].lower())
-            except ValueError as e:
-                col = int(coord[0])
             try:
                 row = letters.index(coord[1].lower())
+                # SGF columns include i
+                col = letters.index(coord[0].lower())
             except ValueError as e:
-                row = int(self.config["board_size"]) - int(coord[1])
-            action = (row * 7) + col
+                row = self.board_size - int(coord[1:])
+                col = GTP_COLUMNS.index(coord[0].upper())
+            action = (row * self.board_size) + col
         return action
 
     # initialize board state from an SGF file
@@ -1,15 +1,20 @@
-from engine import Engine
+import multiprocessing
 import sys
 
-# Create the engine
-engine = Engine()
-# Collect arguments and set variables accordingly
-args = sys.argv[1:]
-if "-cli" in args:
-    command_prompt = "\n>> "
-else:
-    command_prompt = ""
-# Main execution loop
-while True:
-    command = input(command_prompt)
-    engine.run_command(command)
\ No newline at end of file
+from engine import Engine
+
+if __name__ == "__main__":
+    # root parallel search (root_parallel_processes in engine_config.yaml) starts processes, also from Pyinstaller builds
+    multiprocessing.freeze_support()
+    # Create the engine
+    engine = Engine()
+    # Collect arguments and set variables accordingly
+    args = sys.argv[1:]
+    if "-cli" in args:
+        command_prompt = "\n>> "
+    else:
+        command_prompt = ""
+    # Main execution loop
+    while True:
+        command = input(command_prompt)
+        engine.run_command(command)
@@ -0,0 +1,127 @@
+import numpy as np
+
+"""
+Input planes of the network, selected with history_depth and input_features in config.yaml.
+
+The planes of every feature, in the order of input_features (every plane is board_size x board_size, from the point of
+view of the player to move):
+    history: 2 planes per position for the current and the history_depth - 1 previous positions, newest first:
+             the stones of the player to move, the stones of the opponent
+    sensibility: the legal moves of the player to move that do not fill one of its own eyes
+    colour: all ones if the player to move is black, then all ones if it is white
+    liberties: the stones of the player to move in groups with 1, 2 and 3 or more liberties, then those of the opponent
+    ladder: the moves of the player to move that capture an opponent group in a ladder, then those that let one of
+            its own groups escape a ladder (expensive, every legal move is read out)
+
+The default, history_depth 8 with history, sensibility and colour, gives the 19 planes the networks were trained with.
+"""
+
+FEATURES = ("history", "sensibility", "colour", "liberties", "ladder")
+FEATURE_PLANES = {"sensibility": 1, "colour": 2, "liberties": 6, "ladder": 2}
+DEFAULT_FEATURES = ("history", "sensibility", "colour")
+# positions Board keeps for the history planes at most
+MAX_HISTORY_DEPTH = 8
+
+
+class FeatureEncoder:
+    """
+    Writes the input planes of positions into float32 arrays of shape (num_planes, n, n), or (batch, num_planes, n, n)
+    for several positions. The networks take their input width from num_planes.
+    """
+
+    def __init__(self, history_depth=MAX_HISTORY_DEPTH, features=DEFAULT_FEATURES):
+        if not 1 <= history_depth <= MAX_HISTORY_DEPTH:
+            raise ValueError(f"history_depth must be between 1 and {MAX_HISTORY_DEPTH}, got {history_depth}.")
+        for feature in features:
+            if feature not in FEATURES:
+                raise KeyError(f"Input feature '{feature}' is not supported. "
+                               f"Please check config.yaml for supported input features.")
+        self.history_depth = history_depth
+        self.features = tuple(features)
+        self.num_planes = sum(2 * history_depth if feature == "history" else FEATURE_PLANES[feature]
+                              for feature in self.features)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["history_depth"], config["input_features"])
+
+    def encode(self, board, out=None):
+        """
+        Returns the planes of board for its current player, written into out if given.
+        """
+        return self.encode_planes(board.x_boards, board.y_boards, board, board.current_player, out=out)
+
+    def encode_batch(self, boards, out=None):
+        """
+        Returns the planes of every board of boards in one array of shape (len(boards), num_planes, n, n), written into
+        out if given.
+        """
+        if out is None:
+            n = boards[0].n
+            out = np.empty((len(boards), self.num_planes, n, n), dtype=np.float32)
+        for i, board in enumerate(boards):
+            self.encode(board, out=out[i])
+        return out
+
+    def encode_planes(self, x_boards, y_boards, board, player, colour=None, out=None):
+        """
+        Returns the planes of a position, written into out if given.
+            x_boards, y_boards: the stones of the player to move and of the opponent in the last positions, oldest
+                                first (see Board._update_canonical_history)
+            board: the current position, player is the player to move on it (its stones are player in board.pieces)
+            colour: the colour of the player to move, if it differs from player (canonical boards, see
+                    GoGame.getCanonicalHistory)
+        """
+        if out is None:
+            out = np.empty((self.num_planes, board.n, board.n), dtype=np.float32)
+        if colour is None:
+            colour = player
+
+        i = 0
+        for feature in self.features:
+            if feature == "history":
+                for age in range(self.history_depth):
+                    out[i] = x_boards[-1 - age]
+                    out[i + 1] = y_boards[-1 - age]
+                    i += 2
+            elif feature == "sensibility":
+                out[i] = sensibility_layer(board, player)
+                i += 1
+            elif feature == "colour":
+                out[i] = colour == 1
+                out[i + 1] = colour == -1
+                i += 2
+            elif feature == "liberties":
+                write_liberty_planes(board, player, out[i:i + 6])
+                i += 6
+            elif feature == "ladder":
+                write_ladder_planes(board, player, out[i:i + 2])
+                i += 2
+        return out
+
+
+def sensibility_layer(board, player):
+    """
+    The 'sensibility layer': a n x n array marking all legal moves of player that do not fill in its own eyes.
+    """
+    legal_and_not_eye = np.zeros((board.n, board.n))
+    for (i, j) in board.get_legal_moves(player):
+        if not board.is_eye((i, j), player):
+            legal_and_not_eye[i, j] = 1
+    return legal_and_not_eye
+
+
+def write_liberty_planes(board, player, out):
+    pieces = np.asarray(board.pieces)
+    liberties = board.liberty_counts
+    for k, stones in enumerate((pieces == player, pieces == -player)):
+        out[3 * k] = stones & (liberties == 1)
+        out[3 * k + 1] = stones & (liberties == 2)
+        out[3 * k + 2] = stones & (liberties >= 3)
+
+
+def write_ladder_planes(board, player, out):
+    out.fill(0)
+    for (i, j) in board.get_legal_moves(player):
+        out[0, i, j] = board.is_ladder_capture((i, j), player)
+        out[1, i, j] = board.is_ladder_escape((i, j), player)
@@ -2,6 +2,7 @@ from __future__ import print_function
 
 import numpy as np
 
+from go.feature_encoder import FeatureEncoder, sensibility_layer
 from go.game import Game
 from go.go_logic import Board
 from itertools import permutations
@@ -11,15 +12,18 @@ class GoGame(Game):
 
     # TODO: should is_engine_game be a part of config.yaml instead?
     # I don't think we want to couple engine code and the GoGame class - HL
-    def __init__(self, n, is_arena_game=False):
+    def __init__(self, n, is_arena_game=False, encoder=None):
         super().__init__()
         self.n = n
         self.is_arena_game = is_arena_game
+        # input planes of the network for the boards of this game, FeatureEncoder.from_config(config) for the
+        # history_depth and input_features of config.yaml
+        self.encoder = encoder if encoder is not None else FeatureEncoder()
         self.stay_alive_threshold = 0.4
 
     def getInitBoard(self):
         # return initial board (numpy board)
-        b = Board(self.n)
+        b = Board(self.n, self.encoder)
         return b
 
     def getBoardSize(self):
@@ -252,10 +256,10 @@ class GoGame(Game):
                 #print(f"White Eye at {empty}")
                 score_white += 1"""
         score_white += board.komi
-        reach_mat = np.zeros((7, 7, 2))
+        reach_mat = np.zeros((self.n, self.n, 2))
         reach_mat = self.get_reachable(board, reach_mat)
-        for i in range(7):
-            for j in range(7):
+        for i in range(self.n):
+            for j in range(self.n):
                 if reach_mat[i][j][0] == 1 and reach_mat[i][j][1] == 0:
                     score_black += 1
                 elif reach_mat[i][j][0] == 0 and reach_mat[i][j][1] == 1:
@@ -331,80 +335,80 @@ class GoGame(Game):
     def get_deadstone_groups(self, board):
         vertical_groups = []
         # Check for 'vertical groups'
-        for c in range(1, 6, 1):
+        for c in range(1, self.n - 1, 1):
             # Check groups starting at row 0
             current_group_top = board.group_sets[0][c]
             if len(current_group_top) >= 3:
-                visited_intersections = [False for _ in range(7)]
+                visited_intersections = [False for _ in range(self.n)]
                 visited_intersections[0] = True
                 for coords in current_group_top:
                     if coords[1] == c:
                         visited_intersections[coords[0]] = True
                 vr_max = -1
-                for r in range(7):
+                for r in range(self.n):
                     if visited_intersections[r] == True:
                         vr_max += 1
                     else:
                         break
                 vertical_groups.append((0, vr_max, c))
             # Check groups starting at row 6
-            current_group_bottom = board.group_sets[6][c]
+            current_group_bottom = board.group_sets[self.n - 1][c]
             if len(current_group_bottom) >= 3:
-                visited_intersections = [False for _ in range(7)]
-                visited_intersections[6] = True
+                visited_intersections = [False for _ in range(self.n)]
+                visited_intersections[self.n - 1] = True
                 for coords in current_group_bottom:
                     if coords[1] == c:
                         visited_intersections[coords[0]] = True
-                vr_min = 7
-                for r in range(6, -1, -1):
+                vr_min = self.n
+                for r in range(self.n - 1, -1, -1):
                     if visited_intersections[r] == True:
                         vr_min -= 1
                     else:
                         break
-                if (vr_min, 6, c) not in vertical_groups:
-                    vertical_groups.append((vr_min, 6, c)) 
+                if (vr_min, self.n - 1, c) not in vertical_groups:
+                    vertical_groups.append((vr_min, self.n - 1, c)) 
         # Check for horizontal groups
         horizontal_groups = []
-        for r in range(1, 6, 1):
+        for r in range(1, self.n - 1, 1):
             # Check groups starting at column 0
             current_group_left = board.group_sets[r][0]
             if len(current_group_left) >= 3:
-                visited_intersections = [False for _ in range(7)]
+                visited_intersections = [False for _ in range(self.n)]
                 visited_intersections[0] = True
                 for coords in current_group_left:
                     if coords[0] == r:
                         visited_intersections[coords[1]] = True
                 hc_max = -1
-                for c in range(7):
+                for c in range(self.n):
                     if visited_intersections[c] == True:
                         hc_max += 1
                     else:
                         break
                 horizontal_groups.append((0, hc_max, r))
             # Check groups starting at column 6
-            current_group_right = board.group_sets[r][6]
+            current_group_right = board.group_sets[r][self.n - 1]
             if len(current_group_right) >= 3:
-                visited_intersections = [False for _ in range(7)]
-                visited_intersections[6] = True
+                visited_intersections = [False for _ in range(self.n)]
+                visited_intersections[self.n - 1] = True
                 for coords in current_group_right:
                     if coords[0] == r:
                         visited_intersections[coords[1]] = True
-                hc_min = 7
-                for c in range(6, -1, -1):
+                hc_min = self.n
+                for c in range(self.n - 1, -1, -1):
                     if visited_intersections[c] == True:
                         hc_min -= 1
                     else:
                         break
-                if (hc_min, 6, r) not in horizontal_groups:
-                    horizontal_groups.append((hc_min, 6, r))
+                if (hc_min, self.n - 1, r) not in horizontal_groups:
+                    horizontal_groups.append((hc_min, self.n - 1, r))
         return vertical_groups, horizontal_groups
     
     def get_deadstone_territories(self, board, vertical_groups, horizontal_groups):
         dead_territories = {
             'left_above': (-1, -1, 0),
-            'left_below': (-1, 7, 0),
-            'right_above': (7, -1, 0),
-            'right_below': (7, 7, 0)
+            'left_below': (-1, self.n, 0),
+            'right_above': (self.n, -1, 0),
+            'right_below': (self.n, self.n, 0)
         }
         current_board = board.pieces
         dead_territories_exist = False
@@ -440,7 +444,7 @@ class GoGame(Game):
                 is_above = False
                 is_below = False
                 # Check if the horizontal group may form an intersection
-                if col_min == 0 and col_max == 6:
+                if col_min == 0 and col_max == self.n - 1:
                     possible_intersection = True
                     is_left = True
                     is_right = True
@@ -454,7 +458,7 @@ class GoGame(Game):
                 if not possible_intersection:
                     continue
                 # Check if the vertical group may form an intersection
-                if row_min == 0 and row_max == 6:
+                if row_min == 0 and row_max == self.n - 1:
                     is_above = True
                     is_below = True
                 elif row_max == row_number or row_max == row_number-1:
@@ -469,15 +473,15 @@ class GoGame(Game):
                     if col_number > dead_territories['left_above'][0] and row_number > dead_territories['left_above'][1]:
                         dead_territories['left_above'] = (col_number, row_number, hg_color)
                         dead_territories_exist = True
-                if is_left and is_below and row_max == 6 and col_min == 0:
+                if is_left and is_below and row_max == self.n - 1 and col_min == 0:
                     if col_number > dead_territories['left_below'][0] and row_number < dead_territories['left_below'][1]:
                         dead_territories['left_below'] = (col_number, row_number, hg_color)
                         dead_territories_exist = True
-                if is_right and is_above and row_min == 0 and col_max == 6:
+                if is_right and is_above and row_min == 0 and col_max == self.n - 1:
                     if col_number < dead_territories['right_above'][0] and row_number > dead_territories['right_above'][1]:
                         dead_territories['right_above'] = (col_number, row_number, hg_color)
                         dead_territories_exist = True
-                if is_right and is_below and row_max == 6 and col_max == 6:
+                if is_right and is_below and row_max == self.n - 1 and col_max == self.n - 1:
                     if col_number < dead_territories['right_below'][0] and row_number < dead_territories['right_below'][1]:
                         dead_territories['right_below'] = (col_number, row_number, hg_color)
                         dead_territories_exist = True
@@ -489,26 +493,26 @@ class GoGame(Game):
         start_r = dead_territories['right_below'][1]
         start_c = dead_territories['right_below'][0]
         right_below_deadstones = False
-        if start_r != 7 and start_c != 7:
+        if start_r != self.n and start_c != self.n:
             # print("\nRIGHT BELOW")
-            move_combos, contested_intersections_count = self.get_move_permutations(start_r+1, 7, start_c+1, 7, reach_mat, dead_territories['right_below'][2])
+            move_combos, contested_intersections_count = self.get_move_permutations(start_r+1, self.n, start_c+1, self.n, reach_mat, dead_territories['right_below'][2])
             # print(contested_intersections_count)
             if contested_intersections_count > 0 and contested_intersections_count <= 2:
                 right_below_deadstones = True
             elif contested_intersections_count > 0 and (contested_intersections_count < 5 or (dead_territories['right_below'][2] == board.current_player and contested_intersections_count == 5)):
-                right_below_deadstones = self.deadstone_simulation(board.copy(), move_combos, start_r+1, 7, start_c+1, 7, dead_territories['right_below'][2])
+                right_below_deadstones = self.deadstone_simulation(board.copy(), move_combos, start_r+1, self.n, start_c+1, self.n, dead_territories['right_below'][2])
         # Simulate for lower-left region if there is one
         start_r = dead_territories['left_below'][1]
         start_c = dead_territories['left_below'][0]
         left_below_deadstones = False
-        if start_r != 7 and start_c != -1:
+        if start_r != self.n and start_c != -1:
             # print("\nLEFT BELOW")
-            move_combos, contested_intersections_count = self.get_move_permutations(start_r+1, 7, 0, start_c, reach_mat, dead_territories['left_below'][2])
+            move_combos, contested_intersections_count = self.get_move_permutations(start_r+1, self.n, 0, start_c, reach_mat, dead_territories['left_below'][2])
             if contested_intersections_count > 0 and contested_intersections_count <= 2:
                 left_below_deadstones = True
 
             elif contested_intersections_count > 0 and (contested_intersections_count < 5 or (dead_territories['left_below'][2] == board.current_player and contested_intersections_count == 5)):
-                left_below_deadstones = self.deadstone_simulation(board.copy(), move_combos, start_r+1, 7, 0, start_c, dead_territories['left_below'][2])
+                left_below_deadstones = self.deadstone_simulation(board.copy(), move_combos, start_r+1, self.n, 0, start_c, dead_territories['left_below'][2])
         # Simulate for upper-left region if there is one
         start_r = dead_territories['left_above'][1]
         start_c = dead_territories['left_above'][0]
@@ -524,7 +528,7 @@ class GoGame(Game):
         start_r = dead_territories['right_above'][1]
         start_c = dead_territories['right_above'][0]
         right_above_deadstones = False
-        if start_r != -1 and start_c != 7:
+        if start_r != -1 and start_c != self.n:
             # print("\nRIGHT ABOVE")
             move_combos, contested_intersections_count = self.get_move_permutations(0, start_r, start_c+1, 0, reach_mat, dead_territories['right_above'][2])
             if contested_intersections_count > 0 and contested_intersections_count <= 2:
@@ -546,7 +550,7 @@ class GoGame(Game):
             for j in range(start_c, end_c):
                 if np.array_equal(reach_mat[i, j], reach_test_contested) or (dt_owner == -1 and np.array_equal(reach_mat[i, j], reach_test_black)) or (dt_owner == 1 and np.array_equal(reach_mat[i, j], reach_test_white)):
                     contested_intersections_count += 1
-                    new_move = i*7 + j
+                    new_move = i*self.n + j
                     dt_moves.append(new_move)
                 elif np.array_equal(reach_mat[i, j], reach_test_black):
                     black_intersections_count += 1
@@ -571,7 +575,7 @@ class GoGame(Game):
                 except:
                     # print(f"Exception for move: {curr_moves[i]}")
                     continue
-            reach_mat = np.zeros((7, 7, 2))
+            reach_mat = np.zeros((self.n, self.n, 2))
             reach_mat = self.get_reachable(test_board, reach_mat)
             reach_test_white = np.array([0, 1])
             reach_test_black = np.array([1, 0])
@@ -608,7 +612,7 @@ class GoGame(Game):
                         score_white -= 1
                         score_black += 1
         if left_below_deadstones:
-            for i in range(dead_territories['left_below'][1], 7):
+            for i in range(dead_territories['left_below'][1], self.n):
                 for j in range(0, dead_territories['left_below'][0]):
                     if board.pieces[i][j] == 1 and dead_territories['left_below'][2] == -1:
                         score_black -= 1
@@ -622,7 +626,7 @@ class GoGame(Game):
                         score_black += 1
         if right_above_deadstones:
             for i in range(0, dead_territories['right_above'][1]):
-                for j in range(dead_territories['right_above'][0], 7):
+                for j in range(dead_territories['right_above'][0], self.n):
                     if board.pieces[i][j] == 1 and dead_territories['right_above'][2] == -1:
                         score_black -= 1
                         score_white += 1
@@ -630,8 +634,8 @@ class GoGame(Game):
                         score_white -= 1
                         score_black += 1
         if right_below_deadstones:
-            for i in range(dead_territories['right_below'][1], 7):
-                for j in range(dead_territories['right_below'][0], 7):
+            for i in range(dead_territories['right_below'][1], self.n):
+                for j in range(dead_territories['right_below'][0], self.n):
                     if board.pieces[i][j] == 1 and dead_territories['right_below'][2] == -1:
                         score_black -= 1
                         score_white += 1
@@ -648,8 +652,8 @@ class GoGame(Game):
 
     def get_reachable(self, board, reach_mat):
         changed = []
-        for i in range(7):
-            for j in range(7):
+        for i in range(self.n):
+            for j in range(self.n):
                 if board.pieces[i][j] == 1:
                     color_idx = 0
                 elif board.pieces[i][j] == -1:
@@ -662,7 +666,7 @@ class GoGame(Game):
                         changed.append((k, j))
                     else:
                         break
-                for k in range(i + 1, 7, 1):
+                for k in range(i + 1, self.n, 1):
                     if board.pieces[k][j] == 0 and reach_mat[k][j][color_idx] == 0:
                         reach_mat[k][j][color_idx] = 1
                         changed.append((k, j))
@@ -674,7 +678,7 @@ class GoGame(Game):
                         changed.append((i, k))
                     else:
                         break
-                for k in range(j + 1, 7, 1):
+                for k in range(j + 1, self.n, 1):
                     if board.pieces[i][k] == 0 and reach_mat[i][k][color_idx] == 0:
                         reach_mat[i][k][color_idx] = 1
                         changed.append((i, k))
@@ -692,8 +696,8 @@ class GoGame(Game):
                             reach_mat[k][j][0] = 1
                         if reach_mat[k][j][1] == 0 and reach_mat[i][j][1] == 1:
                             reach_mat[k][j][1] = 1
-                if i < 6:
-                    for k in range(i + 1, 7, 1):
+                if i < self.n - 1:
+                    for k in range(i + 1, self.n, 1):
                         if board.pieces[k][j] != 0:
                             break
                         if reach_mat[k][j][0] == 0 and reach_mat[i][j][0] == 1:
@@ -708,16 +712,16 @@ class GoGame(Game):
                             reach_mat[i][k][0] = 1
                         if reach_mat[i][k][1] == 0 and reach_mat[i][j][1] == 1:
                             reach_mat[i][k][1] = 1
-                if j < 6:
-                    for k in range(j + 1, 7, 1):
+                if j < self.n - 1:
+                    for k in range(j + 1, self.n, 1):
                         if board.pieces[i][k] != 0:
                             break
                         if reach_mat[i][k][0] == 0 and reach_mat[i][j][0] == 1:
                             reach_mat[i][k][0] = 1
                         if reach_mat[i][k][1] == 0 and reach_mat[i][j][1] == 1:
                             reach_mat[i][k][1] = 1
-        for i in range(7):
-            for j in range(7):
+        for i in range(self.n):
+            for j in range(self.n):
                 if board.pieces[i][j] != 0:
                     continue
                 elif board.pieces[i][j] == 0 and (reach_mat[i][j][0] != 1 or reach_mat[i][j][1] != 1):
@@ -729,8 +733,8 @@ class GoGame(Game):
                                 reach_mat[i][j][0] = 1
                             if reach_mat[k][j][1] == 1 and reach_mat[i][j][1] == 0:
                                 reach_mat[i][j][1] = 1
-                    if i < 6:
-                        for k in range(i + 1, 7, 1):
+                    if i < self.n - 1:
+                        for k in range(i + 1, self.n, 1):
                             if board.pieces[k][j] != 0 or (reach_mat[i][j][0] == 1 and reach_mat[i][j][1] == 1):
                                 break
                             if reach_mat[k][j][0] == 1 and reach_mat[i][j][0] == 0:
@@ -745,8 +749,8 @@ class GoGame(Game):
                                 reach_mat[i][j][0] = 1
                             if reach_mat[i][k][1] == 1 and reach_mat[i][j][1] == 0:
                                 reach_mat[i][j][1] = 1
-                    if j < 6:
-                        for k in range(j + 1, 7, 1):
+                    if j < self.n - 1:
+                        for k in range(j + 1, self.n, 1):
                             if board.pieces[i][k] != 0 or (reach_mat[i][j][0] == 1 and reach_mat[i][j][1] == 1):
                                 break
                             if reach_mat[i][k][0] == 1 and reach_mat[i][j][0] == 0:
@@ -802,7 +806,6 @@ class GoGame(Game):
         # return np.array(board.pieces).tostring()
 
     def getCanonicalHistory(self, x_boards, y_boards, canonicalBoard, player_board):
-        history = []
         board_pieces = canonicalBoard.pieces
         new_x = np.copy(board_pieces)
 
@@ -825,29 +828,19 @@ class GoGame(Game):
         x_boards = x_boards[1:]
         y_boards = y_boards[1:]
 
-        for i in range(len(x_boards) - 1, -1, -1):
-            history.append(x_boards[i])
-            history.append(y_boards[i])
-
-        history.append(self.make_sensibility_layer(canonicalBoard))
-        history.append(player_board[0])
-        history.append(player_board[1])
+        # the stones of the player to move are 1 on the canonical board, player_board holds its colour planes
+        colour = 1 if player_board[0].any() else -1
+        history = list(self.encoder.encode_planes(x_boards, y_boards, canonicalBoard, 1, colour=colour))
 
         return history, x_boards, y_boards
 
     def make_sensibility_layer(self, canonicalBoard):
-        legal_and_not_eye = np.zeros((self.n, self.n))
-        legal_moves = canonicalBoard.get_legal_moves(1)
-        for i in range(self.n):
-            for j in range(self.n):
-                if not canonicalBoard.is_eye((i, j), 1) and ((i, j) in legal_moves):
-                    legal_and_not_eye[i, j] = 1
-        return legal_and_not_eye
+        return sensibility_layer(canonicalBoard, 1)
 
     def init_x_y_boards(self):
         x_boards = []
         y_boards = []
-        for i in range(8):
+        for i in range(self.encoder.history_depth):
             x_boards.append(np.zeros((self.n, self.n)))
             y_boards.append(np.zeros((self.n, self.n)))
 
@@ -857,8 +850,9 @@ class GoGame(Game):
 def display(board):
     state = "   |"
     b_pieces = np.array(board.pieces)
-    n = 7
-    alphabet = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S"]
+    n = len(b_pieces)
+    # GTP column letters, I is skipped
+    alphabet = ["A", "B", "C", "D", "E", "F", "G", "H", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T"]
     divider = "---|"
     for y in range(n):
         # state = state + str(y) + "|"
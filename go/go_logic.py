@@ -1,5 +1,7 @@
 import numpy as np
 
+from go.feature_encoder import FeatureEncoder, sensibility_layer
+
 '''
 Board class.
 Board data:
@@ -16,8 +18,10 @@ class Board:
     # amount of time, hence this shared lookup table {boardsize: {position: [neighbors]}}
     __NEIGHBORS_CACHE = {}
 
-    def __init__(self, n):
+    def __init__(self, n, encoder=None):
         self.n = n
+        # writes the network input planes of the board, see get_canonical_history
+        self.encoder = encoder if encoder is not None else FeatureEncoder()
         # Create the empty board array.
         self.pieces = np.zeros((self.n, self.n))
 
@@ -64,19 +68,17 @@ class Board:
         self.previous_boards = []
         self.current_board = np.array(self.pieces).tostring()
 
-        self.x_boards = [np.zeros((self.n, self.n)) for _ in range(8)]
-        self.y_boards = [np.zeros((self.n, self.n)) for _ in range(8)]
-        self.canonical_history = []
-        # Initialize canonical history
-        for i in range(len(self.x_boards)): # X and Y boards
-            self.canonical_history.append(self.x_boards[i])
-            self.canonical_history.append(self.y_boards[i])
-        self.canonical_history.append(np.ones((self.n, self.n))) # Sensibility Layer
-        self.canonical_history.append(np.ones((self.n, self.n))) # Current Player
-        self.canonical_history.append(np.zeros((self.n, self.n))) # Opposing Player
+        # stones of the current and the opposing player in the last history_depth positions, oldest first
+        self.x_boards = [np.zeros((self.n, self.n)) for _ in range(self.encoder.history_depth)]
+        self.y_boards = [np.zeros((self.n, self.n)) for _ in range(self.encoder.history_depth)]
+        # network input planes, built by get_canonical_history
+        self.canonical_history = None
         self.current_player = 1
 
     def get_canonical_history(self):
+        # the planes are only built when a network input is needed, see _update_canonical_history
+        if self.canonical_history is None:
+            self.canonical_history = self._build_canonical_history()
         return self.canonical_history.copy()
 
     def set_current_player(self, new_player):
@@ -86,24 +88,8 @@ class Board:
             # Set new (current) player/flip x & y boards (current/opposing histories)
             self.current_player = new_player
             self.x_boards, self.y_boards = self.y_boards, self.x_boards
-            new_history = []
-
-            # Move history (from boards matching new player)
-            for i in range(len(self.x_boards)):
-                new_history.append(self.x_boards[i])
-                new_history.append(self.y_boards[i])
-            
-            # Sensibility Layer
-            new_history.append(self.make_sensibility_layer())
-
-            # Player boards (All 1s/0s)
-            if self.current_player == 1:
-                new_history.append(np.ones((self.n, self.n)))
-                new_history.append(np.zeros((self.n, self.n)))
-            else:
-                new_history.append(np.zeros((self.n, self.n)))
-                new_history.append(np.zeros((self.n, self.n)))
-            self.canonical_history = new_history
+            # rebuilt for the new player by get_canonical_history
+            self.canonical_history = None
             
 
 
@@ -170,13 +156,7 @@ class Board:
         This is a NxN matrix marking all legal moves that do not fill 
         in the current player's own eyes
         """
-        legal_and_not_eye = np.zeros((self.n, self.n))
-        legal_moves = self.get_legal_moves(self.current_player)
-        for i in range(self.n):
-            for j in range(self.n):
-                if not self.is_eye((i, j), self.current_player) and ((i, j) in legal_moves):
-                    legal_and_not_eye[i, j] = 1
-        return legal_and_not_eye
+        return sensibility_layer(self, self.current_player)
 
     def getStringRepresentation(self):
         # canonical_board = np.where(self.pieces != 0, self.pieces*self.current_player, 0)
@@ -241,6 +221,12 @@ class Board:
                                  if self._on_board(xy)]
                     Board.__NEIGHBORS_CACHE[self.n][(x, y)] = neighbors
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the neighbors cache belongs to the process, a board unpickled in a spawned process (root parallel search) has
+        # to fill it
+        self._create_neighbors_cache()
+
     def _neighbors(self, position):
         """A private helper function that simply returns a list of positions neighboring
         the given (x,y) position. Basically it handles edges and corners.
@@ -326,7 +312,7 @@ class Board:
     def copy(self):
         """get a copy of this Game state
         """
-        other = Board(self.n)
+        other = Board(self.n, self.encoder)
         other.pieces = self.pieces.copy()
         other.ko = self.ko
         other.handicaps = list(self.handicaps)
@@ -629,7 +615,6 @@ class Board:
         return False
     
     def _update_canonical_history(self):
-        history_temp = []
         canonical_board = np.where(self.pieces != 0, self.pieces * self.current_player, 0)
         # new_x = np.copy(canonical_board)
         new_x = np.where(canonical_board == 1, float(1), float(0))
@@ -641,17 +626,12 @@ class Board:
         self.x_boards = self.x_boards[1:]
         self.y_boards = self.y_boards[1:]
 
-        for i in range(len(self.x_boards) - 1, -1, -1):
-            history_temp.append(self.x_boards[i])
-            history_temp.append(self.y_boards[i])
-        history_temp.append(self.make_sensibility_layer())
-        if self.current_player == 1:
-            history_temp.append(np.ones((self.n, self.n)))
-            history_temp.append(np.zeros((self.n, self.n)))
-        else:
-            history_temp.append(np.zeros((self.n, self.n)))
-            history_temp.append(np.ones((self.n, self.n)))
-        self.canonical_history = history_temp
+        # most boards created by MCTS are never evaluated, the planes are built by get_canonical_history
+        self.canonical_history = None
+
+    def _build_canonical_history(self):
+        # one plane per entry, the layout is declared by the encoder (see go/feature_encoder.py)
+        return list(self.encoder.encode(self))
 
 
     def execute_move(self, action, color):
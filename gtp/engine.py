@@ -1,4 +1,5 @@
 import sys
+import time
 sys.path.append("..")
 sys.path.append("../go")
 sys.path.append("../utils")
@@ -17,6 +18,7 @@ from neural_network.neural_net_wrapper import NNetWrapper as NNetWrapper
 from utils.config_handler import ConfigHandler
 from utils.path_handler import resource_path
 from definitions import CONFIG_PATH
+from search.time_manager import TimeManager
 
 #--------------------------------------------#
 #       Initialize Files/Directories         #
@@ -77,6 +79,7 @@ WHITE = 2
 board = game.getInitBoard()
 mcts = MCTS(game, neural_network, is_self_play=False)
 coords = None
+time_manager = TimeManager(config["board_size"], config["time_safety_margin"])
 """curPlayer = 1
 x_boards = []
 y_boards = []
@@ -285,8 +288,11 @@ def generate_move(color):
     #TODO Change this **FOR TEST ONLY
     #counts, probs, deterministic = mcts.getActionProb(canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, False, num_sims, temp=0)
     #counts = mcts.getActionProb(canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, False, num_sims, temp=0)
-    counts = mcts.getActionProb(board, temp=1, is_full_search=True)
+    start_time = time.monotonic()
+    deadline = time_manager.get_deadline(board.current_player, len(board.history))
+    counts = mcts.getActionProb(board, temp=1, is_full_search=True, deadline=deadline)
     action = np.argmax(counts)
+    time_manager.record_move(board.current_player, time.monotonic() - start_time)
     """
     if deterministic:
         action = np.argmax(probs)
@@ -518,6 +524,14 @@ def gtp():
         elif 'play' in command:
             play(command)
             print('=\n')
+        elif 'time_settings' in command:
+            main_time, byo_yomi_time, byo_yomi_stones = command.split()[1:4]
+            time_manager.set_time_settings(float(main_time), float(byo_yomi_time), int(byo_yomi_stones))
+            print('=\n')
+        elif 'time_left' in command:
+            color, time_left, stones = command.split()[1:4]
+            time_manager.set_time_left(1 if color.lower().startswith('b') else -1, float(time_left), int(stones))
+            print('=\n')
         elif 'genmove' in command:
             print('=', generate_move(BLACK if command.split()[-1].lower() == 'b' else WHITE) + '\n')
         elif 'loadsgf' in command:
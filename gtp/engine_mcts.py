@@ -3,9 +3,11 @@ import math
 import sys
 import os
 import datetime
+import time
 import numpy as np
 from heatmap_generator import MapGenerator
 from definitions import CONFIG_PATH
+from search.evaluators import Evaluator, NetworkEvaluator
 from utils.config_handler import ConfigHandler
 
 EPS = 1e-8
@@ -27,6 +29,7 @@ class MCTS:
     def __init__(self, game, nnet, is_self_play):
         self.game = game
         self.nnet = nnet
+        self.evaluator = nnet if isinstance(nnet, Evaluator) else NetworkEvaluator(nnet)
         self.config = ConfigHandler(CONFIG_PATH)
         self.cpuct = self.config["c_puct"]
 
@@ -43,20 +46,25 @@ class MCTS:
         self.generator = MapGenerator()
         self.simnum = 0
 
-    def getActionProb(self, board, temp=1, is_full_search=True):
+    def getActionProb(self, board, temp=1, is_full_search=True, deadline=None):
         """
         This function performs numMCTSSims simulations of MCTS starting from
-        canonicalBoard.
+        canonicalBoard, or searches until deadline (a time.monotonic() value) if one is given.
 
         Returns:
             probs: a policy vector where the probability of the ith action is
                    proportional to Nsa[(s,a)]**(1./temp)
         """
-        num_sims = self.config["num_full_search_sims"]
+        if deadline is None:
+            num_sims = self.config["num_full_search_sims"]
+        else:
+            num_sims = self.config["time_control_max_sims"]
 
         for i in range(num_sims):
             self.restore_root_state()
             self.search(board)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
 
         s = board.getStringRepresentation()
         player = board.current_player
@@ -204,7 +212,7 @@ class MCTS:
         r = np.random.randint(8)
         nnet_input = board.get_canonical_history()
         nnet_input = board.rotate_history(r, nnet_input)
-        pi, v = self.nnet.predict(nnet_input)
+        pi, v = self.evaluator.evaluate(nnet_input)
 
         # policy need to rotate and flip back
         pi_board = np.reshape(pi[:-1], (self.game.n, self.game.n))
@@ -1,4 +1,5 @@
 from definitions import CONFIG_PATH, CHECKPOINT_PATH, EXAMPLES_PATH
+from go.feature_encoder import FeatureEncoder
 from go.go_game import GoGame
 from neural_network.neural_net_wrapper import NNetWrapper as NNetWrapper
 from utils.config_handler import ConfigHandler
@@ -8,7 +9,7 @@ class NeuralNetManager:
 
     def __init__(self):
         self.config = ConfigHandler(CONFIG_PATH)
-        self.go_game = GoGame(self.config["board_size"])
+        self.go_game = GoGame(self.config["board_size"], encoder=FeatureEncoder.from_config(self.config))
 
         # neural networks
         self.current_net = NNetWrapper(self.go_game, self.config)
@@ -57,6 +57,7 @@ class GTPLogger:
         sgf_file.close()
 
         self.reset()
+        return file_name
 
     def convert_action_to_gtp(self, action):
         # supports up to 26 x 26 boards
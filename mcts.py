@@ -1,10 +1,15 @@
-import copy
 import math
 import sys
+import time
 
 import numpy as np
 
 from definitions import CONFIG_PATH
+from search import gumbel
+from search.evaluation_cache import get_evaluation_cache
+from search.evaluators import Evaluator, NetworkEvaluator, CachingEvaluator
+from search.profiler import SearchProfiler
+from search.transposition_table import TranspositionTable
 from utils.config_handler import ConfigHandler
 
 
@@ -33,31 +38,58 @@ class MCTS:
         else:
             self.config = config
 
-        self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
-        self.Nsa = {}  # stores #times edge s,a was visited
-        self.Ns = {}  # stores #times board s was visited
-        self.Ps = {}  # stores initial policy (returned by neural net)
+        # stores the statistics (Q, Nsa, Ns, P, E, score, valids) of every board s, see search/transposition_table.py
+        self.table = TranspositionTable(self.game.getActionSize(), self.config["mcts_table_max_megabytes"] * 2 ** 20)
         self.smartSimNum = 10 * (self.game.getBoardSize()[0] ** 2)
-        self.Es = {}  # stores game.getGameEnded ended for board s
-        self.Ss = {} # stores the score for board s
-        self.Vs = {}  # stores game.getValidMoves for board s
-
-    def getActionProb(self, board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, num_sims, temp=1):
+        # source of the policies and values of the leaves, see search/evaluators.py
+        self.evaluator = self.create_evaluator(nnet)
+        # whether self play searches add Dirichlet noise to the root priors, set per search by getActionProb
+        self.use_noise = True
+        # simulations skipped by early stopping since the last clear, see run_simulations
+        self.saved_sims = 0
+        # simulations run by this object, see SelfPlayManager.get_stats
+        self.run_sims = 0
+        # per phase timers of the search, None unless profile_search is enabled in config.yaml
+        self.profiler = SearchProfiler() if self.config["profile_search"] else None
+
+    def getActionProb(self, board, canonicalBoard, num_sims, temp=1, use_noise=True, deadline=None):
         """
         This function performs numMCTSSims simulations of MCTS starting from
-        canonicalBoard.
+        canonicalBoard. use_noise=False disables the root noise of self play (fast searches of playout cap randomization).
+        If a deadline (a time.monotonic() value, see search/time_manager.py) is given the search also stops there.
 
         Returns:
             probs: a policy vector where the probability of the ith action is
                    proportional to Nsa[(s,a)]**(1./temp)
         """
-        # removed min(num_MCTS_sims, smartsimnum)
-        for i in range(num_sims):
-            self.search(board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, 1, True)
-
         s = self.game.stringRepresentation(canonicalBoard, is_canonical=True)
+        self.use_noise = use_noise
+
+        # temperature 0 plays the most visited move, so arena and engine searches can stop once it is decided
+        stop_early = temp == 0 and not self.is_self_play and self.config["early_stop_search"]
+
+        if self.config["root_search"] == "gumbel":
+            # the Gumbel noise already samples the move, it is played directly
+            action, _ = self.gumbel_search(board, canonicalBoard, num_sims, use_noise, stop_early, deadline)
+            probs = [0 for _ in range(self.game.getActionSize())]
+            probs[action] = 1
+            return probs
+
+        # visits already made to this node (kept by prune) count towards the simulation budget, the Gumbel search
+        # clears them instead (see gumbel_search)
+        root = self.table.peek(s)
+        if root is not None and root.is_expanded():
+            num_sims -= root.N
 
-        counts = np.array([self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())])
+        # removed min(num_MCTS_sims, smartsimnum)
+        if self.profiler is not None:
+            self.profiler.start_move(self.evaluator)
+        self.run_simulations(board, canonicalBoard, num_sims, stop_early, deadline)
+        if self.profiler is not None:
+            self.profiler.end_move(self.evaluator)
+
+        root = self.table.peek(s)
+        counts = self.root_counts(s)
         valids = self.game.getValidMoves(board)
         self.smartSimNum = 10 * (np.count_nonzero(valids))
 
@@ -77,29 +109,12 @@ class MCTS:
             except:
                 print("temp=0, assert valids[bestA]!=0 !!!")
                 print("current valids:", valids)
-                flag_Qsa = False
-                flag_Nsa = False
-                if s in self.Ps:
-                    print("s in p! Which measn it's been visited, has the probability of each action", self.Ps[s])
-                for _ in range(self.game.getActionSize()):
-                    if (s, _) in self.Nsa:
-                        print(_, "in Nsa! which measn its value is calculated to ", self.Nsa[(s, _)])
-                    else:
-                        flag_Nsa = True
-                        print(_, "no Nsa value, set 0 by default in counts=[...]!")
-
-                    if (s, _) in self.Qsa:
-                        print(_, "in! Qsa with value:", self.Qsa[(s, _)])
-                    else:
-                        flag_Qsa = True
-                        print(_, "no Qsa value")
-
-                    if flag_Nsa and flag_Qsa:
-                        print("no nsa, no qsa")
-                    if flag_Nsa and not flag_Qsa:
-                        print("no nsa, has qsa")
-                    if not flag_Nsa and flag_Qsa:
-                        print("has nsa, no qsa")
+                if root is not None and root.is_expanded():
+                    print("s in table! Which measn it's been visited, has the probability of each action", root.P)
+                    print("Nsa of each action:", root.Nsa)
+                    print("Qsa of each action:", root.Q)
+                else:
+                    print("s not expanded, no nsa, no qsa")
 
                 # print(counts)
             # print(counts)
@@ -128,7 +143,161 @@ class MCTS:
 
         return probs * valids
 
-    def search(self, board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, calls, is_root):
+    def root_counts(self, s):
+        """
+        Returns the visit counts of the actions of the root s after a search, see search/root_parallel.py for the
+        version merging the searches of several processes.
+        """
+        root = self.table.peek(s)
+        if root is not None and root.is_expanded():
+            return root.Nsa.copy()
+        return np.zeros(self.game.getActionSize(), dtype=np.int64)
+
+    def gumbel_search(self, board, canonicalBoard, num_sims, use_noise=True, stop_early=False, deadline=None):
+        """
+        Root search of Gumbel MuZero for small simulation budgets: samples config["gumbel_num_considered"] actions
+        without replacement (Gumbel-top-k, only in self play with use_noise), spreads num_sims simulations over them
+        with sequential halving and keeps the best one. Below the root the search is the usual PUCT search.
+        As in run_simulations, stop_early ends the halving once the selected action is decided, and the search also
+        ends at deadline (the budget shrinks to the simulations that fit before it).
+        Unlike the PUCT search, a root kept by prune does not count its visits towards num_sims: they were allocated
+        by the previous search, so its edge statistics are cleared and the halving, sigma and the improved policy only
+        see visits of this search. The subtrees below the root are kept and still speed up the new simulations.
+
+        Returns:
+            action: the selected action
+            pi: the improved policy softmax(logits + sigma(completed Q)), a training target that is useful even
+                for actions that were never visited
+        """
+        s = self.game.stringRepresentation(canonicalBoard, is_canonical=True)
+        c_visit, c_scale = self.config["gumbel_c_visit"], self.config["gumbel_c_scale"]
+        if self.profiler is not None:
+            self.profiler.start_move(self.evaluator)
+        start_time = time.monotonic()
+        sims_done = 0
+
+        root = self.table.peek(s)
+        if root is None or not root.is_expanded():
+            # the first simulation expands the root
+            self.search(board, 1, True)
+            num_sims -= 1
+            sims_done += 1
+            root = self.table.peek(s)
+        elif root.N > 0:
+            # the root was kept by prune, forget the visits of the previous search (see the docstring)
+            root.N = 0
+            root.Q.fill(0)
+            root.Nsa.fill(0)
+
+        valids = self.game.getValidMoves(board)
+        if not root.is_expanded():
+            # terminal root (both players passed), which self play may still continue from: there is nothing to search
+            if self.profiler is not None:
+                self.profiler.end_move(self.evaluator)
+            return self.game.getActionSize() - 1, valids / np.sum(valids)
+
+        # valid moves may have changed since the root was stored (ko)
+        root.valids = valids
+        actions = np.flatnonzero(root.valids)
+        logits = np.log(root.P[actions] + 1e-12)
+        if use_noise and self.is_self_play:
+            scores = logits + np.random.gumbel(size=len(actions))
+        else:
+            scores = logits.copy()
+
+        # Gumbel-top-k: the considered actions are a sample without replacement from the prior
+        num_considered = min(self.config["gumbel_num_considered"], len(actions))
+        considered = np.argsort(-scores)[:num_considered]
+
+        def sims_left():
+            # simulations left in the budget that still fit before the deadline, estimated at the current rate
+            if deadline is None or sims_done == 0:
+                return num_sims
+            return min(num_sims, self.sims_before_deadline(deadline, start_time, sims_done))
+
+        num_phases = gumbel.num_halving_phases(num_considered)
+        for phase in range(num_phases):
+            remaining_sims = sims_left()
+            if remaining_sims <= 0 or len(considered) == 1:
+                break
+            if stop_early and gumbel.is_decided(scores[considered], root.Q[actions[considered]],
+                                                root.Nsa[actions[considered]], np.max(root.Nsa), remaining_sims,
+                                                c_visit, c_scale):
+                self.saved_sims += remaining_sims
+                break
+            # the last phase gets whatever is left of the budget
+            phases_left = 1 if phase == num_phases - 1 else num_phases - phase
+            if phase == num_phases - 1:
+                sims_per_action = remaining_sims // len(considered)
+            else:
+                sims_per_action = max(1, remaining_sims // (phases_left * len(considered)))
+            for j, i in enumerate(considered):
+                visits = 0
+                while visits < sims_per_action and remaining_sims > 0:
+                    # the actions left in the phase keep their share of what still fits before the deadline
+                    share = (visits + remaining_sims) // (phases_left * (len(considered) - j))
+                    if deadline is not None and visits >= share:
+                        break
+                    self.search(board, 1, True, root_action=actions[i])
+                    num_sims -= 1
+                    sims_done += 1
+                    visits += 1
+                    remaining_sims = sims_left()
+
+            # keep the better half of the considered actions
+            q = gumbel.sigma(root.Q[actions[considered]], np.max(root.Nsa), c_visit, c_scale)
+            considered = considered[np.argsort(-(scores[considered] + q))][:math.ceil(len(considered) / 2)]
+
+        q = gumbel.sigma(root.Q[actions[considered]], np.max(root.Nsa), c_visit, c_scale)
+        action = actions[considered[np.argmax(scores[considered] + q)]]
+
+        completed = gumbel.completed_q(root.v, root.P[actions], root.Q[actions], root.Nsa[actions])
+        pi = np.zeros(self.game.getActionSize())
+        pi[actions] = gumbel.improved_policy(logits, completed, np.max(root.Nsa), c_visit, c_scale)
+        if self.profiler is not None:
+            self.profiler.end_move(self.evaluator)
+        return int(action), pi
+
+    def run_simulations(self, board, canonicalBoard, num_sims, stop_early=False, deadline=None):
+        """
+        Runs num_sims simulations from the root board, see search/parallel_mcts.py for the multi-threaded version.
+        If stop_early is set, the remaining simulations are skipped once the most visited root action is decided.
+        The search also ends at deadline, and simulations that would not fit before it do not count as remaining.
+        """
+        s = self.game.stringRepresentation(canonicalBoard, is_canonical=True)
+        start_time = time.monotonic()
+        for i in range(num_sims):
+            self.search(board, 1, True)
+            remaining_sims = num_sims - i - 1
+            if deadline is not None:
+                remaining_sims = min(remaining_sims, self.sims_before_deadline(deadline, start_time, i + 1))
+                if remaining_sims <= 0:
+                    break
+            if stop_early and self.is_decided(self.table.peek(s), remaining_sims):
+                self.saved_sims += remaining_sims
+                break
+
+    @staticmethod
+    def sims_before_deadline(deadline, start_time, sims_done):
+        """
+        Estimates how many more simulations fit before deadline at the rate of the current search.
+        """
+        now = time.monotonic()
+        if now >= deadline:
+            return 0
+        return int((deadline - now) * sims_done / max(now - start_time, 1e-9))
+
+    @staticmethod
+    def is_decided(root, remaining_sims):
+        """
+        Returns True if no action of root can overtake the most visited one within remaining_sims simulations.
+        """
+        if root is None or not root.is_expanded():
+            return False
+        second, first = np.partition(root.Nsa, -2)[-2:]
+        return first - second > remaining_sims
+
+    def search(self, board, calls, is_root, root_action=None):
         """
         This function performs one iteration of MCTS. It is recursively called
         till a leaf node is found. The action chosen at each node is one that
@@ -144,8 +313,10 @@ class MCTS:
         state. This is done since v is in [-1,1] and if v is the value of a
         state for the current player, then its value is -v for the other player.
 
+        The network input planes are derived from board (see Board.get_canonical_history) at the leaf only.
+
         Returns:
-            v: the negative of the value of the current canonicalBoard
+            v: the negative of the value of the current board
         """
 
         # check if both players passed
@@ -164,96 +335,87 @@ class MCTS:
         # See if game is in a terminal state
         # NOTE: Changed string representation call!
         # s = self.game.stringRepresentation(canonicalBoard)
-        s = self.game.stringRepresentation(canonicalBoard, is_canonical=True)
-        non_canonical_s = self.game.stringRepresentation(board, is_canonical=False)
-
-        if s not in self.Es:
-                # self.Es[s], self.Ss[non_canonical_s] = self.game.getGameEndedSelfPlay(board, True, self)
-                self.Es[s], self.Ss[non_canonical_s] = self.game.getGameEndedArena(board, True, None, None)
-        if self.Es[s] != 0:
-            return -self.Es[s]
+        # the canonical form of a board has the same history and player, it would give the same key
+        s = self.game.stringRepresentation(board, is_canonical=True)
+
+        if is_root:
+            self.run_sims += 1
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.depth(calls)
+            if is_root:
+                profiler.count("simulations")
+
+        node = self.table.get(s)
+        if node is None:
+            if profiler is not None:
+                start = time.perf_counter()
+                profiler.count("nodes_created")
+            node = self.table.add(s)
+            # node.E, node.score = self.game.getGameEndedSelfPlay(board, True, self)
+            node.E, node.score = self.game.getGameEndedArena(board, True, None, None)
+            if profiler is not None:
+                profiler.timed("scoring", start)
+        if node.E != 0:
+            return -node.E
 
         # See if recursion limit has been reached
         if calls > 500:
             return 1e-4
 
-        # Get current game history if terminal state not found
-        if calls > 1:
-            canonicalHistory, x_boards, y_boards = self.game.getCanonicalHistory(copy.deepcopy(x_boards),
-                                                                                 copy.deepcopy(y_boards),
-                                                                                 canonicalBoard, player_board)
-
         # If current state is a leaf node, add this to the tree
-        if s not in self.Ps:
+        if not node.is_expanded():
             # print("leaf node")
+            if profiler is not None:
+                start = time.perf_counter()
+            # game history of the leaf, interior nodes never need it
+            nnet_input = board.get_canonical_history()
+            if profiler is not None:
+                profiler.timed("history", start)
+                start = time.perf_counter()
             if self.is_self_play:
-                self.Ps[s], v = self.nnet.predict(canonicalHistory)  # changed from board.pieces
+                P, v = self.evaluate(nnet_input)  # changed from board.pieces
             else:
-                self.Ps[s], v = self.predict(board)  # changed from board.pieces
+                P, v = self.predict(board, nnet_input)  # changed from board.pieces
+            if profiler is not None:
+                profiler.timed("nn_eval", start)
+                start = time.perf_counter()
             valids = self.game.getValidMoves(board)
-            self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
-            sum_Ps_s = np.sum(self.Ps[s])
+            P = P * valids  # masking invalid moves
+            sum_Ps_s = np.sum(P)
             if sum_Ps_s > 0:
-                self.Ps[s] /= sum_Ps_s  # renormalize
+                P /= sum_Ps_s  # renormalize
             else:
                 # if all valid moves were masked make all valid moves equally probable
 
                 # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
                 # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.
-                self.Ps[s] = self.Ps[s] + valids
-                self.Ps[s] /= np.sum(self.Ps[s])
+                P = P + valids
+                P /= np.sum(P)
 
-            self.Vs[s] = valids
-            self.Ns[s] = 0
+            node.expand(P, valids, np.asarray(v).item())
+            if profiler is not None:
+                profiler.timed("expand", start)
 
             # do not use score threshold in MCTS
-            if s not in self.Es:
-                # self.Es[s], self.Ss[non_canonical_s] = self.game.getGameEndedSelfPlay(board, True, self)
-                self.Es[s], self.Ss[non_canonical_s] = self.game.getGameEndedArena(board, True, None, None)
-                gameEnd = self.Es[s]
-            else:
-                gameEnd = self.Es[s]
-            if gameEnd != 0:
-                return -gameEnd
-            return -v
+            return -node.v
 
         # Current state is not a leaf node
-        valids = self.Vs[s]
-        cur_best = -float('inf')
-        best_act = -1
-        # pick the action with the highest upper confidence bound
-        # add noise for root node prior probabilities (encourages exploration)
-        if is_root and self.is_self_play:
-            noise = np.random.dirichlet([0.03] * len(self.game.filter_valid_moves(valids)))
-
-        i = -1
-        for a in range(self.game.getActionSize()):
-            if valids[a] != 0:
-                i += 1
-                if (s, a) in self.Qsa and self.Qsa[(s, a)] != None:
-                    q = self.Qsa[(s, a)]
-                    n_sa = self.Nsa[(s, a)]
-                    """u = self.Qsa[(s, a)] + self.config["c_puct"] * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                                1 + self.Nsa[(s, a)])"""
-                else:
-                    q = 0
-                    n_sa = 0
-                    # u = self.config["c_puct"] * self.Ps[s][a] * math.sqrt(self.Ns[s])  # Q = 0 ?
-
-                p = self.Ps[s][a]
-                # add noise for root node prior probabilities (encourages exploration)
-                if is_root and self.is_self_play:
-                    p = (1 - 0.25) * p + 0.25 * noise[i]
-                u = q + self.config["c_puct"] * p * math.sqrt(self.Ns[s]) / (1 + n_sa)
-                if u > cur_best:
-                    cur_best = u
-                    best_act = a
-
-        a = best_act
+        if profiler is not None:
+            start = time.perf_counter()
+        valids = node.valids
+        # root_action forces the action played at the root, see gumbel_search
+        if is_root and root_action is not None:
+            a = root_action
+        else:
+            a = self.select_action(node, valids, is_root)
+        if profiler is not None:
+            profiler.timed("select", start)
+            start = time.perf_counter()
         """if a == 49:
             print("-------------Passed on call #", calls, "------------------")
             print("Valids used to pass: ", valids)
-            print("Probs used to pass: ", self.Ps[s])"""
+            print("Probs used to pass: ", node.P)"""
         assert (valids[a] != 0)
         # print("in MCTS.search, need next search, shifting player from 1")
 
@@ -262,38 +424,10 @@ class MCTS:
             # print("in MCTS.search, need next search, next player is {}".format(next_player))
         except:
             # print("###############在search内部节点出现错误：###########")
-            # print("action:{},valids:{},Vs:{}".format(a,valids,self.Vs[s]))
+            # print("action:{},valids:{},Vs:{}".format(a,valids,node.valids))
             valids = self.game.getValidMoves(board)
-            self.Vs[s] = valids
-            cur_best = -float('inf')
-            best_act = -1
-
-            if is_root and self.is_self_play:
-                noise = np.random.dirichlet([0.03] * len(self.game.filter_valid_moves(valids)))
-
-            i = -1
-            for a in range(self.game.getActionSize()):
-                if valids[a] != 0:
-                    i += 1
-                    if (s, a) in self.Qsa and self.Qsa[(s, a)] != None:
-                        q = self.Qsa[(s, a)]
-                        n_sa = self.Nsa[(s, a)]
-                        """u = self.Qsa[(s, a)] + self.config["c_puct"] * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                                    1 + self.Nsa[(s, a)])"""
-                    else:
-                        q = 0
-                        n_sa = 0
-                        # u = self.config["c_puct"] * self.Ps[s][a] * math.sqrt(self.Ns[s])  # Q = 0 ?
-
-                    p = self.Ps[s][a]
-                    if is_root and self.is_self_play:
-                        p = (1 - 0.25) * p + 0.25 * noise[i]
-                    u = q + self.config["c_puct"] * p * math.sqrt(self.Ns[s]) / (1 + n_sa)
-                    if u > cur_best:
-                        cur_best = u
-                        best_act = a
-
-            a = best_act
+            node.valids = valids
+            a = self.select_action(node, valids, is_root)
             # print("recalculate the valids vector:{} ".format(valids))
             # try:
             next_s = self.game.getNextState(board, a)
@@ -301,36 +435,79 @@ class MCTS:
             #     print(f"RETURNING Exception -- Tried Action {a}")
             #     return
 
-        next_s_canonical = self.game.getCanonicalForm(next_s, next_s.current_player)
-
-        if 1 in player_board[0]:
-            player_board = (np.zeros((7, 7)), np.ones((7, 7)))
-        else:
-            player_board = (np.ones((7, 7)), np.zeros((7, 7)))
+        if profiler is not None:
+            profiler.timed("next_state", start)
 
         calls += 1
-        x_boards, y_boards = y_boards, x_boards
-
-        v = self.search(next_s, next_s_canonical, canonicalHistory, x_boards, y_boards, player_board, calls, False)
 
-        if (s, a) in self.Qsa:
-            assert (valids[a] != 0)
-            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
-            self.Nsa[(s, a)] += 1
-        else:
-            self.Qsa[(s, a)] = v
-            self.Nsa[(s, a)] = 1
+        v = self.search(next_s, calls, False)
 
-        self.Ns[s] += 1
+        if profiler is not None:
+            start = time.perf_counter()
+        assert (valids[a] != 0)
+        node.Q[a] = (node.Nsa[a] * node.Q[a] + v) / (node.Nsa[a] + 1)
+        node.Nsa[a] += 1
+        node.N += 1
+        if profiler is not None:
+            profiler.timed("backup", start)
 
         return -v
-    
-    def predict(self, board):
+
+    def select_action(self, node, valids, is_root):
+        """
+        Returns the valid action of node with the highest upper confidence bound.
+        """
+        cur_best = -float('inf')
+        best_act = -1
+        # add noise for root node prior probabilities (encourages exploration)
+        if is_root and self.is_self_play and self.use_noise:
+            noise = np.random.dirichlet([0.03] * len(self.game.filter_valid_moves(valids)))
+
+        i = -1
+        for a in range(self.game.getActionSize()):
+            if valids[a] != 0:
+                i += 1
+                # Q = 0 and Nsa = 0 for edges that have not been visited yet
+                q = node.Q[a]
+                n_sa = node.Nsa[a]
+
+                p = node.P[a]
+                # add noise for root node prior probabilities (encourages exploration)
+                if is_root and self.is_self_play and self.use_noise:
+                    p = (1 - 0.25) * p + 0.25 * noise[i]
+                u = q + self.config["c_puct"] * p * math.sqrt(node.N) / (1 + n_sa)
+                if u > cur_best:
+                    cur_best = u
+                    best_act = a
+
+        return best_act
+
+    def create_evaluator(self, nnet):
+        """
+        Wraps nnet (an Evaluator or an NNetWrapper) in the evaluation cache of the process when it is enabled.
+        """
+        evaluator = nnet if isinstance(nnet, Evaluator) else NetworkEvaluator(nnet)
+        # network evaluations shared with every other MCTS of the process, None if disabled in config.yaml
+        evaluation_cache = get_evaluation_cache(self.config, self.game.getActionSize())
+        if evaluation_cache is not None:
+            evaluator = CachingEvaluator(evaluator, evaluation_cache, self.game.n,
+                                         self.config["evaluation_cache_symmetry"])
+        return evaluator
+
+    def evaluate(self, nnet_input):
+        """
+        Returns the policy and value of nnet_input.
+        """
+        return self.evaluator.evaluate(nnet_input)
+
+    def predict(self, board, nnet_input=None):
+        if nnet_input is None:
+            nnet_input = board.get_canonical_history()
+
         # randomly rotate and flip before network predict
         r = np.random.randint(8)
-        nnet_input = board.get_canonical_history()
         nnet_input = board.rotate_history(r, nnet_input)
-        pi, v = self.nnet.predict(nnet_input)
+        pi, v = self.evaluator.evaluate(nnet_input)
 
         # policy need to rotate and flip back
         pi_board = np.reshape(pi[:-1], (self.game.n, self.game.n))
@@ -343,16 +520,30 @@ class MCTS:
     
 
     def checkScoreCache(self, board):
-        non_canonical_s = self.game.stringRepresentation(board, is_canonical=False)
-        if non_canonical_s not in self.Ss:
+        s = self.game.stringRepresentation(board, is_canonical=True)
+        node = self.table.peek(s)
+        if node is None:
             return False, None
         else:
-            return True, self.Ss[non_canonical_s]
+            return True, node.score
+
+    def prune(self, board):
+        """
+        Promotes the node for board to the root of the tree after a move has been played.
+        Every entry outside of the subtree of board is freed, statistics gathered for the
+        chosen child are kept so they count towards the next search.
+
+        String representations are built from the move history, so the subtree of board
+        is exactly the set of keys that start with the (non-canonical) representation of board.
+        """
+        self.table.retain(self.game.stringRepresentation(board, is_canonical=False))
 
     def clear(self):
-        self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
-        self.Nsa = {}  # stores #times edge s,a was visited
-        self.Ns = {}  # stores #times board s was visited
-        self.Ps = {}  # stores initial policy (returned by neural net)
-        self.Es = {}  # stores game.getGameEnded ended for board s
-        self.Vs = {}  # stores game.getValidMoves for board s
\ No newline at end of file
+        self.table.clear()
+        self.saved_sims = 0
+
+    def close(self):
+        """
+        Releases the threads or processes of the parallel searches, the sequential search has none.
+        """
+        pass
@@ -1,12 +1,18 @@
+import copy
 import math
 
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.utils.model_zoo as model_zoo
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 from torchvision.models.resnet import ResNet
 
 __all__ = ['ResNet']
 
+# heads of AlphaNet, selected with network_head in config.yaml
+HEADS = ("fc", "pool")
+
 model_urls = {
     'resnet18': 'https://download.pytorch.org/models/resnet18-5c106cde.pth',
     'resnet34': 'https://download.pytorch.org/models/resnet34-333f7ec4.pth',
@@ -22,6 +28,23 @@ def conv3x3(in_planes, out_planes, stride=1):
                      padding=1, bias=False)
 
 
+def fuse_conv_bn(module, conv_name, bn_name):
+    """
+    Folds the batch norm module.bn_name (with its running statistics) into the convolution module.conv_name before it,
+    the batch norm is replaced by an identity. Only valid in eval mode.
+    """
+    fused = fuse_conv_bn_eval(getattr(module, conv_name), getattr(module, bn_name))
+    setattr(module, conv_name, fused)
+    setattr(module, bn_name, nn.Identity())
+
+
+def fuse_downsample(downsample):
+    # the downsample of _make_layer is Sequential(conv, batch norm)
+    if downsample is None:
+        return None
+    return nn.Sequential(fuse_conv_bn_eval(downsample[0], downsample[1]))
+
+
 class AlphaBottleneck(nn.Module):
     expansion = 4
 
@@ -60,6 +83,17 @@ class AlphaBottleneck(nn.Module):
 
         return out
 
+    def fuse_for_inference(self):
+        """
+        Returns a copy of the block in eval mode with every batch norm folded into its convolution
+        """
+        fused = copy.deepcopy(self).eval()
+        fuse_conv_bn(fused, 'conv1', 'bn1')
+        fuse_conv_bn(fused, 'conv2', 'bn2')
+        fuse_conv_bn(fused, 'conv3', 'bn3')
+        fused.downsample = fuse_downsample(fused.downsample)
+        return fused
+
 
 class AlphaBlock(nn.Module):
     expansion = 1
@@ -92,18 +126,117 @@ class AlphaBlock(nn.Module):
 
         return out
 
+    def fuse_for_inference(self):
+        """
+        Returns a copy of the block in eval mode with every batch norm folded into its convolution
+        """
+        fused = copy.deepcopy(self).eval()
+        fuse_conv_bn(fused, 'conv1', 'bn1')
+        fuse_conv_bn(fused, 'conv2', 'bn2')
+        fused.downsample = fuse_downsample(fused.downsample)
+        return fused
+
+
+class GlobalPool(nn.Module):
+    """
+    Mean and maximum of every channel over the board: (batch, channels, n, n) -> (batch, 2 * channels)
+    """
+
+    def __init__(self):
+        super(GlobalPool, self).__init__()
+        # pooling modules rather than tensor methods, FX graph mode quantization has int8 kernels for them
+        self.mean = nn.AdaptiveAvgPool2d(1)
+        self.max = nn.AdaptiveMaxPool2d(1)
+
+    def forward(self, x):
+        return torch.flatten(torch.cat([self.mean(x), self.max(x)], dim=1), 1)
+
+
+class PoolPolicyHead(nn.Module):
+    """
+    Fully convolutional policy head (KataGo style): one logit per intersection from a 1x1 convolution, biased per
+    channel by globally pooled features, and the pass logit from the pooled features. Has no weights tied to the board
+    size, returns (batch, n * n + 1) logits, pass last.
+    """
+
+    def __init__(self, inplanes, planes=32):
+        super(PoolPolicyHead, self).__init__()
+        self.conv_p = nn.Conv2d(inplanes, planes, kernel_size=1, bias=False)
+        self.bn_p = nn.BatchNorm2d(planes)
+        self.conv_g = nn.Conv2d(inplanes, planes, kernel_size=1, bias=False)
+        self.bn_g = nn.BatchNorm2d(planes)
+        self.relu = nn.ReLU(inplace=True)
+        self.pool = GlobalPool()
+        self.fc_g = nn.Linear(2 * planes, planes)
+        self.conv_out = nn.Conv2d(planes, 1, kernel_size=1)
+        self.fc_pass = nn.Linear(2 * planes, 1)
+
+    def forward(self, x):
+        g = self.relu(self.bn_g(self.conv_g(x)))
+        g = self.pool(g)
+
+        # the batch norm comes before the pooled bias (after it in KataGo), so that it can be folded into conv_p
+        p = self.bn_p(self.conv_p(x))
+        p = self.relu(p + self.fc_g(g).unsqueeze(2).unsqueeze(3))
+
+        return torch.cat([torch.flatten(self.conv_out(p), 1), self.fc_pass(g)], dim=1)
+
+    def fuse_for_inference(self):
+        """
+        Returns a copy of the head in eval mode with every batch norm folded into its convolution
+        """
+        fused = copy.deepcopy(self).eval()
+        fuse_conv_bn(fused, 'conv_p', 'bn_p')
+        fuse_conv_bn(fused, 'conv_g', 'bn_g')
+        return fused
+
+
+class PoolValueHead(nn.Module):
+    """
+    Global pooling value head (KataGo style): a 1x1 convolution pooled over the board, then two linear layers. Has no
+    weights tied to the board size, returns (batch, 1) values before the tanh.
+    """
+
+    def __init__(self, inplanes, planes=32, hidden=64):
+        super(PoolValueHead, self).__init__()
+        self.conv = nn.Conv2d(inplanes, planes, kernel_size=1, bias=False)
+        self.bn = nn.BatchNorm2d(planes)
+        self.relu = nn.ReLU(inplace=True)
+        self.pool = GlobalPool()
+        self.fc1 = nn.Linear(2 * planes, hidden)
+        self.fc2 = nn.Linear(hidden, 1)
+
+    def forward(self, x):
+        v = self.relu(self.bn(self.conv(x)))
+        v = self.relu(self.fc1(self.pool(v)))
+        return self.fc2(v)
+
+    def fuse_for_inference(self):
+        """
+        Returns a copy of the head in eval mode with its batch norm folded into its convolution
+        """
+        fused = copy.deepcopy(self).eval()
+        fuse_conv_bn(fused, 'conv', 'bn')
+        return fused
+
 
 class AlphaNet(ResNet):
-    def __init__(self, game, layers):
+    def __init__(self, game, layers, head="fc"):
         block = AlphaBlock
+        if head not in HEADS:
+            raise KeyError(
+                f"Network head '{head}' is not supported. Please check config.yaml for supported network heads.")
+        self.head = head
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
+        # input planes declared by the feature encoder of the game (see go/feature_encoder.py)
+        self.num_planes = game.encoder.num_planes
         outputShift = 1 if self.board_x in [6, 7, 11] else 4
         self.inplanes = 128  # changed from 64
 
         super(ResNet, self).__init__()
 
-        self.conv1 = nn.Conv2d(19, 128, kernel_size=5, stride=1, padding=2,
+        self.conv1 = nn.Conv2d(self.num_planes, 128, kernel_size=5, stride=1, padding=2,
                                bias=False)
         self.bn1 = nn.BatchNorm2d(128)
         self.relu = nn.ReLU(inplace=True)
@@ -112,11 +245,16 @@ class AlphaNet(ResNet):
         self.layer2 = self._make_layer(block, 128, layers[1])  # stride = 2
         self.layer3 = self._make_layer(block, 128, layers[2])
         self.layer4 = self._make_layer(block, 128, layers[3])
-        self.avgpool = nn.AvgPool2d(3, stride=1)  # changed from 2
-        # self.avgpool = nn.AdaptiveAvgPool2d() #changed from 2
-        self.fc_p = nn.Linear(3200 * block.expansion * outputShift,
-                              self.action_size)  # changed from 512*block.expansion*outputShift, self.action_size
-        self.fc_v = nn.Linear(3200 * block.expansion * outputShift, 1)
+        if self.head == "fc":
+            self.avgpool = nn.AvgPool2d(3, stride=1)  # changed from 2
+            # self.avgpool = nn.AdaptiveAvgPool2d() #changed from 2
+            self.fc_p = nn.Linear(3200 * block.expansion * outputShift,
+                                  self.action_size)  # changed from 512*block.expansion*outputShift, self.action_size
+            self.fc_v = nn.Linear(3200 * block.expansion * outputShift, 1)
+        else:
+            # same weights for every board size, a checkpoint of one board size loads into the network of another
+            self.policy_head = PoolPolicyHead(128 * block.expansion)
+            self.value_head = PoolValueHead(128 * block.expansion)
 
         for m in self.modules():
             if isinstance(m, nn.Conv2d):
@@ -125,6 +263,11 @@ class AlphaNet(ResNet):
             elif isinstance(m, nn.BatchNorm2d):
                 m.weight.data.fill_(1)
                 m.bias.data.zero_()
+        if self.head == "pool":
+            # the fan out init above is far too wide for a convolution with one output channel, the move logits of
+            # an untrained network would span hundreds (and int8 quantization could not resolve them)
+            conv_out = self.policy_head.conv_out
+            conv_out.weight.data.normal_(0, math.sqrt(1. / conv_out.in_channels))
 
     def _make_layer(self, block, planes, blocks, stride=1):
         downsample = None
@@ -145,7 +288,11 @@ class AlphaNet(ResNet):
 
     def forward(self, x):
         # print("forward")
-        x = x.view(-1, 19, self.board_x, self.board_y)
+        if self.head == "fc":
+            x = x.view(-1, self.num_planes, self.board_x, self.board_y)
+        else:
+            # the board size of the input, the pool heads are not tied to the one of the game
+            x = x.view(-1, self.num_planes, x.size(-2), x.size(-1))
         # print("Before conv1:", x.size())
         x = self.conv1(x)
         # print("After conv1:", x.size())
@@ -161,13 +308,17 @@ class AlphaNet(ResNet):
         x = self.layer4(x)
         # print("After layer4:", x.size())
 
+        if self.head == "pool":
+            return F.log_softmax(self.policy_head(x), dim=1), F.tanh(self.value_head(x))
+
         try:
             x = self.avgpool(x)
         except:
             pass
         # print("After avgpool:", x.size())
 
-        x = x.view(x.size(0), -1)
+        # flatten instead of view, quantized convolutions return channels last tensors
+        x = torch.flatten(x, 1)
         # print("After view:", x.size())
         p = self.fc_p(x)
         v = self.fc_v(x)
@@ -175,11 +326,30 @@ class AlphaNet(ResNet):
         # print("After v:", v.size())
         return F.log_softmax(p, dim=1), F.tanh(v)
 
+    def fuse_for_inference(self):
+        """
+        Returns an inference only copy of the network: in eval mode, with the batch norm of the stem and of every block
+        folded into the convolution before it. The batch norm statistics are frozen outside of training, so the outputs
+        match the network in eval mode up to float rounding. The copy does not follow later changes of the weights.
+        """
+        fused = copy.deepcopy(self).eval()
+        fuse_conv_bn(fused, 'conv1', 'bn1')
+        for name in ('layer1', 'layer2', 'layer3', 'layer4'):
+            setattr(fused, name, nn.Sequential(*[block.fuse_for_inference() for block in getattr(fused, name)]))
+        if fused.head == "pool":
+            fused.policy_head = fused.policy_head.fuse_for_inference()
+            fused.value_head = fused.value_head.fuse_for_inference()
+        for parameter in fused.parameters():
+            parameter.requires_grad_(False)
+        return fused
+
 
 class AlphaNetMaker:
-    def __init__(self, game):
+    def __init__(self, game, head="fc"):
         self.n, self.n = game.getBoardSize()
         self.game = game
+        # head of the networks, see HEADS
+        self.head = head
 
     def makeNet(self):
         if self.n <= 11:
@@ -195,7 +365,7 @@ class AlphaNetMaker:
         Args:
             pretrained (bool): If True, returns a model pre-trained on ImageNet
         """
-        model = AlphaNet(game, [2, 2, 2, 2])
+        model = AlphaNet(game, [2, 2, 2, 2], self.head)
         if pretrained:
             model.load_state_dict(model_zoo.load_url(model_urls['resnet18']))
         return model
@@ -206,7 +376,7 @@ class AlphaNetMaker:
         Args:
             pretrained (bool): If True, returns a model pre-trained on ImageNet
         """
-        model = AlphaNet(game, [3, 4, 6, 3])
+        model = AlphaNet(game, [3, 4, 6, 3], self.head)
         if pretrained:
             model.load_state_dict(model_zoo.load_url(model_urls['resnet34']))
         return model
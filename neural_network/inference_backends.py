@@ -0,0 +1,111 @@
+import importlib.util
+import inspect
+import io
+import warnings
+
+import torch
+
+"""
+Backends running the forward pass of NNetWrapper.predict_batch, selected with inference_backend in config.yaml:
+    eager: the torch module as it is (NNetWrapper passes its inference_module, batch norms already folded)
+    torchscript: the module traced, frozen and optimized for inference (batch norms folded into the convolutions)
+    onnx: the module exported to ONNX and run by onnxruntime, an optional dependency (pip install onnx onnxruntime),
+        in float32 only (the quantized operators of torch have no ONNX export)
+
+A backend is built from the weights of the module at the time, NNetWrapper rebuilds it whenever its version changes.
+Every backend takes a float32 tensor of shape (batch, planes, board_x, board_y) and returns the log policies and the
+values as tensors.
+"""
+
+BACKENDS = ("eager", "torchscript", "onnx")
+# python packages a backend needs besides torch
+BACKEND_REQUIREMENTS = {"onnx": ("onnx", "onnxruntime")}
+
+
+class EagerBackend:
+    def __init__(self, module, example):
+        self.module = module
+
+    def __call__(self, boards):
+        return self.module(boards)
+
+
+class TorchScriptBackend:
+    def __init__(self, module, example):
+        self.module = to_torchscript(module, example, optimize=True)
+
+    def __call__(self, boards):
+        return self.module(boards)
+
+
+class OnnxBackend:
+    def __init__(self, module, example):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("inference_backend 'onnx' needs onnxruntime, install it with: pip install onnx onnxruntime")
+
+        model = io.BytesIO()
+        export_onnx(module, example, model)
+        self.session = onnxruntime.InferenceSession(model.getvalue(), providers=["CPUExecutionProvider"])
+
+    def __call__(self, boards):
+        log_pi, v = self.session.run(None, {"planes": boards.cpu().numpy()})
+        return torch.from_numpy(log_pi), torch.from_numpy(v)
+
+
+def check_backend(name):
+    """
+    Raises an error if the backend called name is not supported or its optional dependencies are not installed, so a
+    misconfigured backend fails when it is selected rather than at the first forward pass.
+    """
+    if name not in BACKENDS:
+        raise KeyError(f"Inference backend '{name}' is not supported. Please check config.yaml for supported backends.")
+    missing = [package for package in BACKEND_REQUIREMENTS.get(name, ()) if importlib.util.find_spec(package) is None]
+    if missing:
+        raise ImportError(f"inference_backend '{name}' needs {' and '.join(missing)}, install it with: "
+                          f"pip install {' '.join(BACKEND_REQUIREMENTS[name])}")
+
+
+def create_backend(name, module, example):
+    """
+    Returns the backend called name for module (in eval mode), example is an input tensor of the right shape.
+    """
+    if name == "eager":
+        return EagerBackend(module, example)
+    elif name == "torchscript":
+        return TorchScriptBackend(module, example)
+    elif name == "onnx":
+        return OnnxBackend(module, example)
+    raise KeyError(f"Inference backend '{name}' is not supported. Please check config.yaml for supported backends.")
+
+
+def to_torchscript(module, example, optimize=False):
+    """
+    Returns module traced with example and frozen. Freezing inlines the weights as constants, which lets the batch norm
+    layers be folded into the convolutions before them. The batch size stays dynamic.
+    optimize also applies torch.jit.optimize_for_inference (MKLDNN layouts on CPU), the result cannot be saved.
+    """
+    with warnings.catch_warnings():
+        # torch.jit is deprecated in recent torch versions but still the way to get a frozen, portable module
+        warnings.simplefilter("ignore", FutureWarning)
+        # traced under bfloat16 autocast, the check of the trace reports the rounding of bfloat16 as mismatches
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example)
+        frozen = torch.jit.freeze(traced)
+        if optimize:
+            return torch.jit.optimize_for_inference(frozen)
+        return frozen
+
+
+def export_onnx(module, example, f):
+    """
+    Writes module as an ONNX model with a dynamic batch size to f (a path or a file object).
+    """
+    # the TorchScript based exporter, newer torch versions default to the torch.export based one (needs onnxscript)
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(module, example, f, input_names=["planes"], output_names=["log_pi", "v"],
+                          dynamic_axes={"planes": {0: "batch"}, "log_pi": {0: "batch"}, "v": {0: "batch"}},
+                          do_constant_folding=True, **kwargs)
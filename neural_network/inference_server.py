@@ -0,0 +1,159 @@
+import multiprocessing as mp
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+
+from go.feature_encoder import FeatureEncoder
+from go.go_game import GoGame
+from neural_network.neural_net_wrapper import NNetWrapper
+from neural_network.torch_threads import configure_torch_threads
+from search.evaluators import Evaluator
+
+"""
+Inference server shared by the game processes of a worker pool (see training/worker.py).
+
+Instead of every process of the pool loading its own copy of the network and evaluating one position at a time,
+one server process owns the network and the game processes send it their positions through InferenceClient.
+The server gathers the positions of several clients into one batch: it evaluates once max_batch positions are
+waiting, every connected client is waiting for an answer, or the first position of the batch has waited max_wait.
+"""
+
+# how often an idle server looks for clients that connected in the meantime, in seconds
+IDLE_POLL = 0.05
+
+
+class InferenceServer:
+    """
+    Starts the server process for the network stored at folder/filename. Clients connect to address with authkey.
+    """
+
+    def __init__(self, config, folder, filename):
+        self.authkey = os.urandom(16)
+        self.control, server_control = mp.Pipe()
+        self.process = mp.Process(target=_serve, args=(config, folder, filename, self.authkey, server_control),
+                                  daemon=True)
+        self.process.start()
+        # the server sends the address of its socket once the network is loaded
+        self.address = self.control.recv()
+
+    def client_args(self):
+        """
+        Returns the arguments of InferenceClient, they can be passed to other processes.
+        """
+        return self.address, self.authkey
+
+    def close(self):
+        self.control.send(None)
+        self.process.join()
+
+
+class InferenceClient(Evaluator):
+    """
+    Evaluator sending the positions of one game process to an InferenceServer and waiting for the results.
+    """
+
+    def __init__(self, address, authkey):
+        self.connection = Client(address, family='AF_UNIX', authkey=authkey)
+        # the server identifies its network when a client connects
+        self._version = self.connection.recv()
+
+    @property
+    def version(self):
+        return self._version
+
+    def evaluate(self, planes):
+        pis, vs = self.evaluate_batch(np.asarray(planes)[np.newaxis])
+        return pis[0], vs[:1]
+
+    def evaluate_batch(self, planes_batch):
+        # the input planes are binary, uint8 sends a quarter of the bytes of float32
+        self.connection.send(np.asarray(planes_batch, dtype=np.uint8))
+        result = self.connection.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        self.connection.close()
+
+
+def _serve(config, folder, filename, authkey, control):
+    """
+    Main function of the server process.
+    """
+    # the game processes only search, the server gets the cores they leave
+    configure_torch_threads(config, role="server")
+    nnet = NNetWrapper(GoGame(config["board_size"], encoder=FeatureEncoder.from_config(config)), config)
+    nnet.load_checkpoint(folder, filename)
+    max_batch = config["inference_server_max_batch"]
+    max_wait = config["inference_server_wait_ms"] / 1000
+
+    listener = Listener(family='AF_UNIX', authkey=authkey)
+    connections = []
+    connections_lock = threading.Lock()
+    threading.Thread(target=_accept_clients, args=(listener, nnet.version, connections, connections_lock),
+                     daemon=True).start()
+    control.send(listener.address)
+
+    # requests of the batch being gathered, as (connection, planes) pairs
+    pending = []
+    deadline = None
+    while True:
+        with connections_lock:
+            clients = list(connections)
+        timeout = IDLE_POLL if deadline is None else max(deadline - time.monotonic(), 0)
+        for connection in wait(clients + [control], timeout):
+            if connection is control:
+                listener.close()
+                return
+            try:
+                pending.append((connection, connection.recv()))
+            except (EOFError, OSError):
+                _remove_client(connection, connections, connections_lock)
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+
+        if not pending:
+            continue
+        # clients wait for their answer before sending again, once all of them are waiting no request can join
+        if (sum(len(planes) for _, planes in pending) < max_batch and len(pending) < len(clients)
+                and time.monotonic() < deadline):
+            continue
+
+        try:
+            pis, vs = nnet.predict_batch(np.concatenate([planes for _, planes in pending]))
+            results = np.split(np.arange(len(pis)), np.cumsum([len(planes) for _, planes in pending])[:-1])
+            results = [(pis[indices], vs[indices]) for indices in results]
+        except Exception as e:
+            results = [e] * len(pending)
+
+        for (connection, _), result in zip(pending, results):
+            try:
+                connection.send(result)
+            except OSError:
+                _remove_client(connection, connections, connections_lock)
+        pending = []
+        deadline = None
+
+
+def _accept_clients(listener, version, connections, connections_lock):
+    while True:
+        try:
+            connection = listener.accept()
+        except OSError:
+            # the listener was closed
+            return
+        connection.send(version)
+        with connections_lock:
+            connections.append(connection)
+
+
+def _remove_client(connection, connections, connections_lock):
+    connection.close()
+    with connections_lock:
+        if connection in connections:
+            connections.remove(connection)
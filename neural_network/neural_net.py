@@ -36,6 +36,18 @@ class NeuralNet:
         """
         pass
 
+    def predict_batch(self, boards):
+        """
+        Input:
+            boards: a numpy array of shape (batch, planes, board_x, board_y) holding the input planes of
+                    several boards, of any numeric dtype
+
+        Returns:
+            pis: the policy vectors of the boards, a numpy array of shape (batch, game.getActionSize)
+            vs: the values in [-1,1] of the boards, a numpy array of shape (batch,)
+        """
+        pass
+
     def save_checkpoint(self, folder, filename):
         """
         Saves the current neural network (with its parameters) in
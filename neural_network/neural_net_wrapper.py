@@ -1,6 +1,9 @@
+import hashlib
 import os
 import sys
 import time
+import uuid
+import warnings
 from collections import OrderedDict
 
 import numpy as np
@@ -9,7 +12,10 @@ import torch
 import torch.optim as optim
 from torch.autograd import Variable
 
+from neural_network.inference_backends import check_backend, create_backend, export_onnx, to_torchscript
 from neural_network.neural_net import NeuralNet
+from neural_network.quantization import load_calibration_boards, quantize_dynamic, quantize_static
+from neural_network.torch_threads import configure_torch_threads
 from pytorch_classification.utils import Bar, AverageMeter
 from .go_alphanet import AlphaNetMaker as NetMaker
 from .go_alphanet_deprecated import AlphaNetMakerDeprecated
@@ -24,10 +30,14 @@ class NNetWrapper(NeuralNet):
         super().__init__(game)
 
         self.config = config
+        # before the first forward pass, the inter-op threads cannot change afterwards
+        configure_torch_threads(self.config)
+        # the backend is built lazily (see inference_backend), fail now if it cannot be
+        check_backend(self.config["inference_backend"])
 
         self.netType = self.config["network_type"]
         if self.netType == 'RES':
-            netMkr = NetMaker(game)
+            netMkr = NetMaker(game, self.config["network_head"])
             self.nnet = netMkr.makeNet()
         elif self.netType == 'CNN':
             self.nnet = GoNNet(game, self.config)
@@ -37,11 +47,26 @@ class NNetWrapper(NeuralNet):
 
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
+        self.num_planes = game.encoder.num_planes
 
         if torch.cuda.is_available():
             self.nnet.cuda()
+        self.device = next(self.nnet.parameters()).device
+        # the network stays in eval mode outside of train, predict_batch does not switch it on every call
+        self.nnet.eval()
 
         self.lrs = []
+        # identifies the current weights, used to tag cached evaluations (see search/evaluation_cache.py)
+        self.version = uuid.uuid4().hex
+        # runs the forward pass of predict_batch, built for the weights of backend_version (see inference_backend)
+        self.backend = None
+        self.backend_version = None
+        # dtype of the forward pass of the backend, None for float32 (see inference_dtype)
+        self.backend_dtype = None
+        # checkpoint file (path, inode, size, modification time) and version last loaded, see load_checkpoint
+        self.loaded_file = None
+        # positions observed by static quantization, taken from the stored train examples when None
+        self.calibration_boards = None
 
     def train(self, examples):
         """
@@ -88,9 +113,10 @@ class NNetWrapper(NeuralNet):
                     temp_boards[i] = np.stack(temp_boards[i])
                 boards = tuple(temp_boards)
 
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
+                # stacked straight into float32, without a float64 copy in between
+                boards = torch.from_numpy(np.array(boards, dtype=np.float32))
+                target_pis = torch.from_numpy(np.array(pis, dtype=np.float32))
+                target_vs = torch.from_numpy(np.array(vs, dtype=np.float32))
 
                 # predict
                 if torch.cuda.is_available():
@@ -156,6 +182,10 @@ class NNetWrapper(NeuralNet):
             trainLog['V_LOSS'].append(v_losses.avg)
             bar.finish()
 
+        self.nnet.eval()
+        # weights changed, evaluations of the previous weights must not be reused
+        self.version = uuid.uuid4().hex
+
         """
         #Code to see how learning rates change with each epoch/batch when 
         # using cosine annealing
@@ -172,23 +202,133 @@ class NNetWrapper(NeuralNet):
 
     def predict(self, board_list):
         """
-        board: np array with board
+        board_list: the input planes of one position (list of board_x x board_y arrays)
+        returns its policy (action_size,) and value (1,)
         """
-        # preparing input
-        board = np.stack(board_list)
-        # print("stack length: ", len(board))
-        board = torch.FloatTensor(board.astype(np.float64))
-        # print("stack length2: ", len(board))
-        if torch.cuda.is_available(): board = board.contiguous().cuda()
-        board = Variable(board, requires_grad=False)
-        # print("stack length3: ", len(board))
-        board = board.view(19, self.board_x, self.board_y)
-        # print("stack length4: ", len(board))
+        # stacked straight into float32, a batch of one
+        pis, vs = self.predict_batch(np.asarray(board_list, dtype=np.float32)[np.newaxis])
+        return pis[0], vs[:1]
 
-        self.nnet.eval()
+    def predict_batch(self, boards):
+        """
+        boards: np array of shape (batch, planes, board_x, board_y), of any numeric dtype (uint8, float32, ...)
+        returns the policies (batch, action_size) and values (batch,) of every position in one forward pass
+        """
+        # shares the memory of the array, the only copy is the conversion to float32 (if needed) on the device
+        boards = torch.from_numpy(np.ascontiguousarray(boards)).to(self.device, dtype=torch.float32)
+
+        # train() leaves eval mode on, this only catches callers that switched the network to training themselves
+        if self.nnet.training:
+            self.nnet.eval()
 
-        pi, v = self.nnet(board)
-        return torch.exp(pi).data.cpu().numpy()[0], v.data.cpu().numpy()[0]
+        backend = self.inference_backend()
+        with torch.inference_mode(), self.autocast():
+            pi, v = backend(boards)
+        # the outputs are bfloat16 with inference_dtype bfloat16
+        return torch.exp(pi.float()).cpu().numpy(), v.float().cpu().numpy().reshape(-1)
+
+    def inference_backend(self):
+        """
+        Returns the backend selected by inference_backend in config.yaml (see neural_network/inference_backends.py),
+        it is rebuilt when the weights change
+        """
+        if self.backend is None or self.backend_version != self.version:
+            self.backend_dtype = self.inference_dtype()
+            quantization = None
+            if self.config["inference_backend"] == "onnx" and self.config["inference_quantization"] != "none":
+                print("[LOG]: inference_quantization does not apply to the onnx backend, using float32.")
+                quantization = "none"
+            # a torchscript backend records the casts of autocast when it is traced
+            with self.autocast():
+                self.backend = create_backend(self.config["inference_backend"], self.inference_module(quantization),
+                                              self.example_input())
+            self.backend_version = self.version
+        return self.backend
+
+    def inference_dtype(self):
+        """
+        Returns the dtype the forward pass is autocast to as selected by inference_dtype in config.yaml, None for
+        float32 or if the device does not support it
+        """
+        dtype = self.config["inference_dtype"]
+        if dtype == "float32":
+            return None
+        elif dtype != "bfloat16":
+            raise KeyError(f"Inference dtype '{dtype}' is not supported. Please check config.yaml for supported dtypes.")
+
+        if self.config["inference_backend"] == "onnx" or (self.config["inference_quantization"] != "none"
+                                                         and self.device.type == "cpu"):
+            print("[LOG]: inference_dtype 'bfloat16' does not apply to onnx or quantized inference, using float32.")
+            return None
+        if self.device.type == "cuda":
+            supported = torch.cuda.is_bf16_supported()
+        else:
+            # needs AVX512-BF16 or AMX to be faster than float32, otherwise the oneDNN kernels emulate it
+            supported = torch.ops.mkldnn._is_mkldnn_bf16_supported()
+        if not supported:
+            print(f"[LOG]: inference_dtype 'bfloat16' is not supported on this {self.device.type}, using float32.")
+            return None
+        return torch.bfloat16
+
+    def autocast(self):
+        # disabled (a no-op) for float32
+        return torch.autocast(self.device.type, dtype=self.backend_dtype, enabled=self.backend_dtype is not None)
+
+    def inference_module(self, quantization=None):
+        """
+        Returns the network prepared for inference: with its batch norms folded into the convolutions (a copy, see
+        AlphaNet.fuse_for_inference) if the network supports it, else the network itself in eval mode, and quantized
+        to int8 as selected by quantization or else inference_quantization in config.yaml (see
+        neural_network/quantization.py)
+        """
+        if quantization is None:
+            quantization = self.config["inference_quantization"]
+        if quantization != "none" and self.device.type != "cpu":
+            print(f"[LOG]: inference_quantization '{quantization}' only runs on the CPU, using float32 on {self.device}.")
+            quantization = "none"
+
+        if quantization == "static":
+            if self.calibration_boards is None:
+                self.calibration_boards = load_calibration_boards(self.config["quantization_calibration_positions"])
+            if self.calibration_boards is not None:
+                # the quantization fuses the batch norms itself
+                return quantize_static(self.nnet, self.example_input(), self.calibration_boards)
+            print("[LOG]: No train examples to calibrate static quantization with, using dynamic quantization.")
+            quantization = "dynamic"
+
+        if hasattr(self.nnet, "fuse_for_inference"):
+            module = self.nnet.fuse_for_inference()
+        else:
+            module = self.nnet.eval()
+        if quantization == "dynamic":
+            return quantize_dynamic(module)
+        elif quantization != "none":
+            raise KeyError(f"Inference quantization '{quantization}' is not supported. "
+                           f"Please check config.yaml for supported quantization modes.")
+        return module
+
+    def example_input(self, batch_size=1):
+        return torch.zeros(batch_size, self.num_planes, self.board_x, self.board_y, device=self.device)
+
+    def export_torchscript(self, folder='R_checkpoint', filename='R_checkpoint.pt'):
+        """
+        Saves the float32 network traced, frozen and with its batch norms folded, it can be loaded without this code base
+        with torch.jit.load
+        """
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            module = to_torchscript(self.inference_module(quantization="none"), self.example_input())
+            torch.jit.save(module, os.path.join(folder, filename))
+
+    def export_onnx(self, folder='R_checkpoint', filename='R_checkpoint.onnx'):
+        """
+        Saves the float32 network as an ONNX model with a dynamic batch size (input "planes", outputs "log_pi" and "v")
+        """
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        export_onnx(self.inference_module(quantization="none"), self.example_input(), os.path.join(folder, filename))
 
     def loss_pi(self, targets, outputs):
         #return -torch.sum(targets * outputs) / targets.size()[0]
@@ -205,9 +345,13 @@ class NNetWrapper(NeuralNet):
             os.mkdir(folder)
         # else:
         #     print("Checkpoint Directory exists! ")
+        # written next to the checkpoint and renamed over it: processes that memory mapped the previous file (see
+        # load_checkpoint) keep reading its pages instead of a truncated file
+        temp_filepath = filepath + ".tmp"
         torch.save({
             'state_dict': self.nnet.state_dict(),
-        }, filepath)
+        }, temp_filepath)
+        os.replace(temp_filepath, filepath)
 
     # use cpu_only for maximum compatibility with slowest performance
     def load_checkpoint(self, folder='R_checkpoint', filename='R_checkpoint.pth.tar', cpu_only=False):
@@ -216,14 +360,38 @@ class NNetWrapper(NeuralNet):
         if not os.path.exists(filepath):
             raise BaseException("No model in path {}".format(filepath))
 
+        # the file was not replaced since it was loaded and the weights did not change since (no training)
+        stat = os.stat(filepath)
+        loaded_file = (filepath, stat.st_ino, stat.st_size, stat.st_mtime_ns, self.version)
+        if loaded_file == self.loaded_file:
+            return
+        version = checkpoint_version(filepath)
+        # the weights in the file are already loaded (best.pth.tar did not change since the last game batch)
+        if version == self.version:
+            self.loaded_file = loaded_file[:-1] + (version,)
+            return
+
         # if cpu_only:
         # Load with CPU as the device if CUDA is not available
-        if not torch.cuda.is_available():
-            checkpoint = torch.load(filepath, map_location=torch.device('cpu'))
-        else:
-            checkpoint = torch.load(filepath)
-
-        self.nnet.load_state_dict(checkpoint['state_dict'])
+        try:
+            # checkpoints written by torch.save are zip files whose tensors can be memory mapped: the weights are read
+            # from the page cache without a copy, and every process loading the file shares its pages until it writes
+            # to them (copy on write)
+            checkpoint = torch.load(filepath, map_location=self.device, mmap=True, weights_only=True)
+        except RuntimeError:
+            # legacy checkpoints (not zip files) cannot be memory mapped
+            checkpoint = torch.load(filepath, map_location=self.device)
+
+        # the weights are swapped in place into the existing network, assign keeps the memory mapped tensors
+        # instead of copying them into the current parameters (on a GPU they are copies anyway)
+        try:
+            self.nnet.load_state_dict(checkpoint['state_dict'], assign=self.device.type == 'cpu')
+        except RuntimeError as e:
+            # the usual cause is a checkpoint trained with the other network_head
+            raise RuntimeError(f"Checkpoint {filepath} does not fit the network. "
+                               f"Please check config.yaml for the network_head it was trained with.") from e
+        self.version = version
+        self.loaded_file = loaded_file[:-1] + (version,)
 
     # use cpu_only for maximum compatibility with slowest performance
     def load_checkpoint_from_plain_to_parallel(self, folder='R_checkpoint', filename='R_checkpoint.pth.tar',
@@ -244,6 +412,7 @@ class NNetWrapper(NeuralNet):
             name = "module." + k  # add 'module.' of dataparallel, so it works with examples from plain model
             new_state_dict[name] = v
         self.nnet.load_state_dict(new_state_dict)
+        self.version = checkpoint_version(filepath)
 
     def load_checkpoint_without_sens_layer(self, folder='R_checkpoint', filename='R_checkpoint.pth.tar',
                                                cpu_only=True):
@@ -258,4 +427,16 @@ class NNetWrapper(NeuralNet):
         else:
             checkpoint = torch.load(filepath)
 
-        self.nnet.load_state_dict(checkpoint['state_dict'])
\ No newline at end of file
+        self.nnet.load_state_dict(checkpoint['state_dict'])
+        self.version = checkpoint_version(filepath)
+
+
+def checkpoint_version(filepath):
+    """
+    Returns a hash of the content of the checkpoint file, so the same weights always map to the same version.
+    """
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(2 ** 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
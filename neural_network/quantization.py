@@ -0,0 +1,83 @@
+import copy
+import glob
+import os
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from definitions import EXAMPLES_PATH
+from utils.data_serializer import load_obj_from_disk
+
+"""
+Int8 quantized inference on the CPU, selected with inference_quantization in config.yaml:
+    none: float32 weights and activations
+    dynamic: the linear layers of the heads with int8 weights, their activations quantized on the fly
+    static: every convolution and linear layer in int8 (FX graph mode quantization), the activation ranges are
+            calibrated on stored train examples first
+
+Quantized modules only run on the CPU. The result of static quantization depends on the calibration positions,
+NNetWrapper takes them from the most recent train examples in EXAMPLES_PATH unless they are given.
+"""
+
+QUANTIZATION_MODES = ("none", "dynamic", "static")
+
+
+def quantize_dynamic(module):
+    """
+    Returns a copy of module (in eval mode) with int8 weights in every linear layer.
+    """
+    select_engine()
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in recent torch versions in favour of torchao, which is not a dependency
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(module).eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(module, example, calibration_boards, batch_size=64):
+    """
+    Returns a copy of module (in eval mode, the quantization fuses the batch norms itself) with int8 convolutions,
+    linear layers and activations. calibration_boards is a float32 array of shape (positions, planes, board_x,
+    board_y), the ranges of the activations are observed on them.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = select_engine()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        prepared = prepare_fx(copy.deepcopy(module).eval(), get_default_qconfig_mapping(engine), (example,))
+        with torch.inference_mode():
+            for start in range(0, len(calibration_boards), batch_size):
+                prepared(torch.from_numpy(calibration_boards[start:start + batch_size]))
+        return convert_fx(prepared)
+
+
+def select_engine():
+    """
+    Selects the quantized kernels for this CPU (x86 or fbgemm on x86, qnnpack on ARM) and returns their name.
+    """
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("int8 quantization is not supported by this build of torch")
+
+
+def load_calibration_boards(count, folder=EXAMPLES_PATH, seed=0):
+    """
+    Returns up to count positions drawn from the most recent train examples file in folder, as a float32 array of
+    shape (positions, planes, board_x, board_y), or None if there are no train examples.
+    """
+    files = glob.glob(os.path.join(folder, '*.examples'))
+    if not files:
+        return None
+    # train examples are (board history, pi, v), see TrainExampleManager
+    examples = list(load_obj_from_disk(max(files, key=os.path.getmtime)))
+    if not examples:
+        return None
+    indices = np.random.RandomState(seed).permutation(len(examples))[:count]
+    return np.stack([np.stack(examples[i][0]) for i in indices]).astype(np.float32)
@@ -0,0 +1,70 @@
+import multiprocessing as mp
+import os
+
+import torch
+
+"""
+Intra-op and inter-op threads of torch per process, set from torch_threads and torch_interop_threads in config.yaml.
+
+By default torch starts one intra-op thread per core in every process. A worker pool of num_parallel_games processes,
+each running its own network, then runs num_parallel_games times as many threads as there are cores and spends its
+time switching between them. torch_threads "auto" divides the cores of the machine by the role of the process:
+    main: a process owning the machine (the trainer, the engine, debug scripts) gets every core
+    game: a game process of a worker pool evaluating its own positions gets its share of the cores
+    server: an inference server (see neural_network/inference_server.py) gets the cores left after one core per game
+            process, which only search while the server evaluates their positions
+"""
+
+ROLES = ("main", "game", "server")
+
+# pid of the process the threads were configured in, a forked process has to configure its own
+_configured_pid = None
+
+
+def available_cores():
+    # cores this process may run on, which can be fewer than the machine has (taskset, containers)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_role():
+    # the processes of a multiprocessing pool are daemons, a main process is not
+    return "game" if mp.current_process().daemon else "main"
+
+
+def auto_threads(config, role):
+    """
+    Returns the intra-op threads of torch_threads "auto" for a process of role (see ROLES).
+    """
+    cores = available_cores()
+    if role == "main":
+        return cores
+    elif role == "game":
+        return max(1, cores // config["num_parallel_games"])
+    elif role == "server":
+        return max(1, cores - config["num_parallel_games"])
+    raise KeyError(f"Thread role '{role}' is not supported, expected one of {ROLES}.")
+
+
+def configure_torch_threads(config, role=None):
+    """
+    Sets the threads of torch in this process as selected in config.yaml, only the first call of a process has an
+    effect (the inter-op threads cannot change once used). role defaults to "game" in a pool and "main" otherwise.
+    Returns the number of intra-op threads.
+    """
+    global _configured_pid
+    if _configured_pid == os.getpid():
+        return torch.get_num_threads()
+    _configured_pid = os.getpid()
+
+    threads = config["torch_threads"]
+    if threads == "auto":
+        threads = auto_threads(config, role or default_role())
+    torch.set_num_threads(int(threads))
+    try:
+        torch.set_num_interop_threads(int(config["torch_interop_threads"]))
+    except RuntimeError:
+        # inter-op work already ran in this process (torch was used before the network was created), keep them
+        pass
+    return torch.get_num_threads()
@@ -0,0 +1,242 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+"""
+Caches for neural network evaluations (pi, v) that outlive a single MCTS tree.
+Entries are keyed by a hash of the network input planes and tagged with the version of the network
+that produced them (see NNetWrapper.version), so a new best.pth.tar never serves stale evaluations.
+"""
+
+# process level cache, shared by every MCTS object created in the same process
+_process_cache = None
+
+# number of network versions kept by EvaluationCache, arena games query two networks at once
+MAX_NETWORK_VERSIONS = 2
+
+
+def position_key(planes):
+    """
+    Returns a 16 byte digest of the network input planes of a position.
+    """
+    stacked = np.ascontiguousarray(np.stack(planes), dtype=np.float32)
+    return hashlib.blake2b(stacked.tobytes(), digest_size=16).digest()
+
+
+def symmetric_position_key(planes):
+    """
+    Returns the smallest digest over the 8 dihedral transforms of the planes, together with the transform r
+    that produced it. Symmetric positions share a key, policies must be stored in the frame of transform r
+    (see transform_policy) and mapped back with inverse_transform_policy on lookup.
+    Transform r matches Board.rotate_history: rotate by r % 4 quarter turns, then flip left/right if r >= 4.
+    """
+    stacked = np.ascontiguousarray(np.stack(planes), dtype=np.float32)
+    best_key, best_r = None, 0
+    for r in range(8):
+        transformed = np.rot90(stacked, r % 4, axes=(1, 2))
+        if r >= 4:
+            transformed = transformed[:, :, ::-1]
+        key = hashlib.blake2b(np.ascontiguousarray(transformed).tobytes(), digest_size=16).digest()
+        if best_key is None or key < best_key:
+            best_key, best_r = key, r
+    return best_key, best_r
+
+
+def transform_policy(pi, n, r):
+    """
+    Applies transform r to the board part of the policy vector pi, the pass move is left untouched.
+    """
+    if r == 0:
+        return np.asarray(pi)
+    pi_board = np.rot90(np.reshape(pi[:-1], (n, n)), r % 4)
+    if r >= 4:
+        pi_board = np.fliplr(pi_board)
+    return np.append(pi_board.ravel(), pi[-1])
+
+
+def inverse_transform_policy(pi, n, r):
+    """
+    Undoes transform_policy(pi, n, r).
+    """
+    if r == 0:
+        return np.asarray(pi)
+    pi_board = np.reshape(pi[:-1], (n, n))
+    if r >= 4:
+        pi_board = np.fliplr(pi_board)
+    pi_board = np.rot90(pi_board, 4 - r % 4)
+    return np.append(pi_board.ravel(), pi[-1])
+
+
+def get_evaluation_cache(config, action_size, shared_name=None):
+    """
+    Returns the evaluation cache of the current process as specified in config.yaml, or None if caching is disabled.
+    If shared_name is given, the process attaches to the SharedEvaluationCache created under that name instead,
+    later calls without a name keep returning the attached cache.
+    """
+    global _process_cache
+
+    if not config["use_evaluation_cache"]:
+        return None
+
+    if _process_cache is None or (shared_name is not None and getattr(_process_cache, "name", None) != shared_name):
+        if shared_name is not None:
+            _process_cache = SharedEvaluationCache(action_size, config["evaluation_cache_entries"], name=shared_name)
+        else:
+            _process_cache = EvaluationCache(config["evaluation_cache_entries"])
+
+    return _process_cache
+
+
+class EvaluationCache:
+    """
+    In-process LRU cache of network evaluations. Only the MAX_NETWORK_VERSIONS most recently queried network
+    versions are kept: once a new best.pth.tar is loaded, the entries of the oldest version are dropped.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.network_versions = OrderedDict()
+        # ParallelMCTS queries the cache from several search threads
+        self.lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def get(self, network_version, key):
+        """
+        Returns the cached (pi, v) of key for network_version or None on a miss.
+        """
+        with self.lock:
+            self._check_version(network_version)
+            self.lookups += 1
+            entry = self.entries.get((network_version, key))
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end((network_version, key))
+            return entry
+
+    def put(self, network_version, key, pi, v):
+        with self.lock:
+            self._check_version(network_version)
+            self.entries[(network_version, key)] = (pi, v)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "hit_rate": self.hits / self.lookups if self.lookups > 0 else 0.0,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+        }
+
+    def reset_stats(self):
+        """
+        Restarts the statistics, the worker calls it at the start of every task (see Worker.report_evaluation_cache).
+        """
+        with self.lock:
+            self.lookups = 0
+            self.hits = 0
+            self.evictions = 0
+
+    def _check_version(self, network_version):
+        if network_version in self.network_versions:
+            self.network_versions.move_to_end(network_version)
+            return
+
+        self.network_versions[network_version] = None
+        if len(self.network_versions) > MAX_NETWORK_VERSIONS:
+            stale_version, _ = self.network_versions.popitem(last=False)
+            self.entries = OrderedDict((k, e) for k, e in self.entries.items() if k[0] != stale_version)
+
+
+class SharedEvaluationCache:
+    """
+    Evaluation cache living in a multiprocessing.shared_memory block so that every process of a worker pool
+    can read the evaluations of the others. The table is direct mapped: a new entry replaces whatever was
+    stored in its slot, which stands in for LRU eviction without needing a lock shared between processes.
+
+    Each slot ends with a digest of its key, version and payload. Readers copy the slot once and only accept it
+    if the digest matches the copy, which discards slots that are being rewritten by other processes at the same
+    time, including a mix of the payloads of two processes writing the same slot at once.
+    """
+
+    def __init__(self, action_size, num_slots, name=None):
+        self.slot_dtype = np.dtype([('key', 'V16'), ('version', 'V16'), ('pi', np.float32, (action_size,)),
+                                    ('v', np.float32), ('check', 'V16')])
+        if name is None:
+            self.shared_memory = SharedMemory(create=True, size=num_slots * self.slot_dtype.itemsize)
+            self.is_owner = True
+        else:
+            self.shared_memory = SharedMemory(name=name)
+            self.is_owner = False
+
+        self.name = self.shared_memory.name
+        self.slots = np.ndarray((num_slots,), dtype=self.slot_dtype, buffer=self.shared_memory.buf)
+        if self.is_owner:
+            np.ndarray((self.shared_memory.size,), dtype=np.uint8, buffer=self.shared_memory.buf).fill(0)
+
+        self.lookups = 0
+        self.hits = 0
+
+    def get(self, network_version, key):
+        self.lookups += 1
+        index = self._slot_index(key)
+        # a single copy of the slot, validated as a whole by its digest
+        record = self.slots[index:index + 1].tobytes()
+        payload, check = record[:-16], record[-16:]
+        if payload[:16] != key or payload[16:32] != self._version_bytes(network_version):
+            return None
+        if hashlib.blake2b(payload, digest_size=16).digest() != check:
+            return None
+        slot = np.frombuffer(record, dtype=self.slot_dtype)[0]
+        self.hits += 1
+        return slot['pi'].copy(), np.array([slot['v']])
+
+    def put(self, network_version, key, pi, v):
+        record = np.zeros(1, dtype=self.slot_dtype)
+        record['key'] = key
+        record['version'] = self._version_bytes(network_version)
+        record['pi'] = pi
+        record['v'] = np.asarray(v).reshape(-1)[0]
+        record['check'] = hashlib.blake2b(record.tobytes()[:-16], digest_size=16).digest()
+        index = self._slot_index(key)
+        self.slots[index:index + 1] = record
+
+    def stats(self):
+        return {
+            "hit_rate": self.hits / self.lookups if self.lookups > 0 else 0.0,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "slots": len(self.slots),
+        }
+
+    def reset_stats(self):
+        """
+        Restarts the statistics of this process, see EvaluationCache.reset_stats.
+        """
+        self.lookups = 0
+        self.hits = 0
+
+    def close(self):
+        """
+        Detaches from the shared memory block, the creating process also frees it.
+        """
+        self.slots = None
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
+
+    def _slot_index(self, key):
+        return int.from_bytes(key[:8], "little") % len(self.slots)
+
+    @staticmethod
+    def _version_bytes(network_version):
+        return bytes.fromhex(network_version)
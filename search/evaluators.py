@@ -0,0 +1,154 @@
+import numpy as np
+
+from search.evaluation_cache import position_key, symmetric_position_key, transform_policy, inverse_transform_policy
+
+"""
+Evaluators turn the network input planes of a position into a policy and a value for MCTS.
+MCTS accepts either an Evaluator or an NNetWrapper, which it wraps in a NetworkEvaluator.
+"""
+
+# identity of evaluators that do not depend on trained weights, a valid network version (see NNetWrapper.version)
+STATIC_VERSION = "00" * 16
+
+
+class Evaluator:
+    """
+    This class specifies the base Evaluator class. To plug a new source of evaluations into MCTS (a stub, a remote
+    inference client, ...) subclass this class and implement the functions below.
+    """
+
+    @property
+    def version(self):
+        """
+        Returns:
+            version: a 32 character hex string identifying the weights behind the evaluations. It is part of the
+                     evaluation cache keys, so it has to change whenever the evaluations of a position change.
+        """
+        pass
+
+    def evaluate(self, planes):
+        """
+        Input:
+            planes: the network input planes of a position (see Board.get_canonical_history)
+
+        Returns:
+            pi: a policy vector for the position, a numpy array of length game.getActionSize
+            v: a numpy array of shape (1,) holding the value in [-1,1] of the position for the player to move
+        """
+        pass
+
+    def evaluate_batch(self, planes_batch):
+        """
+        Input:
+            planes_batch: numpy array of shape (batch, planes, board_x, board_y)
+
+        Returns:
+            pis: numpy array of shape (batch, action_size)
+            vs: numpy array of shape (batch,)
+        """
+        pass
+
+
+class NetworkEvaluator(Evaluator):
+    """
+    Evaluates positions with an NNetWrapper. The version follows the weights loaded into the network.
+    """
+
+    def __init__(self, nnet):
+        self.nnet = nnet
+
+    @property
+    def version(self):
+        return self.nnet.version
+
+    def evaluate(self, planes):
+        return self.nnet.predict(planes)
+
+    def evaluate_batch(self, planes_batch):
+        return self.nnet.predict_batch(np.asarray(planes_batch))
+
+
+class UniformEvaluator(Evaluator):
+    """
+    Stub returning a uniform policy and a value of 0 without running a network, for benchmarks and tests of the search.
+    """
+
+    def __init__(self, action_size):
+        self.action_size = action_size
+
+    @property
+    def version(self):
+        return STATIC_VERSION
+
+    def evaluate(self, planes):
+        return np.full(self.action_size, 1 / self.action_size), np.zeros(1)
+
+    def evaluate_batch(self, planes_batch):
+        batch_size = len(planes_batch)
+        return np.full((batch_size, self.action_size), 1 / self.action_size), np.zeros(batch_size)
+
+
+class CachingEvaluator(Evaluator):
+    """
+    Serves repeated positions from an EvaluationCache or SharedEvaluationCache (see search/evaluation_cache.py)
+    and forwards the other ones to the wrapped evaluator. With use_symmetry all 8 symmetries of a position share
+    one cache entry: a position may then get the transformed evaluation of a symmetric twin, and since the network is
+    not exactly equivariant the search results change, which is why evaluation_cache_symmetry is opt-in.
+    """
+
+    def __init__(self, evaluator, cache, board_size, use_symmetry):
+        self.evaluator = evaluator
+        self.cache = cache
+        self.board_size = board_size
+        self.use_symmetry = use_symmetry
+
+        # lookups made through this evaluator, the cache itself may be shared with other evaluators
+        self.lookups = 0
+        self.hits = 0
+
+    @property
+    def version(self):
+        return self.evaluator.version
+
+    def evaluate(self, planes):
+        key, r = self.cache_key(planes)
+        cached = self.lookup(key, r)
+        if cached is not None:
+            return cached
+        pi, v = self.evaluator.evaluate(planes)
+        self.cache.put(self.version, key, transform_policy(np.asarray(pi), self.board_size, r), v)
+        return pi, v
+
+    def evaluate_batch(self, planes_batch):
+        keys = [self.cache_key(planes) for planes in planes_batch]
+        results = [self.lookup(key, r) for key, r in keys]
+
+        # evaluate the cache misses in one batch
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            pis, vs = self.evaluator.evaluate_batch(np.asarray(planes_batch)[misses])
+            for i, pi, v in zip(misses, pis, vs):
+                key, r = keys[i]
+                self.cache.put(self.version, key, transform_policy(pi, self.board_size, r), np.array([v]))
+                results[i] = (pi, np.array([v]))
+
+        return np.stack([pi for pi, _ in results]), np.array([np.asarray(v).item() for _, v in results])
+
+    def lookup(self, key, r):
+        """
+        Returns the cached (pi, v) of key in the frame of the position it was computed for, None on a miss.
+        """
+        self.lookups += 1
+        cached = self.cache.get(self.version, key)
+        if cached is None:
+            return None
+        self.hits += 1
+        return inverse_transform_policy(cached[0], self.board_size, r), cached[1]
+
+    def cache_key(self, planes):
+        """
+        Returns the cache key of planes and the transform r of the frame the cached policy is stored in.
+        """
+        if self.use_symmetry:
+            return symmetric_position_key(planes)
+        return position_key(planes), 0
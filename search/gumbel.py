@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+"""
+Helpers for the Gumbel root search of MCTS.gumbel_search, following "Policy improvement by planning with Gumbel"
+(Danihelka et al., 2022). Only the root uses them: the considered actions are sampled without replacement with the
+Gumbel-top-k trick, sequential halving spreads the simulations over them, and the training target is the improved
+policy softmax(logits + sigma(completed Q)).
+"""
+
+
+def sigma(q, max_visits, c_visit, c_scale):
+    """
+    Monotone transform of the Q values (in [-1, 1]) to the scale of the logits.
+    """
+    return (c_visit + max_visits) * c_scale * (np.asarray(q) + 1) / 2
+
+
+def mixed_value(root_value, prior, q, visits):
+    """
+    Estimates the value of the root from the network value and the Q values of the visited actions.
+    Used as the Q value of the actions that were not visited.
+    """
+    total_visits = np.sum(visits)
+    if total_visits == 0:
+        return root_value
+    visited = visits > 0
+    visited_prior = np.sum(prior[visited])
+    if visited_prior <= 0:
+        return root_value
+    weighted_q = np.sum(prior[visited] * q[visited]) / visited_prior
+    return (root_value + total_visits * weighted_q) / (1 + total_visits)
+
+
+def completed_q(root_value, prior, q, visits):
+    """
+    Returns q with the actions that were not visited filled in with the mixed value of the root.
+    """
+    return np.where(visits > 0, q, mixed_value(root_value, prior, q, visits))
+
+
+def improved_policy(logits, completed, max_visits, c_visit, c_scale):
+    """
+    Returns softmax(logits + sigma(completed Q)) over the given actions.
+    """
+    scores = logits + sigma(completed, max_visits, c_visit, c_scale)
+    scores = np.exp(scores - np.max(scores))
+    return scores / np.sum(scores)
+
+
+def is_decided(scores, q, visits, max_visits, remaining_sims, c_visit, c_scale):
+    """
+    Returns True if no considered action can overtake the best one (by scores + sigma(q)) within remaining_sims more
+    simulations, whatever actions they visit and whatever values they back up.
+    """
+    visits = np.asarray(visits, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    # Q values after remaining_sims more visits that all back up -1 (or 1), unchanged if the action stays unvisited
+    reach = np.maximum(visits + remaining_sims, 1)
+    lowest_q = (visits * q - remaining_sims) / reach
+    highest_q = (visits * q + remaining_sims) / reach
+    # sigma grows with the visits of the most visited action, the best one is bounded with its current value
+    best = np.argmax(scores + sigma(q, max_visits, c_visit, c_scale))
+    lowest = scores[best] + sigma(lowest_q[best], max_visits, c_visit, c_scale)
+    highest = scores + sigma(highest_q, max_visits + remaining_sims, c_visit, c_scale)
+    return lowest > np.max(np.delete(highest, best))
+
+
+def num_halving_phases(num_considered):
+    """
+    Returns the number of sequential halving phases needed to narrow num_considered actions down to one.
+    """
+    return max(1, math.ceil(math.log2(num_considered)))
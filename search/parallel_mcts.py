@@ -0,0 +1,285 @@
+import math
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from mcts import MCTS
+from search.evaluators import Evaluator, NetworkEvaluator
+from search.root_parallel import RootParallelMCTS
+
+# number of locks the nodes of the tree are striped over
+NUM_NODE_LOCKS = 64
+# whether this process already logged that root parallelism is unavailable in pool processes
+_warned_root_parallel = False
+
+
+class BatchedPredictor(Evaluator):
+    """
+    Runs the wrapped evaluator on a dedicated thread. Search threads call evaluate, which blocks until the
+    evaluation is done; requests that arrive within max_wait seconds of each other are evaluated as one batch
+    with evaluator.evaluate_batch. torch releases the GIL during the forward pass, so search threads keep
+    descending the tree meanwhile.
+    """
+
+    def __init__(self, evaluator, max_batch_size, max_wait):
+        self.evaluator = evaluator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def version(self):
+        return self.evaluator.version
+
+    def evaluate(self, planes):
+        future = Future()
+        self.requests.put((planes, future))
+        return future.result()
+
+    def evaluate_batch(self, planes_batch):
+        # already a batch, evaluate it directly rather than queueing its positions one by one
+        return self.evaluator.evaluate_batch(planes_batch)
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+
+            # gather more requests until the batch is full or the deadline has passed
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+
+            try:
+                pis, vs = self.evaluator.evaluate_batch(np.stack([np.stack(planes) for planes, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for i, (_, future) in enumerate(batch):
+                future.set_result((pis[i], vs[i:i + 1]))
+
+
+class ParallelMCTS(MCTS):
+    """
+    Tree-parallel MCTS: config["num_search_threads"] threads run simulations on one shared tree.
+
+    Nodes are protected by a set of striped locks, a thread holds the lock of a node only while it selects
+    an action or updates the statistics of the node. Virtual loss discourages threads from following each
+    other down the same path: every action on the path of a simulation in flight counts as
+    config["virtual_loss"] extra visits that were all lost, until the simulation backs up its real value.
+
+    Only the board based path of MCTS.search (is_self_play=False) is supported, which is what arena games
+    and the engine use.
+    """
+
+    def __init__(self, game, nnet, is_self_play, config=None):
+        super().__init__(game, nnet, is_self_play, config)
+        self.num_threads = self.config["num_search_threads"]
+        self.virtual_loss = self.config["virtual_loss"]
+        # the profiler instruments the sequential MCTS.search and is not shared between threads
+        self.profiler = None
+
+        self.executor = ThreadPoolExecutor(self.num_threads)
+        self.table_lock = threading.Lock()
+        self.node_locks = [threading.Lock() for _ in range(NUM_NODE_LOCKS)]
+        self.sims_lock = threading.Lock()
+        self.remaining_sims = 0
+
+    def run_simulations(self, board, canonicalBoard, num_sims, stop_early=False, deadline=None):
+        self.remaining_sims = num_sims
+        root_s = self.game.stringRepresentation(canonicalBoard, is_canonical=True)
+        start_time = time.monotonic()
+        futures = [self.executor.submit(self._simulation_loop, board, root_s, num_sims, stop_early, deadline, start_time)
+                   for _ in range(self.num_threads)]
+        # re-raises exceptions of the search threads
+        for future in futures:
+            future.result()
+
+    def create_evaluator(self, nnet):
+        # batch below the evaluation cache, so that cache hits return without waiting for a batch
+        evaluator = nnet if isinstance(nnet, Evaluator) else NetworkEvaluator(nnet)
+        self.batched_predictor = BatchedPredictor(evaluator, self.config["num_search_threads"],
+                                                  self.config["search_batch_wait_ms"] / 1000)
+        return super().create_evaluator(self.batched_predictor)
+
+    def close(self):
+        self.executor.shutdown()
+        self.batched_predictor.close()
+
+    def _simulation_loop(self, board, root_s, num_sims, stop_early, deadline, start_time):
+        while True:
+            with self.sims_lock:
+                if self.remaining_sims <= 0:
+                    return
+                remaining_sims = self.remaining_sims
+                if deadline is not None:
+                    sims_started = num_sims - self.remaining_sims
+                    if sims_started > 0:
+                        remaining_sims = min(remaining_sims,
+                                             self.sims_before_deadline(deadline, start_time, sims_started))
+                    if time.monotonic() >= deadline:
+                        self.remaining_sims = 0
+                        return
+                # simulations still in flight on other threads may also change the visit counts
+                if stop_early and self.is_decided(self.table.peek(root_s), remaining_sims + self.num_threads):
+                    self.saved_sims += remaining_sims
+                    self.remaining_sims = 0
+                    return
+                self.remaining_sims -= 1
+                self.run_sims += 1
+            self.simulate(board)
+
+    def simulate(self, root_board):
+        """
+        Iterative version of MCTS.search: descends from root_board applying virtual loss, evaluates the leaf
+        and backs up the value along the path.
+        """
+        path = []
+        board = root_board
+        calls = 1
+
+        while True:
+            s = self.game.stringRepresentation(board, is_canonical=True)
+            node = self._get_or_add_node(s, board)
+
+            if node.E != 0:
+                v = -node.E
+                break
+
+            # See if recursion limit has been reached
+            if calls > 500:
+                v = 1e-4
+                break
+
+            a = None
+            with self._node_lock(s):
+                if node.is_expanded():
+                    a = self.select_action_with_virtual_loss(node, node.valids, calls == 1)
+                    node.VL[a] += self.virtual_loss
+            if a is None:
+                v = self._expand(node, s, board)
+                break
+
+            try:
+                next_board = self.game.getNextState(board, a)
+            except:
+                # ko may have changed since the valid moves of s were stored, recompute them and pick again
+                with self._node_lock(s):
+                    node.VL[a] -= self.virtual_loss
+                    node.valids = self.game.getValidMoves(board)
+                    a = self.select_action_with_virtual_loss(node, node.valids, calls == 1)
+                    node.VL[a] += self.virtual_loss
+                next_board = self.game.getNextState(board, a)
+
+            path.append((node, s, a))
+            board = next_board
+            calls += 1
+
+        for node, s, a in reversed(path):
+            with self._node_lock(s):
+                node.VL[a] -= self.virtual_loss
+                node.Q[a] = (node.Nsa[a] * node.Q[a] + v) / (node.Nsa[a] + 1)
+                node.Nsa[a] += 1
+                node.N += 1
+            v = -v
+
+    def select_action_with_virtual_loss(self, node, valids, is_root):
+        """
+        Same rule as MCTS.select_action, computed on statistics that include the virtual losses in flight.
+        """
+        n_sa = node.Nsa + node.VL
+        q = np.where(n_sa > 0, (node.Nsa * node.Q - node.VL) / np.maximum(n_sa, 1), 0)
+        p = node.P
+        # add noise for root node prior probabilities (encourages exploration)
+        if is_root and self.is_self_play and self.use_noise:
+            noise = np.random.dirichlet([0.03] * len(self.game.filter_valid_moves(valids)))
+            p = p.copy()
+            p[valids != 0] = (1 - 0.25) * p[valids != 0] + 0.25 * noise
+        u = q + self.config["c_puct"] * p * math.sqrt(node.N + np.sum(node.VL)) / (1 + n_sa)
+        u[valids == 0] = -float('inf')
+        return int(np.argmax(u))
+
+    def _get_or_add_node(self, s, board):
+        with self.table_lock:
+            node = self.table.get(s)
+        if node is not None:
+            return node
+
+        # score outside of the lock, a node only becomes visible to other threads once it is complete
+        E, score = self.game.getGameEndedArena(board, True, None, None)
+        with self.table_lock:
+            node = self.table.peek(s)
+            if node is None:
+                node = self.table.add(s)
+                node.E, node.score = E, score
+        return node
+
+    def _expand(self, node, s, board):
+        P, v = self.predict(board)
+        valids = self.game.getValidMoves(board)
+        P = P * valids  # masking invalid moves
+        sum_Ps_s = np.sum(P)
+        if sum_Ps_s > 0:
+            P /= sum_Ps_s  # renormalize
+        else:
+            # if all valid moves were masked make all valid moves equally probable
+            P = P + valids
+            P /= np.sum(P)
+
+        # another thread may have expanded the same leaf while the network was running
+        with self._node_lock(s):
+            if not node.is_expanded():
+                node.expand(P, valids, np.asarray(v).item())
+        return -np.asarray(v).item()
+
+    def _node_lock(self, s):
+        return self.node_locks[hash(s) % NUM_NODE_LOCKS]
+
+
+def _warn_root_parallel_unavailable():
+    global _warned_root_parallel
+    if not _warned_root_parallel:
+        print("[LOG]: root_parallel_processes is ignored in pool processes (arena games), using the "
+              "threaded or sequential search.")
+        _warned_root_parallel = True
+
+
+def create_mcts(game, nnet, is_self_play, config):
+    """
+    Returns a RootParallelMCTS if config.yaml asks for more than one root parallel process, a ParallelMCTS if it asks
+    for more than one search thread, a sequential MCTS otherwise.
+    Self-play keeps the sequential search, it is parallelised over games instead. Root parallelism is engine only: the
+    processes of a multiprocessing pool (e.g. the arena games of training/worker.py) cannot start their own pool, they
+    fall back to the threaded or sequential search.
+    """
+    if config["root_parallel_processes"] > 1 and not is_self_play:
+        if not mp.current_process().daemon:
+            return RootParallelMCTS(game, nnet, is_self_play, config)
+        _warn_root_parallel_unavailable()
+    if config["num_search_threads"] > 1 and not is_self_play:
+        return ParallelMCTS(game, nnet, is_self_play, config)
+    return MCTS(game, nnet, is_self_play, config)
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+from definitions import GAME_HISTORY_PATH
+
+"""
+Optional instrumentation of MCTS.search, enabled with profile_search in config.yaml.
+Records wall time and number of calls of every phase of a search, aggregates them per move and per game
+and appends them as JSON lines next to the SGF files of the games (logs/game_history).
+"""
+
+# phases of MCTS.search that are timed
+PHASES = ("scoring", "history", "nn_eval", "expand", "select", "next_state", "backup")
+
+
+class SearchProfiler:
+    """
+    Collects the statistics of the moves of one game. MCTS calls start_move/end_move around every search (with its
+    evaluator, whose cache counters are read) and timed/count/depth inside it, the game loop calls end_game once the
+    game is over.
+    """
+
+    def __init__(self):
+        self.moves = []
+        self.move = None
+        self.move_start = None
+        self.cache_counts = (0, 0)
+        self.start_move()
+
+    def start_move(self, evaluator=None):
+        self.move = {
+            "seconds": {phase: 0.0 for phase in PHASES},
+            "calls": {phase: 0 for phase in PHASES},
+            "simulations": 0,
+            "nodes_created": 0,
+            "cache_lookups": 0,
+            "cache_hits": 0,
+            "max_depth": 0,
+        }
+        self.move_start = time.perf_counter()
+        self.cache_counts = self._cache_counts(evaluator)
+
+    def timed(self, phase, start):
+        """
+        Adds the time since start (a time.perf_counter() value) to phase.
+        """
+        self.move["seconds"][phase] += time.perf_counter() - start
+        self.move["calls"][phase] += 1
+
+    def count(self, counter, n=1):
+        self.move[counter] += n
+
+    def depth(self, depth):
+        if depth > self.move["max_depth"]:
+            self.move["max_depth"] = depth
+
+    def end_move(self, evaluator=None):
+        self.move["wall_time"] = time.perf_counter() - self.move_start
+        lookups, hits = self._cache_counts(evaluator)
+        self.move["cache_lookups"] = lookups - self.cache_counts[0]
+        self.move["cache_hits"] = hits - self.cache_counts[1]
+        self.moves.append(self.move)
+        self.start_move(evaluator)
+
+    def end_game(self, game_type, sgf_file=None):
+        """
+        Appends one line per move and a summary line of the game to the profile file of this process,
+        then starts a new game. sgf_file links the records to the SGF of the game if it was saved.
+        """
+        game = {
+            "seconds": {phase: sum(move["seconds"][phase] for move in self.moves) for phase in PHASES},
+            "calls": {phase: sum(move["calls"][phase] for move in self.moves) for phase in PHASES},
+            "max_depth": max((move["max_depth"] for move in self.moves), default=0),
+            "wall_time": sum(move["wall_time"] for move in self.moves),
+        }
+        for counter in ("simulations", "nodes_created", "cache_lookups", "cache_hits"):
+            game[counter] = sum(move[counter] for move in self.moves)
+
+        header = {"game_type": game_type.value, "sgf_file": sgf_file, "time": time.time()}
+        os.makedirs(GAME_HISTORY_PATH, exist_ok=True)
+        # one file per process, the worker processes never write to the same file
+        with open(os.path.join(GAME_HISTORY_PATH, f"search_profile_{os.getpid()}.jsonl"), 'a') as f:
+            for i, move in enumerate(self.moves):
+                f.write(json.dumps({**header, "record": "move", "move": i, **move}) + "\n")
+            f.write(json.dumps({**header, "record": "game", "moves": len(self.moves), **game}) + "\n")
+
+        self.moves = []
+        self.start_move()
+
+    @staticmethod
+    def _cache_counts(evaluator):
+        # only a CachingEvaluator (see search/evaluators.py) counts its lookups
+        return getattr(evaluator, "lookups", 0), getattr(evaluator, "hits", 0)
@@ -0,0 +1,129 @@
+import math
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+from mcts import MCTS
+
+"""
+Root parallel search: config["root_parallel_processes"] independent searches of the same root, one per process,
+whose root visit counts are summed before the move is chosen. The searches share nothing but their result, so unlike
+search/parallel_mcts.py no tree locking is needed, and a single move can use every core of the machine.
+
+Only the engine uses it: arena games run in the daemonic processes of a worker pool, which cannot start processes of
+their own (see create_mcts in search/parallel_mcts.py).
+"""
+
+# state of a search process, set by _init_search_process
+_process_mcts = None
+_process_counts = None
+_process_shared_memory = None
+
+
+class NoisyRootMCTS(MCTS):
+    """
+    MCTS of a search process: the root priors are mixed with Dirichlet noise, drawn once per search, when root actions
+    are selected. Without it the searches of the processes differ only by the symmetries drawn by MCTS.predict, which
+    the symmetric evaluation cache maps to the same evaluation, and would all visit the same moves.
+    The noise is mixed into a copy of the priors, like ParallelMCTS.select_action_with_virtual_loss does, so the tree
+    keeps the priors of the network when a node is searched again (kept by prune, or pondered).
+    """
+
+    def __init__(self, game, nnet, is_self_play, config=None):
+        super().__init__(game, nnet, is_self_play, config)
+        # root of the current search and its noisy priors, see select_action
+        self.noisy_root = None
+        self.noisy_P = None
+
+    def getActionProb(self, board, canonicalBoard, num_sims, temp=1, use_noise=True, deadline=None):
+        # every search draws new noise, even if its root was already searched
+        self.noisy_root = None
+        return super().getActionProb(board, canonicalBoard, num_sims, temp, use_noise, deadline)
+
+    def select_action(self, node, valids, is_root):
+        if not is_root:
+            return super().select_action(node, valids, is_root)
+        if node is not self.noisy_root:
+            noise = np.random.dirichlet([0.03] * int(np.count_nonzero(valids)))
+            weight = self.config["root_parallel_noise"]
+            self.noisy_P = node.P.copy()
+            self.noisy_P[valids != 0] = (1 - weight) * node.P[valids != 0] + weight * noise
+            self.noisy_root = node
+        u = node.Q + self.config["c_puct"] * self.noisy_P * math.sqrt(node.N) / (1 + node.Nsa)
+        u[valids == 0] = -float('inf')
+        return int(np.argmax(u))
+
+
+def _init_search_process(game, nnet, config, shared_memory_name, num_rows):
+    global _process_mcts, _process_counts, _process_shared_memory
+    # one core per search process, the processes already use all of them together
+    torch.set_num_threads(1)
+    _process_mcts = NoisyRootMCTS(game, nnet, is_self_play=False, config=config)
+    _process_shared_memory = SharedMemory(name=shared_memory_name)
+    _process_counts = np.ndarray((num_rows, game.getActionSize()), dtype=np.int64, buffer=_process_shared_memory.buf)
+
+
+def _search_root(row, seed, board, canonicalBoard, num_sims, temp, deadline):
+    """
+    Searches the root in the tree of this process and writes its root visit counts to row of the shared counts.
+    """
+    # the seed decides the root noise (and the symmetries drawn by MCTS.predict), it is what makes the searches differ
+    np.random.seed(seed)
+    # the tree of the previous move is kept, like the engine keeps its own through prune
+    _process_mcts.prune(board)
+    _process_mcts.getActionProb(board, canonicalBoard, num_sims, temp=temp, deadline=deadline)
+    s = _process_mcts.game.stringRepresentation(canonicalBoard, is_canonical=True)
+    _process_counts[row] = _process_mcts.root_counts(s)
+
+
+class RootParallelMCTS(MCTS):
+    """
+    MCTS whose moves are chosen from the merged visit counts of config["root_parallel_processes"] searches.
+
+    The tree of this object is one of the searches, it runs in the calling process and is kept between moves (prune,
+    pondering). The other searches run in a multiprocessing pool, each with its own tree and root noise (see
+    NoisyRootMCTS), and write their root visit counts to their row of a multiprocessing.shared_memory array that
+    root_counts adds to the local ones.
+    Every search gets the whole simulation budget (or searches until the deadline).
+    """
+
+    def __init__(self, game, nnet, is_self_play, config=None):
+        super().__init__(game, nnet, is_self_play, config)
+        self.num_processes = self.config["root_parallel_processes"] - 1
+        action_size = self.game.getActionSize()
+
+        self.shared_memory = SharedMemory(create=True, size=self.num_processes * action_size * 8)
+        self.counts = np.ndarray((self.num_processes, action_size), dtype=np.int64, buffer=self.shared_memory.buf)
+        self.pool = mp.Pool(self.num_processes, initializer=_init_search_process,
+                            initargs=(game, nnet, self.config, self.shared_memory.name, self.num_processes))
+        # searches of the other processes for the current move, see getActionProb
+        self.pending = []
+
+    def getActionProb(self, board, canonicalBoard, num_sims, temp=1, use_noise=True, deadline=None):
+        # the Gumbel root search plays the action it selected itself, there are no visit counts to merge
+        if self.config["root_search"] != "gumbel":
+            self.counts.fill(0)
+            seed = np.random.randint(2 ** 31 - self.num_processes)
+            self.pending = [self.pool.apply_async(_search_root, (row, seed + row, board, canonicalBoard, num_sims, temp,
+                                                                 deadline))
+                            for row in range(self.num_processes)]
+        return super().getActionProb(board, canonicalBoard, num_sims, temp, use_noise, deadline)
+
+    def root_counts(self, s):
+        counts = super().root_counts(s)
+        if self.pending:
+            # re-raises exceptions of the search processes
+            for result in self.pending:
+                result.get()
+            self.pending = []
+            counts += np.sum(self.counts, axis=0)
+        return counts
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.counts = None
+        self.shared_memory.close()
+        self.shared_memory.unlink()
@@ -0,0 +1,94 @@
+import time
+
+"""
+Converts the clock of a GTP game (time_settings / time_left) into a deadline for the search of the next move.
+Times are in seconds, colors are the board players (1 = black, -1 = white).
+"""
+
+# smallest time given to a search, the engine still needs to answer genmove when the clock is almost empty
+MIN_MOVE_TIME = 0.05
+
+
+class TimeManager:
+    """
+    Keeps the clock of both players under Canadian byo-yomi as described by the GTP specification:
+    main_time for the whole game, then byo_yomi_stones moves to play in every period of byo_yomi_time.
+    The clocks are updated by time_left when the controller sends it and by record_move otherwise.
+    """
+
+    def __init__(self, board_size, safety_margin, expected_game_length=None):
+        self.safety_margin = safety_margin
+        # number of moves (of both players) a game usually lasts, decides how main time is spread over the moves
+        self.expected_game_length = expected_game_length or 2 * board_size ** 2
+        self.main_time = 0
+        self.byo_yomi_time = 0
+        self.byo_yomi_stones = 0
+        self.is_timed = False
+        self.clocks = {}
+
+    def set_time_settings(self, main_time, byo_yomi_time, byo_yomi_stones):
+        self.main_time = main_time
+        self.byo_yomi_time = byo_yomi_time
+        self.byo_yomi_stones = byo_yomi_stones
+        # byo_yomi_time > 0 with byo_yomi_stones = 0 means no time limit
+        self.is_timed = not (byo_yomi_time > 0 and byo_yomi_stones == 0)
+        for color in (1, -1):
+            if main_time > 0 or byo_yomi_stones == 0:
+                self.clocks[color] = (main_time, 0)
+            else:
+                self.clocks[color] = (byo_yomi_time, byo_yomi_stones)
+
+    def set_time_left(self, color, time_left, stones):
+        """
+        stones = 0 means time_left is what remains of the main time, otherwise time_left is left to play stones moves.
+        """
+        self.clocks[color] = (time_left, stones)
+
+    def record_move(self, color, seconds):
+        """
+        Charges the time spent on a move to the clock of color, entering or renewing byo-yomi periods as needed.
+        """
+        if color not in self.clocks:
+            return
+        time_left, stones = self.clocks[color]
+        time_left -= seconds
+
+        if stones == 0:
+            if time_left <= 0 and self.byo_yomi_stones > 0:
+                time_left, stones = self.byo_yomi_time + time_left, self.byo_yomi_stones
+        else:
+            stones -= 1
+            if stones == 0:
+                time_left, stones = self.byo_yomi_time, self.byo_yomi_stones
+
+        self.clocks[color] = (time_left, stones)
+
+    def get_move_time(self, color, move_number):
+        """
+        Returns the time to spend on the next move of color, or None if the game has no time limit.
+        """
+        if not self.is_timed or color not in self.clocks:
+            return None
+        time_left, stones = self.clocks[color]
+
+        if stones > 0:
+            # byo-yomi: spread the period evenly over the stones still to play in it
+            move_time = time_left / stones
+        else:
+            # main time: spread it over the moves this player is still expected to play
+            moves_left = max(self.expected_game_length - move_number, self.expected_game_length // 4) / 2
+            move_time = time_left / moves_left
+            if self.byo_yomi_stones > 0:
+                # byo-yomi follows the main time, so a move may also use its share of the first period
+                move_time = min(move_time + self.byo_yomi_time / self.byo_yomi_stones, time_left)
+
+        return max(move_time - self.safety_margin, MIN_MOVE_TIME)
+
+    def get_deadline(self, color, move_number):
+        """
+        Returns the time.monotonic() value the search of the next move of color has to stop at, None if untimed.
+        """
+        move_time = self.get_move_time(color, move_number)
+        if move_time is None:
+            return None
+        return time.monotonic() + move_time
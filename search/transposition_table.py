@@ -0,0 +1,125 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+# rough per entry cost of the node object, its four numpy array headers and the OrderedDict slot
+NODE_OVERHEAD_BYTES = 600
+
+
+class SearchNode:
+    """
+    Statistics MCTS keeps for a single board state s.
+    """
+    __slots__ = ('E', 'score', 'P', 'v', 'valids', 'N', 'Q', 'Nsa', 'VL')
+
+    def __init__(self):
+        self.E = 0  # stores game.getGameEnded ended for board s
+        self.score = None  # stores (score_black, score_white) for board s
+        self.P = None  # stores initial policy (returned by neural net), None until s is expanded
+        self.v = None  # stores the value of s returned by the neural net, for the player to move
+        self.valids = None  # stores game.getValidMoves for board s
+        self.N = 0  # stores #times board s was visited
+        self.Q = None  # stores Q values for s,a (as defined in the paper)
+        self.Nsa = None  # stores #times edge s,a was visited
+        self.VL = None  # stores the virtual loss of s,a applied by simulations in flight (see ParallelMCTS)
+
+    def is_expanded(self):
+        return self.P is not None
+
+    def expand(self, P, valids, v):
+        self.P = P
+        self.v = v
+        self.valids = valids
+        self.N = 0
+        self.Q = np.zeros(len(P))
+        self.Nsa = np.zeros(len(P), dtype=np.int64)
+        self.VL = np.zeros(len(P), dtype=np.int64)
+
+
+class TranspositionTable:
+    """
+    Capacity bounded store for the MCTS statistics, keyed by the string representation of a board.
+    Entries are evicted in least recently used order once the estimated size of the table exceeds max_bytes.
+    Evicting a node only loses its statistics, the next search that reaches it expands it again.
+    """
+
+    def __init__(self, action_size, max_bytes):
+        self.max_bytes = max_bytes
+        self.node_bytes = 5 * action_size * np.dtype(np.float64).itemsize + NODE_OVERHEAD_BYTES
+        self.nodes = OrderedDict()
+        self.num_bytes = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, s):
+        return s in self.nodes
+
+    def get(self, s):
+        """
+        Returns the node stored for s (marking it as most recently used) or None if s is not in the table.
+        """
+        self.lookups += 1
+        node = self.nodes.get(s)
+        if node is not None:
+            self.hits += 1
+            self.nodes.move_to_end(s)
+        return node
+
+    def peek(self, s):
+        """
+        Returns the node stored for s without touching the statistics or the eviction order.
+        """
+        return self.nodes.get(s)
+
+    def add(self, s):
+        """
+        Stores and returns a new node for s, evicting the least recently used nodes if the table is full.
+        """
+        node = SearchNode()
+        self.nodes[s] = node
+        self.num_bytes += self._entry_bytes(s)
+
+        while self.num_bytes > self.max_bytes and len(self.nodes) > 1:
+            evicted_s, _ = self.nodes.popitem(last=False)
+            self.num_bytes -= self._entry_bytes(evicted_s)
+            self.evictions += 1
+
+        return node
+
+    def retain(self, prefix):
+        """
+        Frees every node whose key does not start with prefix.
+        """
+        self.nodes = OrderedDict((s, node) for s, node in self.nodes.items() if s.startswith(prefix))
+        self.num_bytes = sum(self._entry_bytes(s) for s in self.nodes)
+
+    def clear(self):
+        """
+        Frees every node and resets the statistics, which then cover the next game (see stats).
+        """
+        self.nodes = OrderedDict()
+        self.num_bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        Returns the hit rate, occupancy and number of evictions of the table since it was created or last cleared.
+        """
+        return {
+            "hit_rate": self.hits / self.lookups if self.lookups > 0 else 0.0,
+            "occupancy": self.num_bytes / self.max_bytes,
+            "entries": len(self.nodes),
+            "megabytes": self.num_bytes / 2 ** 20,
+            "evictions": self.evictions,
+        }
+
+    def _entry_bytes(self, s):
+        return self.node_bytes + sys.getsizeof(s)
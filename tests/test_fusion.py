@@ -0,0 +1,76 @@
+import pytest
+import torch
+from torch import nn
+
+from go.go_game import GoGame
+from neural_network.go_alphanet import AlphaBlock, AlphaBottleneck, AlphaNet
+
+
+def randomize_batch_norms(module, seed=0):
+    """
+    Gives every batch norm of module random statistics and affine parameters, as a trained network would have (the
+    initialisation of AlphaNet makes them identities, which any folding would reproduce).
+    """
+    generator = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for bn in module.modules():
+            if isinstance(bn, nn.BatchNorm2d):
+                size = bn.num_features
+                bn.running_mean.copy_(torch.randn(size, generator=generator) * 0.5)
+                bn.running_var.copy_(torch.rand(size, generator=generator) * 1.5 + 0.5)
+                bn.weight.copy_(torch.rand(size, generator=generator) + 0.5)
+                bn.bias.copy_(torch.randn(size, generator=generator) * 0.1)
+    # compared in float64, so the only difference left is the folding itself
+    return module.double().eval()
+
+
+def assert_fused_matches(module, x):
+    fused = module.fuse_for_inference()
+    assert not any(isinstance(m, nn.BatchNorm2d) for m in fused.modules())
+    with torch.no_grad():
+        expected = module(x)
+        actual = fused(x)
+    for e, a in zip(expected if isinstance(expected, tuple) else (expected,),
+                    actual if isinstance(actual, tuple) else (actual,)):
+        torch.testing.assert_close(a, e, rtol=1e-9, atol=1e-9)
+
+
+def downsample(inplanes, planes, stride):
+    # the downsample AlphaNet._make_layer builds for a block whose shape changes
+    return nn.Sequential(nn.Conv2d(inplanes, planes, kernel_size=1, stride=stride, bias=False), nn.BatchNorm2d(planes))
+
+
+@pytest.mark.parametrize("inplanes,planes,stride", [(16, 16, 1), (8, 16, 2)])
+def test_fused_alpha_block_matches(inplanes, planes, stride):
+    torch.manual_seed(0)
+    down = downsample(inplanes, planes, stride) if inplanes != planes or stride != 1 else None
+    block = randomize_batch_norms(AlphaBlock(inplanes, planes, stride, down))
+    assert_fused_matches(block, torch.randn(3, inplanes, 7, 7, dtype=torch.float64))
+
+
+@pytest.mark.parametrize("inplanes,planes,stride", [(32, 8, 1), (8, 8, 2)])
+def test_fused_alpha_bottleneck_matches(inplanes, planes, stride):
+    torch.manual_seed(0)
+    expanded = planes * AlphaBottleneck.expansion
+    down = downsample(inplanes, expanded, stride) if inplanes != expanded or stride != 1 else None
+    block = randomize_batch_norms(AlphaBottleneck(inplanes, planes, stride, down))
+    assert_fused_matches(block, torch.randn(3, inplanes, 7, 7, dtype=torch.float64))
+
+
+@pytest.mark.parametrize("head,board_size", [("fc", 7), ("pool", 7), ("pool", 9)])
+def test_fused_alpha_net_matches(head, board_size):
+    torch.manual_seed(0)
+    game = GoGame(board_size)
+    network = randomize_batch_norms(AlphaNet(game, [2, 2, 2, 2], head))
+    x = (torch.rand(4, game.encoder.num_planes, board_size, board_size) > 0.5).double()
+    assert_fused_matches(network, x)
+
+
+def test_fusion_leaves_the_network_unchanged():
+    torch.manual_seed(0)
+    network = randomize_batch_norms(AlphaNet(GoGame(7), [2, 2, 2, 2], "pool"))
+    state = {name: tensor.clone() for name, tensor in network.state_dict().items()}
+    network.fuse_for_inference()
+    assert any(isinstance(m, nn.BatchNorm2d) for m in network.modules())
+    for name, tensor in network.state_dict().items():
+        assert torch.equal(tensor, state[name])
@@ -0,0 +1,83 @@
+import importlib.util
+
+import numpy as np
+import pytest
+import torch
+
+from definitions import CONFIG_PATH
+from go.go_game import GoGame
+from neural_network.neural_net_wrapper import NNetWrapper
+from utils.config_handler import ConfigHandler
+
+
+def make_network(seed=0, **overrides):
+    config = ConfigHandler(CONFIG_PATH)
+    config.config.update(network_type="RES", inference_dtype="float32", inference_quantization="none")
+    config.config.update(overrides)
+    torch.manual_seed(seed)
+    return NNetWrapper(GoGame(config["board_size"]), config)
+
+
+def random_boards(network, batch_size=5):
+    rng = np.random.RandomState(0)
+    return (rng.rand(batch_size, network.num_planes, network.board_x, network.board_y) > 0.5).astype(np.float32)
+
+
+def predict_with(network, backend, boards):
+    network.config.config.update(inference_backend=backend)
+    network.backend = None
+    return network.predict_batch(boards)
+
+
+@pytest.mark.parametrize("head,board_size", [("fc", 7), ("pool", 7), ("pool", 9)])
+def test_onnx_backend_matches_eager(head, board_size):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    network = make_network(network_head=head, board_size=board_size)
+    boards = random_boards(network)
+
+    eager_pis, eager_vs = predict_with(network, "eager", boards)
+    onnx_pis, onnx_vs = predict_with(network, "onnx", boards)
+    np.testing.assert_allclose(onnx_pis, eager_pis, atol=1e-5)
+    np.testing.assert_allclose(onnx_vs, eager_vs, atol=1e-5)
+
+
+def test_onnx_backend_is_rebuilt_for_new_weights(tmp_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    network = make_network(inference_backend="onnx")
+    boards = random_boards(network)
+    network.predict_batch(boards)
+
+    other = make_network(seed=1)
+    other.save_checkpoint(str(tmp_path), "other.pth.tar")
+    network.load_checkpoint(str(tmp_path), "other.pth.tar")
+    pis, vs = network.predict_batch(boards)
+    other_pis, other_vs = other.predict_batch(boards)
+    np.testing.assert_allclose(pis, other_pis, atol=1e-5)
+    np.testing.assert_allclose(vs, other_vs, atol=1e-5)
+
+
+def test_onnx_backend_runs_quantized_configs_in_float32():
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    network = make_network(inference_backend="onnx", inference_quantization="dynamic")
+    boards = random_boards(network)
+
+    onnx_pis, _ = network.predict_batch(boards)
+    network.config.config.update(inference_quantization="none")
+    eager_pis, _ = predict_with(network, "eager", boards)
+    np.testing.assert_allclose(onnx_pis, eager_pis, atol=1e-5)
+
+
+def test_onnx_backend_without_onnxruntime_fails_when_selected(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec",
+                        lambda name, *args: None if name == "onnxruntime" else find_spec(name, *args))
+    with pytest.raises(ImportError, match="onnxruntime"):
+        make_network(inference_backend="onnx")
+
+
+def test_unsupported_backend_fails_when_selected():
+    with pytest.raises(KeyError, match="config.yaml"):
+        make_network(inference_backend="tensorrt")
@@ -1,8 +1,8 @@
 from definitions import CONFIG_PATH
+from go.feature_encoder import FeatureEncoder
 from go.go_game import GoGame, display
 from logger.gtp_logger import GTPLogger, GameType, PlayerType
 from utils.config_handler import ConfigHandler
-import numpy as np
 
 class ArenaManager:
 
@@ -12,7 +12,8 @@ class ArenaManager:
         self.player2 = player2  # curr_mcts player
         self.mcts1 = mcts1
         self.mcts2 = mcts2
-        self.game = GoGame(self.config["board_size"], is_arena_game=True)
+        self.game = GoGame(self.config["board_size"], is_arena_game=True,
+                           encoder=FeatureEncoder.from_config(self.config))
         self.gtp_logger = GTPLogger()
 
     def play_games(self, num_games):
@@ -59,34 +60,32 @@ class ArenaManager:
 
     def play_game(self):
         print("Arena Game Started")
-        self.game = GoGame(self.config["board_size"], is_arena_game=True)
+        self.game = GoGame(self.config["board_size"], is_arena_game=True,
+                           encoder=FeatureEncoder.from_config(self.config))
         board = self.game.getInitBoard()
-        c_boards = [np.ones((7, 7)), np.zeros((7, 7))]
-        x_boards, y_boards = self.game.init_x_y_boards()
         players = [self.player2, None, self.player1]
 
         self.clear_mcts()
 
         while self.game.getGameEndedArena(board, False, self.mcts1, self.mcts2) == 0:
-            # Code for old MCTS
-            x_boards, y_boards = y_boards, x_boards
             canonicalBoard = self.game.getCanonicalForm(board, board.current_player)
-            player_board = (c_boards[0], c_boards[1]) if board.current_player == 1 else (c_boards[1], c_boards[0])
-            canonicalHistory, x_boards, y_boards = self.game.getCanonicalHistory(x_boards, y_boards,
-                                                                                 canonicalBoard, player_board)
-            # print("History used to make move: ", canonicalHistory)
 
             # action = players[board.current_player + 1](board)
-            #Code for old MCTS
-            action = players[board.current_player + 1](board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, self.config["num_full_search_sims"])
+            # the search derives the network input planes from board itself
+            action = players[board.current_player + 1](board, canonicalBoard, self.config["num_full_search_sims"])
             self.gtp_logger.add_action(action, board)
             board = self.game.getNextState(board, action)
+            self.prune_mcts(board)
         #     print(f"Player: {board.current_player}, Move: {action}")
         #     print(display(board))
         #     print("\n\n")
         # print("\n\n")
 
-        self.gtp_logger.save_sgf(GameType.ARENA)
+        sgf_file = self.gtp_logger.save_sgf(GameType.ARENA)
+        for mcts in (self.mcts1, self.mcts2):
+            if mcts and mcts.profiler is not None:
+                mcts.profiler.end_game(GameType.ARENA, sgf_file)
+        print(f"Simulations saved by early stopping (previous, current): {self.get_saved_sims()}")
 
         result, score = self.game.getGameEndedArena(board, True, self.mcts1, self.mcts2)
         old_score_system = self.game.getScore_old_system(board.copy())
@@ -95,6 +94,15 @@ class ArenaManager:
         # print(f"Tromp Taylor :: Black Score: {score[0]}, White Score: {score[1]}")
         return result
 
+    def prune_mcts(self, board):
+        if self.mcts1:
+            self.mcts1.prune(board)
+        if self.mcts2:
+            self.mcts2.prune(board)
+
+    def get_saved_sims(self):
+        return tuple(mcts.saved_sims if mcts else 0 for mcts in (self.mcts1, self.mcts2))
+
     def clear_mcts(self):
         if self.mcts1:
             self.mcts1.clear()
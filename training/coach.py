@@ -76,34 +76,29 @@ class Coach:
         board = self.game.getInitBoard()
         self.curPlayer = 1
         episodeStep = 0
-        c_boards = [np.ones((7, 7)), np.zeros((7, 7))]
-        x_boards, y_boards = self.game.init_x_y_boards()
         r = 0
 
         while r == 0:
-            x_boards, y_boards = y_boards, x_boards
             episodeStep += 1
             if self.config["display"] == 1:
                 print("================Episode Playing Step:{}=====CURPLAYER:{}==========".format(episodeStep,
                                                                                                   "White" if self.curPlayer == -1 else "Black"))
 
-            # Get the current board, current player's board, and game history at current state
+            # Get the current board, the search derives the network input planes from board itself
             canonicalBoard = self.game.getCanonicalForm(board, self.curPlayer)
-
-            player_board = (c_boards[0], c_boards[1]) if self.curPlayer == 1 else (c_boards[1], c_boards[0])
-            canonicalHistory, x_boards, y_boards = self.game.getCanonicalHistory(x_boards, y_boards,
-                                                                                 canonicalBoard, player_board)
             # set temperature variable and get move probabilities
             temp = int(episodeStep < self.config["temperature_threshold"])
 
-            if random.random() <= 0.25:
+            # playout cap randomization, see SelfPlayManager.execute_game
+            is_full_search = random.random() < self.config["full_search_probability"]
+            if is_full_search:
                 num_sims = self.config["num_full_search_sims"]
-                use_noise = True
-            pi = self.mcts.getActionProb(board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, use_noise,
-                                         num_sims, temp=temp)
+            else:
+                num_sims = self.config["num_fast_search_sims"]
+            pi = self.mcts.getActionProb(board, canonicalBoard, num_sims, temp=temp, use_noise=is_full_search)
             # get different symmetries/rotations of the board if full search was done
-            if num_sims == self.config["num_full_search_sims"]:
-                sym = self.game.getSymmetries(canonicalHistory, pi)
+            if is_full_search:
+                sym = self.game.getSymmetries(board.get_canonical_history(), pi)
                 for b, p in sym:
                     game_train_examples.append([b, self.curPlayer, p, None])
             # choose a move
@@ -114,6 +109,7 @@ class Coach:
             # play the chosen move
             board = self.game.getNextState(board, action)
             self.curPlayer = board.current_player
+            self.mcts.prune(board)
 
             if self.config["display"] == 1:
                 print("BOARD updated:")
@@ -266,8 +262,8 @@ class Coach:
             nmcts = MCTS(self.game, self.nnet, self.config)
 
             print('\nPITTING AGAINST PREVIOUS VERSION')
-            arena = Arena(lambda x, y, z, a, b, c, d: np.argmax(pmcts.getActionProb(x, y, z, a, b, c, d, temp=0)),
-                          lambda x, y, z, a, b, c, d: np.argmax(nmcts.getActionProb(x, y, z, a, b, c, d, temp=0)),
+            arena = Arena(lambda x, y, z: np.argmax(pmcts.getActionProb(x, y, z, temp=0)),
+                          lambda x, y, z: np.argmax(nmcts.getActionProb(x, y, z, temp=0)),
                           self.game, self.config)
             pwins, nwins, draws, outcomes, total_played = arena.playGames(self.config["num_arena_episodes"])
             self.winRate.append(nwins / total_played)
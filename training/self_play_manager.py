@@ -1,8 +1,10 @@
 import random
+import time
 
 import numpy as np
 
 from definitions import CONFIG_PATH
+from go.feature_encoder import FeatureEncoder
 from go.go_game import GoGame
 from logger.gtp_logger import GTPLogger, GameType
 from utils.config_handler import ConfigHandler
@@ -12,63 +14,98 @@ class SelfPlayManager:
 
     def __init__(self, neural_net, mcts):
         self.config = ConfigHandler(CONFIG_PATH)
-        self.go_game = GoGame(self.config['board_size'])
+        self.go_game = GoGame(self.config['board_size'], encoder=FeatureEncoder.from_config(self.config))
         self.neural_net = neural_net
         self.mcts = mcts
         self.gtp_logger = GTPLogger()
 
+        # throughput of the games played by this manager, see get_stats
+        self.games_played = 0
+        self.moves_played = 0
+        self.full_search_moves = 0
+        self.simulations = 0
+        self.seconds_played = 0.0
+
     def execute_game(self):
+        start_time = time.time()
         game_train_examples = []
         board = self.go_game.getInitBoard()
         turn_count = 0
         result = 0
-        # For new MCTS
-        c_boards = [np.ones((7, 7)), np.zeros((7, 7))]
-        x_boards, y_boards = self.go_game.init_x_y_boards()
-
         while result == 0:
             turn_count += 1
             temp = int(turn_count < self.config["temperature_threshold"])
-            # Code for old MCTS
-            x_boards, y_boards = y_boards, x_boards
-
-            # Code for old MCTS
+            # the search derives the network input planes from board itself
             canonicalBoard = self.go_game.getCanonicalForm(board, board.current_player)
-            player_board = (c_boards[0], c_boards[1]) if board.current_player == 1 else (c_boards[1], c_boards[0])
-            canonicalHistory, x_boards, y_boards = self.go_game.getCanonicalHistory(x_boards, y_boards, canonicalBoard, player_board)
 
-            num_sims = self.config["num_full_search_sims"]
-            is_full_search = True
+            # playout cap randomization: only a fraction of the moves get a full search (with root noise) and are
+            # used as training examples, the other moves are played after a cheap fast search
+            is_full_search = random.random() < self.config["full_search_probability"]
+            if is_full_search:
+                num_sims = self.config["num_full_search_sims"]
+            else:
+                num_sims = self.config["num_fast_search_sims"]
+            # the budget counts the visits of the reused subtree, only the simulations actually run are counted
+            run_sims = self.mcts.run_sims
+
+            if self.config["root_search"] == "gumbel":
+                # the Gumbel search samples the move itself and returns the improved policy as training target
+                action, target_pi = self.mcts.gumbel_search(board, canonicalBoard, num_sims,
+                                                            use_noise=is_full_search or temp == 1)
+            else:
+                pi = self.mcts.getActionProb(board, canonicalBoard, num_sims, temp=temp, use_noise=is_full_search)
 
-            pi = self.mcts.getActionProb(board, canonicalBoard, canonicalHistory, x_boards, y_boards, player_board, num_sims, temp=temp)
+                # choose a move
+                if temp == 1:
+                    action = np.random.choice(len(pi), p=pi)
+                else:
+                    action = np.argmax(pi)
 
-            # choose a move
-            if temp == 1:
-                action = np.random.choice(len(pi), p=pi)
-            else:
-                action = np.argmax(pi)
+                target_pi = [0 for _ in range(self.go_game.getActionSize())]
+                target_pi[action] = 1
+            self.moves_played += 1
+            self.full_search_moves += int(is_full_search)
+            self.simulations += self.mcts.run_sims - run_sims
 
             self.gtp_logger.add_action(action, board)
 
-            masked_pi = [0 for _ in range(self.go_game.getActionSize())]
-            masked_pi[action] = 1
-
             # get different symmetries/rotations of the board if full search was done
             if is_full_search:
                 canonical_history = board.get_canonical_history()
-                sym = self.go_game.getSymmetries(canonical_history, masked_pi)
+                sym = self.go_game.getSymmetries(canonical_history, target_pi)
                 for b, p in sym:
                     game_train_examples.append([b, board.current_player, p, None])
 
             # play the chosen move
             board = self.go_game.getNextState(board, action)
             result, score = self.go_game.getGameEndedSelfPlay(board.copy(), return_score=True, mcts=self.mcts)
+            # reuse the subtree of the chosen move for the next search
+            self.mcts.prune(board)
 
         # save 10% of self play games
+        sgf_file = None
         if random.random() <= 0.10:
-            self.gtp_logger.save_sgf(GameType.SELF_PLAY)
+            sgf_file = self.gtp_logger.save_sgf(GameType.SELF_PLAY)
         else:
             self.gtp_logger.reset()
-        
+        if self.mcts.profiler is not None:
+            self.mcts.profiler.end_game(GameType.SELF_PLAY, sgf_file)
+
+        self.games_played += 1
+        self.seconds_played += time.time() - start_time
+
         # return game result
         return [(x[0], x[2], result * ((-1) ** (x[1] != board.current_player))) for x in game_train_examples]
+
+    def get_stats(self):
+        """
+        Returns the throughput of the self play games played so far by this manager.
+        """
+        hours_played = self.seconds_played / 3600
+        return {
+            "games": self.games_played,
+            "games_per_hour": self.games_played / hours_played if hours_played > 0 else 0.0,
+            "training_moves_per_hour": self.full_search_moves / hours_played if hours_played > 0 else 0.0,
+            "full_search_fraction": self.full_search_moves / self.moves_played if self.moves_played > 0 else 0.0,
+            "sims_per_move": self.simulations / self.moves_played if self.moves_played > 0 else 0.0,
+        }
@@ -9,14 +9,24 @@ import numpy as np
 from definitions import CONFIG_PATH, CHECKPOINT_PATH, SENS_CONFIG_PATH, DIS_SELF_PLAY_PATH, DIS_ARENA_PATH
 from distributed.ssh_connector import SSHConnector
 from distributed.status_manager import StatusManager, Status
+from go.feature_encoder import FeatureEncoder
 from go.go_game import GoGame
 from mcts import MCTS as MCTS
-from neural_network.neural_net_wrapper import NNetWrapper
+from neural_network.inference_server import InferenceServer, InferenceClient
+from neural_network.neural_net_wrapper import NNetWrapper, checkpoint_version
+from search.evaluation_cache import SharedEvaluationCache, get_evaluation_cache
+from search.parallel_mcts import create_mcts
 from training.arena_manager import ArenaManager
 from training.self_play_manager import SelfPlayManager
 from utils.config_handler import ConfigHandler
 from utils.data_serializer import save_obj_to_disk, save_json_to_disk
 
+# networks of the current pool process by checkpoint version (a hash of its content), kept between tasks: best.pth.tar
+# and the arena checkpoint with the same weights share one network (see Worker.load_networks)
+_process_networks = {}
+# version of every checkpoint file by path, with the file (inode, size, modification time) it was computed for
+_checkpoint_versions = {}
+
 
 class Worker:
     def __init__(self):
@@ -25,12 +35,30 @@ class Worker:
         self.status_manager = StatusManager()
         self.connector = SSHConnector()
         self.status = None
+        # name of the shared memory evaluation cache of the current pool, if share_evaluation_cache is enabled
+        self.shared_cache_name = None
+        # InferenceClient arguments of every checkpoint served to the current pool, if use_inference_server is enabled
+        self.inference_server_args = {}
+        # game processes, kept between self play and arena so their networks stay loaded (see get_pool)
+        self.pool = None
+
+    def __getstate__(self):
+        # every task of the pool gets a copy of the worker, a pool cannot be sent to its own processes
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
 
     def start(self):
         """
         Main function for switching between self play, arena, and NN training for worker node.
         Periodically check status of main server and execute needed function.
         """
+        try:
+            self.run_status_loop()
+        finally:
+            self.close_pool()
+
+    def run_status_loop(self):
         while True:
             self.status = self.status_manager.check_status()
 
@@ -56,12 +84,18 @@ class Worker:
         """
         Helper function for handling multiprocessing pool for self play as specified in config.yaml
         """
-        with mp.Pool(self.config["num_parallel_games"]) as pool:
-            for i in range(self.config["num_parallel_games"]):
-                pool.apply_async(self.handle_self_play_lifecycle)
+        shared_cache = self.create_shared_evaluation_cache()
+        inference_servers = self.create_inference_servers(['best.pth.tar'])
 
-            pool.close()
-            pool.join()
+        pool = self.get_pool()
+        results = [pool.apply_async(self.handle_self_play_lifecycle)
+                   for i in range(self.config["num_parallel_games"])]
+        for result in results:
+            result.wait()
+        self.report_evaluation_cache(results)
+
+        self.close_inference_servers(inference_servers)
+        self.close_shared_evaluation_cache(shared_cache)
 
         # self.handle_self_play_lifecycle()
 
@@ -74,15 +108,21 @@ class Worker:
         The results of the game are uploaded and subsequently deleted from the local machine.
         According to the paper, each game of training (self-play) should start with a fresh MCTS tree.
         See: https://github.com/suragnair/alpha-zero-general/discussions/24
+        Returns the evaluation cache statistics of the task, see report_evaluation_cache.
         """
-        go_game = GoGame(self.config['board_size'])
-        neural_net = NNetWrapper(go_game, self.config)
-        neural_net.load_checkpoint(CHECKPOINT_PATH, 'best.pth.tar')
-        mcts = MCTS(game=go_game, nnet=neural_net, is_self_play=True)
-        local_path, file_name = self.execute_self_play(go_game=go_game, neural_net=neural_net, mcts=mcts)
+        go_game = GoGame(self.config['board_size'], encoder=FeatureEncoder.from_config(self.config))
+        neural_net, = self.load_networks(go_game, ['best.pth.tar'])
+        try:
+            evaluation_cache = self.get_task_evaluation_cache(go_game)
+            mcts = MCTS(game=go_game, nnet=neural_net, is_self_play=True)
+            local_path, file_name = self.execute_self_play(go_game=go_game, neural_net=neural_net, mcts=mcts)
+        finally:
+            self.release_network(neural_net)
         self.connector.upload_self_play_examples(local_path, file_name)
         os.remove(local_path)
 
+        return evaluation_cache.stats() if evaluation_cache is not None else None
+
     def execute_self_play(self, go_game, neural_net, mcts):
         """
         PER THREAD FUNCTION
@@ -98,6 +138,9 @@ class Worker:
             iteration_train_examples += manager.execute_game()
             print("Self play game completed.")
 
+        print(f"MCTS table stats: {mcts.table.stats()}")
+        print(f"Self play stats: {manager.get_stats()}")
+
         # save the generated train examples in their own file
         train_examples_history.append(iteration_train_examples)
 
@@ -118,37 +161,52 @@ class Worker:
         """
         Helper function for handling multiprocessing pool for arena as specified in config.yaml
         """
-        with mp.Pool(self.config["num_parallel_games"]) as pool:
-            for i in range(self.config["num_parallel_games"]):
-                pool.apply_async(self.handle_arena_lifecycle)
+        shared_cache = self.create_shared_evaluation_cache()
+        inference_servers = self.create_inference_servers(['previous_net.pth.tar', 'current_net.pth.tar'])
 
-            pool.close()
-            pool.join()
+        pool = self.get_pool()
+        results = [pool.apply_async(self.handle_arena_lifecycle)
+                   for i in range(self.config["num_parallel_games"])]
+        for result in results:
+            result.wait()
+        self.report_evaluation_cache(results)
+
+        self.close_inference_servers(inference_servers)
+        self.close_shared_evaluation_cache(shared_cache)
 
         # self.handle_arena_lifecycle()
 
     def handle_arena_lifecycle(self):
         """
         Function at thread level
+        Returns the evaluation cache statistics of the task, see report_evaluation_cache.
         """
-        go_game = GoGame(self.config['board_size'])
-        previous_net = NNetWrapper(game=go_game, config=self.config)
-        previous_net.load_checkpoint(CHECKPOINT_PATH, 'previous_net.pth.tar')
-        current_net = NNetWrapper(game=go_game, config=self.config)
-        current_net.load_checkpoint(CHECKPOINT_PATH, 'current_net.pth.tar')
-        previous_mcts = MCTS(game=go_game, nnet=previous_net, is_self_play=False)
-        current_mcts = MCTS(game=go_game, nnet=current_net, is_self_play=False)
+        go_game = GoGame(self.config['board_size'], encoder=FeatureEncoder.from_config(self.config))
+        previous_net, current_net = self.load_networks(go_game, ['previous_net.pth.tar', 'current_net.pth.tar'])
+        previous_mcts = current_mcts = None
+        try:
+            evaluation_cache = self.get_task_evaluation_cache(go_game)
+            previous_mcts = create_mcts(game=go_game, nnet=previous_net, is_self_play=False, config=self.config)
+            current_mcts = create_mcts(game=go_game, nnet=current_net, is_self_play=False, config=self.config)
 
-        # prev_player = lambda x: np.argmax(previous_mcts.getActionProb(x, temp=0))
-        # curr_player = lambda x: np.argmax(current_mcts.getActionProb(x, temp=0))
+            # prev_player = lambda x: np.argmax(previous_mcts.getActionProb(x, temp=0))
+            # curr_player = lambda x: np.argmax(current_mcts.getActionProb(x, temp=0))
 
-        prev_player = lambda x, y, z, a, b, c, d: np.argmax(previous_mcts.getActionProb(x, y, z, a, b, c, d, temp=0))
-        curr_player = lambda x, y, z, a, b, c, d: np.argmax(current_mcts.getActionProb(x, y, z, a, b, c, d, temp=0))
+            prev_player = lambda x, y, z: np.argmax(previous_mcts.getActionProb(x, y, z, temp=0))
+            curr_player = lambda x, y, z: np.argmax(current_mcts.getActionProb(x, y, z, temp=0))
 
-        arena = ArenaManager(prev_player, curr_player, previous_mcts, current_mcts)
+            arena = ArenaManager(prev_player, curr_player, previous_mcts, current_mcts)
 
-        prev_wins, current_wins, draws = arena.play_games(2)
-        print("Arena two game batch completed.")
+            prev_wins, current_wins, draws = arena.play_games(2)
+            print("Arena two game batch completed.")
+            print(f"MCTS table stats (previous, current): {previous_mcts.table.stats()}, {current_mcts.table.stats()}")
+        finally:
+            # the parallel searches own search threads, which would otherwise outlive the task in the pool process
+            for mcts in (previous_mcts, current_mcts):
+                if mcts is not None:
+                    mcts.close()
+            self.release_network(previous_net)
+            self.release_network(current_net)
 
         outcomes = {"current_wins": current_wins, "previous_wins": prev_wins, "ties": draws,
                     "games_played": prev_wins + current_wins + draws}
@@ -161,3 +219,136 @@ class Worker:
 
         self.connector.upload_arena_outcomes(local_path, file_name)
         os.remove(local_path)
+
+        return evaluation_cache.stats() if evaluation_cache is not None else None
+
+    def get_task_evaluation_cache(self, go_game):
+        """
+        PER THREAD FUNCTION
+        Returns the evaluation cache of this process with its statistics restarted for the task,
+        or None if use_evaluation_cache is disabled in config.yaml
+        """
+        evaluation_cache = get_evaluation_cache(self.config, go_game.getActionSize(), self.shared_cache_name)
+        if evaluation_cache is not None:
+            evaluation_cache.reset_stats()
+        return evaluation_cache
+
+    def report_evaluation_cache(self, results):
+        """
+        Prints the evaluation cache hit rate of the iteration, summed over the statistics returned by its tasks
+        """
+        stats = [result.get() for result in results if result.successful() and result.get() is not None]
+        if not stats:
+            return
+        lookups = sum(s["lookups"] for s in stats)
+        hits = sum(s["hits"] for s in stats)
+        iteration_stats = {"hit_rate": hits / lookups if lookups > 0 else 0.0, "lookups": lookups, "hits": hits}
+        print(f"Evaluation cache stats for this iteration: {iteration_stats}")
+
+    def create_shared_evaluation_cache(self):
+        """
+        Creates the shared memory evaluation cache used by every process of the next pool,
+        returns None if share_evaluation_cache is disabled in config.yaml
+        """
+        if not (self.config["use_evaluation_cache"] and self.config["share_evaluation_cache"]):
+            return None
+
+        action_size = GoGame(self.config['board_size']).getActionSize()
+        shared_cache = SharedEvaluationCache(action_size, self.config["evaluation_cache_entries"])
+        self.shared_cache_name = shared_cache.name
+        return shared_cache
+
+    def close_shared_evaluation_cache(self, shared_cache):
+        if shared_cache is not None:
+            shared_cache.close()
+            self.shared_cache_name = None
+
+    def get_pool(self):
+        """
+        Returns the pool of game processes, created on first use. The processes outlive the tasks, so a network is
+        created once per process and only its weights are swapped when a checkpoint changes (see load_networks)
+        """
+        if self.pool is None:
+            self.pool = mp.Pool(self.config["num_parallel_games"])
+        return self.pool
+
+    def close_pool(self):
+        """
+        Closes the pool of game processes and waits for them to exit, once the worker stops
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def load_networks(self, go_game, filenames):
+        """
+        PER THREAD FUNCTION
+        Returns a network for every checkpoint CHECKPOINT_PATH/filename of the task: a client of the inference server of
+        the pool serving the checkpoint if there is one, otherwise a network of this process. The networks of the
+        process are keyed by the content of their checkpoint, so checkpoints with the same weights share one network
+        and unchanged checkpoints are not read again. Networks of checkpoints the task does not use are dropped, their
+        weights are hot-swapped in place for the new checkpoints of the task, so a process holds the networks of the
+        current phase only (one in self play, two in the arena).
+        """
+        versions = {filename: self.checkpoint_file_version(filename) for filename in filenames
+                    if filename not in self.inference_server_args}
+        unused = [neural_net for version, neural_net in _process_networks.items() if version not in versions.values()]
+        networks = {}
+        for filename, version in versions.items():
+            if version in networks:
+                continue
+            neural_net = _process_networks.get(version)
+            if neural_net is None:
+                neural_net = unused.pop() if unused else NNetWrapper(game=go_game, config=self.config)
+                neural_net.load_checkpoint(CHECKPOINT_PATH, filename)
+            networks[version] = neural_net
+        _process_networks.clear()
+        _process_networks.update(networks)
+
+        return [InferenceClient(*self.inference_server_args[filename]) if filename in self.inference_server_args
+                else networks[versions[filename]] for filename in filenames]
+
+    @staticmethod
+    def checkpoint_file_version(filename):
+        """
+        PER THREAD FUNCTION
+        Returns the version of CHECKPOINT_PATH/filename (see checkpoint_version), only hashed again once it changed
+        """
+        filepath = os.path.join(CHECKPOINT_PATH, filename)
+        stat = os.stat(filepath)
+        file_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        cached = _checkpoint_versions.get(filepath)
+        if cached is None or cached[0] != file_key:
+            cached = (file_key, checkpoint_version(filepath))
+            _checkpoint_versions[filepath] = cached
+        return cached[1]
+
+    @staticmethod
+    def release_network(neural_net):
+        """
+        PER THREAD FUNCTION
+        Ends the use of a network returned by load_networks once its task is done. A client is disconnected: the
+        inference server flushes a batch once every connected client waits, a stale connection would delay every batch
+        to inference_server_wait_ms. The networks of the process are kept for the next task.
+        """
+        if isinstance(neural_net, InferenceClient):
+            neural_net.close()
+
+    def create_inference_servers(self, filenames):
+        """
+        Starts one inference server per checkpoint in CHECKPOINT_PATH for the processes of the next pool,
+        returns an empty list if use_inference_server is disabled in config.yaml
+        """
+        if not self.config["use_inference_server"]:
+            return []
+
+        inference_servers = [InferenceServer(self.config, CHECKPOINT_PATH, filename) for filename in filenames]
+        self.inference_server_args = {filename: server.client_args()
+                                      for filename, server in zip(filenames, inference_servers)}
+        return inference_servers
+
+    def close_inference_servers(self, inference_servers):
+        for server in inference_servers:
+            server.close()
+        self.inference_server_args = {}